@@ -2,9 +2,12 @@ import time
 import pigpio
 import math
 
+from telemetry import ANGLE
+
 class AngleSensor:
-    def __init__(self,io):
+    def __init__(self,io, recorder=None):
         self.io = io
+        self.recorder = recorder  # optional telemetry.Recorder, records every reading
         self.io.set_mode(27,pigpio.OUTPUT)
         self.io.set_mode(4,pigpio.OUTPUT)
 
@@ -58,7 +61,9 @@ class AngleSensor:
         phi_rad = math.atan2(scaled_0,scaled_1)
         
         phi_degrees = 180/math.pi * phi_rad
-        
+
+        if self.recorder is not None:
+            self.recorder.record(ANGLE, phi_degrees)
         return phi_degrees
 
 
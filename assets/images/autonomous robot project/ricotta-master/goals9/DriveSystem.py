@@ -3,6 +3,8 @@ import sys
 import time
 import traceback
 
+from telemetry import DRIVE
+
 
 class Motor:
     """
@@ -74,9 +76,10 @@ class Motor:
 
 
 class DriveSystem:
-    def __init__(self, io):
+    def __init__(self, io, recorder=None):
         """
-        Initialize the DriveSystem with two Motor instances.
+        Initialize the DriveSystem with two Motor instances. recorder
+        (telemetry.Recorder), if given, records every command.
         """
         left_pins = (8, 7)
         right_pins = (6, 5)
@@ -97,6 +100,8 @@ class DriveSystem:
                       "turn_l" : (0.60, 0.93), 
                       "hook_l" : (0, 0.77),
                       "spin_l" : (-0.83, 0.83)}
+        self.mode_numbers = {mode: n for n, mode in enumerate(self.modes)}
+        self.recorder = recorder
 
     def stop(self):
         """
@@ -104,6 +109,8 @@ class DriveSystem:
         """
         self.motor_left.stop()
         self.motor_right.stop()
+        if self.recorder is not None:
+            self.recorder.record(DRIVE, 0.0, 0.0, -1)
 
     def drive(self, mode, reverse=False):
         """
@@ -116,6 +123,8 @@ class DriveSystem:
                 right_level = -right_level
             self.motor_left.setLevel(left_level)
             self.motor_right.setLevel(right_level)
+            if self.recorder is not None:
+                self.recorder.record(DRIVE, left_level, right_level, self.mode_numbers[mode])
         else:
             print("This is not a valid drive mode")   
     
@@ -126,6 +135,8 @@ class DriveSystem:
         """
         self.motor_left.setLevel(PWM_L)
         self.motor_right.setLevel(PWM_R)
+        if self.recorder is not None:
+            self.recorder.record(DRIVE, PWM_L, PWM_R, -1)
 
 
 
@@ -1,6 +1,10 @@
+import copy
 import os
 import time
+import heapq
+import itertools
 import pickle
+import threading
 from enum import Enum
 import matplotlib.pyplot as plt
 import traceback
@@ -24,6 +28,12 @@ class Intersection:
         self.cost = float('inf')
         self.direction = None
 
+    # intersections pickled before blocked flags existed
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'blocked' not in state:
+            self.blocked = [False for _ in range(8)]
+
     def set_blocked(self, heading, value: bool):
         self.blocked[heading] = value
 
@@ -31,12 +41,19 @@ class Intersection:
         return self.blocked[heading]
 
         
-# load map from file if it exists, otherwise create a new map
+# load map from file if it exists, otherwise create a new map. A map file
+# (see mapfile.py, old pickled maps are migrated) comes back as a GridMap,
+# a tile directory as its TiledMap (see tiledmap.py). Neither is unpickled
+# as is, so loading a file from anywhere can't run code.
 def prompt_and_load_map():
-    filename = input("Enter filename to load (e.g. mymap.pickle): ").strip()
+    filename = input("Enter filename to load (e.g. mymap.map): ").strip()
     try:
-        with open(filename, 'rb') as file:
-            map = pickle.load(file)
+        if os.path.isdir(filename):
+            from tiledmap import TiledMap
+            map = TiledMap.open(filename)
+        else:
+            from mapfile import load_map
+            map = load_map(filename)
         print(f"Map loaded from {filename}.")
         return map
     except FileNotFoundError:
@@ -78,6 +95,12 @@ class Map:
         STATUS.DEADEND: 'red',
         STATUS.CONNECTED: 'green'
     }
+    # how much each new timing moves the running traversal estimate
+    TRAVERSAL_SMOOTHING = 0.3
+    # seconds a blockage lasts before the street is tried again, most are
+    # people or things that move on
+    BLOCKAGE_TTL = 120.0
+
     def __init__(self):
         self.x = 0
         self.y = 0
@@ -88,34 +111,446 @@ class Map:
         self.direction = None
         self.goal = None
 
+        # incremental planner state (see set_incremental)
+        self.incremental = False
+        self._changed_edges = set()
+        self._rhs = None
+
+        # turn-aware planning (see set_turn_costs), None = plan by distance
+        self.turn_costs = None
+
+        # learned street traversal times (see record_traversal). street_time
+        # is the guess in seconds for a unit street nobody has timed yet.
+        self.street_times = {}
+        self.street_time = 2.0
+        self.time_weighted = False
+
+        # blockage expiry (see expire_blockages): when each blocked street
+        # end was blocked and for how many seconds, {(x, y, heading):
+        # (since, ttl)}, and a min-heap of (expires, x, y, heading) entries.
+        # blockage_ttl is how long a new blockage lasts, inf = for good.
+        self.blockages = {}
+        self._expiry = []
+        self.blockage_ttl = self.BLOCKAGE_TTL
+
+        # street evidence (see set_beliefs), None = readings write the
+        # status straight away
+        self.beliefs = None
+
+        # frontier index: intersections that still have an UNKNOWN or
+        # UNEXPLORED street that isn't blocked, plus how many street ends
+        # currently hold each status. Kept up to date by every write.
+        self.frontier = set()
+        self.status_counts = {status: 0 for status in STATUS}
+
+        # connectivity index (see reachable): union-find parent/size over
+        # intersections, None when it has to be rebuilt
+        self._parent = None
+        self._size = None
+
+        # all-pairs route table (see precompute_routes), None = not built or
+        # out of date
+        self._routes = None
+
+        # mutation version, bumped by every change that can move a route,
+        # and an XOR hash of the blocked street ends. The cost/direction
+        # field and the route cache (see route) remember the
+        # (goal, version, blocked hash) they were worked out for.
+        self.version = 0
+        self._blocked_hash = 0
+        self._field_key = None
+        self._route_cache = None
+        # the goal was set by route_to, so only the route itself is filled
+        # in and replanning it should stay point to point
+        self._point_goal = False
+
+        # k shortest routes to the goal as fallbacks for a blockage (see
+        # plan_alternatives): (start, goal, routes) or None, and the
+        # background thread working them out
+        self._alternatives = None
+        self._alternatives_thread = None
+
+        # event journal (see snapshot): every change to the map's contents
+        # in order. journal_base is the sequence number of
+        # journal[0]; _replaying turns recording off while events are being
+        # undone or replayed.
+        self.journal = []
+        self.journal_base = 0
+        self._replaying = False
+
+    # the route table can be huge and is cheap to rebuild, don't save it
+    # (nor the alternatives, which come with a thread, nor the journal,
+    # though the file remembers how far along it the map was)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_routes'] = None
+        state['_alternatives'] = None
+        state['_alternatives_thread'] = None
+        state['journal'] = []
+        state['journal_base'] = self.seq
+        return state
+
+    # maps pickled by older code are missing the newer attributes
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state)
+        self._parent = None
+        self._size = None
+        self.rebuild_frontier()
+
 
     def pose(self):
         return (self.x, self.y, self.heading)
 
+    # every pose change goes through here, so the journal sees it
+    def _move(self, x, y, heading):
+        if (x, y, heading) == (self.x, self.y, self.heading):
+            return
+        if not self._replaying:
+            self.journal.append(("pose", (self.x, self.y, self.heading), (x, y, heading)))
+        self.x, self.y, self.heading = x, y, heading
+
     def calcmove(self):
         dx, dy = self.heading_to_delta[self.heading]
-        self.x += dx
-        self.y += dy
+        self._move(self.x + dx, self.y + dy, self.heading)
 
     
     def calcuturn(self):
-        self.heading = (self.heading + 4) % 8
+        self._move(self.x, self.y, (self.heading + 4) % 8)
         
 
     def getintersection(self, x, y):
         if (x, y) not in self.intersections:
             self.intersections[(x, y)] = Intersection(x, y)
+            self._intersection_added(x, y)
         return self.intersections[(x, y)]
+
+    def _remove_intersection(self, x, y):
+        del self.intersections[(x, y)]
     
     def has_intersection(self, x, y):
         return (x, y) in self.intersections
 
+    def street_status(self, x, y, heading):
+        """STATUS of the street leaving (x, y) by heading (KeyError if there's no such intersection)."""
+        return self.intersections[(x, y)].streets[heading]
+
+    def copy(self):
+        """A copy of the map's contents, without the journal or planner caches."""
+        return copy.deepcopy(self)  # through __getstate__
+
+    # All street status and blocked flag writes go through these two helpers,
+    # so anything that caches planner results can tell the map changed.
+    def _write_street(self, inter, heading, status):
+        old = inter.streets[heading]
+        if old == status:
+            return
+        if not self._replaying:
+            self.journal.append(("street", inter.x, inter.y, heading, old, status))
+        was_open = self._end_open(inter, heading)
+        inter.streets[heading] = status
+        self.status_counts[old] -= 1
+        self.status_counts[status] += 1
+        self._connectivity_changed(inter, heading, was_open)
+        self._street_changed(inter.x, inter.y, heading)
+
+    def _write_blocked(self, inter, heading, value, ttl=None):
+        key = (inter.x, inter.y, heading)
+        old, old_stamp = inter.blocked[heading], self.blockages.get(key)
+        if value:
+            # blocking again restarts the clock
+            self._stamp_blockage(inter.x, inter.y, heading, ttl)
+        else:
+            self.blockages.pop(key, None)
+        if not self._replaying and (old != value or old_stamp != self.blockages.get(key)):
+            self.journal.append(("blocked", inter.x, inter.y, heading, old, value,
+                                 old_stamp, self.blockages.get(key)))
+        if old == value:
+            return
+        was_open = self._end_open(inter, heading)
+        inter.set_blocked(heading, value)
+        self._blocked_hash ^= hash((inter.x, inter.y, heading))
+        self._connectivity_changed(inter, heading, was_open)
+        self._street_changed(inter.x, inter.y, heading)
+
+    # Event journal. Every change to the map's contents (a street status, a
+    # blocked flag and its timestamp, a new intersection, the robot's pose,
+    # a learned street time, the time settings, belief evidence and the
+    # belief layer itself) is appended to self.journal as it happens, so a
+    # snapshot is just a position in the journal: taking one costs nothing
+    # and copies nothing. Rolling back undoes events newest first through
+    # the same writers that made them, so the frontier, connectivity and
+    # planner caches follow along; replay() applies events forward, e.g.
+    # onto a copy, and undo() takes replayed events back off it. Turn costs
+    # come from the robot's Behaviors, not the map, and aren't journaled.
+    #
+    #   ("add", x, y)
+    #   ("street", x, y, heading, old status, new status)
+    #   ("blocked", x, y, heading, old flag, new flag, old stamp, new stamp)
+    #   ("pose", (x, y, heading) before, (x, y, heading) after)
+    #   ("time", x, y, heading, old seconds, new seconds)   street key, None = never timed
+    #   ("settings", old, new)          (time_weighted, street_time, blockage_ttl)
+    #   ("evidence", x, y, heading, old, new)   street key, (line, no_line, driven) or None
+    #   ("beliefs", old, new)           (confidence, prior), None = no belief layer
+    @property
+    def seq(self):
+        """Sequence number of the next event, i.e. how many events so far."""
+        return self.journal_base + len(self.journal)
+
+    def snapshot(self):
+        """A marker for the map as it is now, to roll back to later."""
+        return self.seq
+
+    def events_since(self, seq):
+        """The events recorded since snapshot seq, oldest first."""
+        if seq < self.journal_base:
+            raise ValueError(f"events before {self.journal_base} have been trimmed")
+        return self.journal[seq - self.journal_base:]
+
+    def trim_journal(self, seq):
+        """Forget the events before seq; snapshots older than that are lost."""
+        seq = min(seq, self.seq)
+        if seq > self.journal_base:
+            del self.journal[:seq - self.journal_base]
+            self.journal_base = seq
+
+    def rollback(self, seq):
+        """Undo every event since snapshot seq."""
+        self.undo(self.events_since(seq))
+        del self.journal[seq - self.journal_base:]
+
+    def replay(self, events):
+        """Apply journal events (from this or another map) in order."""
+        self._replaying = True
+        try:
+            for event in events:
+                self._apply(event, undo=False)
+        finally:
+            self._replaying = False
+
+    def undo(self, events):
+        """Undo journal events applied in order (see replay), newest first."""
+        self._replaying = True
+        try:
+            for event in reversed(events):
+                self._apply(event, undo=True)
+        finally:
+            self._replaying = False
+
+    def _apply(self, event, undo):
+        kind = event[0]
+        if kind == "pose":
+            self._move(*(event[1] if undo else event[2]))
+        elif kind == "street":
+            _, x, y, heading, old, new = event
+            self._write_street(self.getintersection(x, y), heading, old if undo else new)
+        elif kind == "blocked":
+            _, x, y, heading, old, new, old_stamp, new_stamp = event
+            value, stamp = (old, old_stamp) if undo else (new, new_stamp)
+            inter = self.getintersection(x, y)
+            self._write_blocked(inter, heading, value)
+            # put back the recorded timestamp rather than a fresh one
+            self.blockages.pop((x, y, heading), None)
+            if stamp is not None:
+                self.blockages[(x, y, heading)] = stamp
+                if stamp[1] != float('inf'):
+                    heapq.heappush(self._expiry, (stamp[0] + stamp[1], x, y, heading))
+        elif kind == "time":
+            _, x, y, heading, old, new = event
+            self._write_time((x, y, heading), old if undo else new)
+        elif kind == "settings":
+            self._write_settings(*(event[1] if undo else event[2]))
+        elif kind == "evidence":
+            _, x, y, heading, old, new = event
+            self._write_evidence((x, y, heading), old if undo else new)
+        elif kind == "beliefs":
+            self._write_beliefs(event[1] if undo else event[2])
+        elif kind == "add":
+            _, x, y = event
+            if not undo:
+                self.getintersection(x, y)
+            elif (x, y) in self.intersections:
+                # its streets were all undone already, so it's 8 UNKNOWNs
+                self._remove_intersection(x, y)
+                self.status_counts[STATUS.UNKNOWN] -= 8
+                self.frontier.discard((x, y))
+                self.version += 1
+                self._routes = None
+                self._parent = None
+                self._size = None
+                self._rhs = None  # the incremental planner can't repair a removal
+
+    # Blockage expiry. Every blocked street end remembers when it was blocked
+    # and for how long, with its expiry time on a min-heap. Nothing runs on
+    # a timer: the planner queries call _expire_due() first, which only
+    # looks at the top of the heap, and an expired end is unblocked through
+    # _write_blocked like any other change, so only the planner state that
+    # depended on that street is thrown away. Heap entries for ends that
+    # were unblocked or blocked again since are just skipped.
+    def _stamp_blockage(self, x, y, heading, ttl):
+        if ttl is None:
+            ttl = self.blockage_ttl
+        since = time.time()
+        self.blockages[(x, y, heading)] = (since, ttl)
+        if ttl != float('inf'):
+            heapq.heappush(self._expiry, (since + ttl, x, y, heading))
+
+    def _expire_due(self):
+        if self._expiry and self._expiry[0][0] <= time.time():
+            self.expire_blockages()
+
+    def expire_blockages(self, now=None):
+        """Unblock every street end whose blockage has run out, return how many."""
+        if now is None:
+            now = time.time()
+        expired = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            until, x, y, heading = heapq.heappop(self._expiry)
+            stamp = self.blockages.get((x, y, heading))
+            if stamp is None or stamp[0] + stamp[1] != until:
+                continue  # unblocked or blocked again since
+            inter = self.intersections.get((x, y))
+            if inter is not None:
+                self._write_blocked(inter, heading, False)
+            else:
+                del self.blockages[(x, y, heading)]
+            expired += 1
+        return expired
+
+    def _street_changed(self, x, y, heading):
+        self.version += 1
+        self._routes = None
+        if self.incremental:
+            self._changed_edges.add((x, y, heading))
+        self._refresh_frontier(self.intersections[(x, y)])
+
+    def _intersection_added(self, x, y):
+        if not self._replaying:
+            self.journal.append(("add", x, y))
+        # a brand new intersection has 8 UNKNOWN streets
+        self.status_counts[STATUS.UNKNOWN] += 8
+        self.frontier.add((x, y))
+        self.version += 1
+        self._routes = None
+        if self._parent is not None:
+            # neighbors may already have streets open toward it
+            for heading in range(8):
+                dx, dy = self.heading_to_delta[heading]
+                neighbor = self.intersections.get((x + dx, y + dy))
+                if neighbor is not None and self._end_open(neighbor, (heading + 4) % 8):
+                    self._union((x, y), (x + dx, y + dy))
+        if self.incremental:
+            # it can also make existing streets into it usable
+            for heading in range(8):
+                self._changed_edges.add((x, y, heading))
+
+    # Connectivity index. Two intersections are in the same component when a
+    # chain of streets joins them where each street is CONNECTED and
+    # unblocked at one end or the other. dijkstra needs the street open at
+    # the end it drives into, so different components can never reach each
+    # other, and reachable() can say "no route" without searching. Opening
+    # a street is a cheap union; closing one can split a component, which
+    # union-find can't undo, so that just drops the index until next query.
+    def _end_open(self, inter, heading):
+        return inter.streets[heading] == STATUS.CONNECTED and not inter.blocked[heading]
+
+    def _connectivity_changed(self, inter, heading, was_open):
+        if self._parent is None:
+            return
+        is_open = self._end_open(inter, heading)
+        if is_open == was_open:
+            return
+        dx, dy = self.heading_to_delta[heading]
+        neighbor = self.intersections.get((inter.x + dx, inter.y + dy))
+        if neighbor is None:
+            return  # _intersection_added picks it up later
+        if is_open:
+            self._union((inter.x, inter.y), (neighbor.x, neighbor.y))
+        elif not self._end_open(neighbor, (heading + 4) % 8):
+            self._parent = None
+            self._size = None
+
+    def _find(self, key):
+        parent = self._parent
+        root = key
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while key != root:  # path compression
+            parent[key], key = root, parent[key]
+        return root
+
+    def _union(self, a, b):
+        a, b = self._find(a), self._find(b)
+        if a == b:
+            return
+        size = self._size
+        if size.get(a, 1) < size.get(b, 1):
+            a, b = b, a
+        self._parent[b] = a
+        size[a] = size.get(a, 1) + size.pop(b, 1)
+
+    def rebuild_components(self):
+        """Recompute the connectivity index from scratch."""
+        self._parent = {}
+        self._size = {}
+        for inter in self.intersections.values():
+            for heading in range(4):  # each street once, from its lower end
+                dx, dy = self.heading_to_delta[heading]
+                neighbor = self.intersections.get((inter.x + dx, inter.y + dy))
+                if neighbor is None:
+                    continue
+                if self._end_open(inter, heading) or self._end_open(neighbor, heading + 4):
+                    self._union((inter.x, inter.y), (neighbor.x, neighbor.y))
+
+    def reachable(self, x1, y1, x2, y2):
+        """
+        Quick check whether the robot could drive from (x1, y1) to (x2, y2).
+        False means no route exists over known open streets. True means the
+        two are connected, though a street that is only open at one end can
+        still leave dijkstra without a route.
+        """
+        self._expire_due()
+        if (x1, y1) not in self.intersections or (x2, y2) not in self.intersections:
+            return False
+        if self._parent is None:
+            self.rebuild_components()
+        return self._find((x1, y1)) == self._find((x2, y2))
+
+    def _refresh_frontier(self, inter):
+        for heading in range(8):
+            if inter.streets[heading] in (STATUS.UNKNOWN, STATUS.UNEXPLORED) and not inter.blocked[heading]:
+                self.frontier.add((inter.x, inter.y))
+                return
+        self.frontier.discard((inter.x, inter.y))
+
+    def rebuild_frontier(self):
+        """Recompute the frontier index from scratch (e.g. after loading)."""
+        self.frontier = set()
+        self.status_counts = {status: 0 for status in STATUS}
+        for inter in self.intersections.values():
+            for status in inter.streets:
+                self.status_counts[status] += 1
+            self._refresh_frontier(inter)
+
+    def frontier_headings(self, x, y):
+        """Headings at (x, y) that are still UNKNOWN/UNEXPLORED and unblocked."""
+        inter = self.intersections[(x, y)]
+        return [h for h in range(8)
+                if inter.streets[h] in (STATUS.UNKNOWN, STATUS.UNEXPLORED) and not inter.blocked[h]]
+
+    def overwrite_street(self, x, y, heading, status):
+        """
+        Write the status of one end of a street, with none of setstreet's
+        precedence rules and without touching the neighbor.
+        """
+        self._write_street(self.getintersection(x, y), heading, status)
+
     def setstreet(self, x, y, heading, status):
         # Set status for current intersection
         inter = self.getintersection(x, y)
         # Never overwrite a DEADEND or CONNECTED status
         if inter.streets[heading] not in (STATUS.DEADEND, STATUS.CONNECTED):
-            inter.streets[heading] = status
+            self._write_street(inter, heading, status)
 
         # Also update the reverse direction of the neighbor
         dx, dy = self.heading_to_delta[heading]
@@ -124,8 +559,73 @@ class Map:
             neighbor = self.intersections[(nx, ny)]
             # Never overwrite a DEADEND or CONNECTED status
             if neighbor.streets[(heading + 4) % 8] not in (STATUS.DEADEND, STATUS.CONNECTED):
-                neighbor.streets[(heading + 4) % 8] = status
+                self._write_street(neighbor, (heading + 4) % 8, status)
+
+
+    def observe_street(self, x, y, heading, seen):
+        """
+        One sensor reading of the street at (x, y) heading, seen = a line
+        was there. Without beliefs this is setstreet with UNEXPLORED or
+        NONEXISTENT. With beliefs the reading is added to the street's
+        evidence and both ends get the status the evidence supports, so a
+        single bad reading can be outvoted later. DEADEND and CONNECTED
+        are never overwritten either way.
+        """
+        if self.beliefs is None:
+            self.setstreet(x, y, heading, STATUS.UNEXPLORED if seen else STATUS.NONEXISTENT)
+            return
+        key = self._street_key(x, y, heading)
+        self._write_evidence(key, self.beliefs.observed(key, seen))
+        status = self.beliefs.status(key)
+        if status is None:
+            return
+        dx, dy = self.heading_to_delta[heading]
+        ends = [(self.getintersection(x, y), heading)]
+        if (x + dx, y + dy) in self.intersections:
+            ends.append((self.intersections[(x + dx, y + dy)], (heading + 4) % 8))
+        for inter, h in ends:
+            if inter.streets[h] not in (STATUS.DEADEND, STATUS.CONNECTED):
+                self._write_street(inter, h, status)
+
+    def set_beliefs(self, enabled=True, confidence=0.65):
+        """
+        Turn the belief layer (beliefs.py) on or off. confidence is how sure
+        the evidence has to be before a street is taken to not exist.
+        """
+        if self.beliefs is not None:
+            # drop the evidence one street at a time, so undo brings it back
+            for key in list(self.beliefs.evidence):
+                self._write_evidence(key, None)
+        self._write_beliefs((confidence, 1.0) if enabled else None)
+
+    # the belief layer and its evidence change through these two, so the
+    # journal sees it
+    def _write_evidence(self, key, state):
+        old = self.beliefs.state(key)
+        if old == state:
+            return
+        if not self._replaying:
+            self.journal.append(("evidence", *key, old, state))
+        self.beliefs.set_state(key, state)
+
+    def _write_beliefs(self, settings):
+        old = None if self.beliefs is None else self.beliefs.settings()
+        if old == settings:
+            return
+        if not self._replaying:
+            self.journal.append(("beliefs", old, settings))
+        if settings is None:
+            self.beliefs = None
+        else:
+            from beliefs import Beliefs
+            self.beliefs = Beliefs(*settings)
 
+    def street_belief(self, x, y, heading):
+        """(chance the street exists, confidence), or None without beliefs."""
+        if self.beliefs is None:
+            return None
+        key = self._street_key(x, y, heading)
+        return self.beliefs.probability(key), self.beliefs.confidence(key)
 
     def markturn(self, turn_amount, actual_angle=None):
         current = self.getintersection(self.x, self.y)
@@ -174,15 +674,15 @@ class Map:
                 print(f"Correcting heading from {self.heading} to {best_heading} based on angle sensor (measured={actual_angle:.1f}°, chosen={degrees}°)")
                 # If we're turning onto an UNKNOWN street, mark it as UNEXPLORED
                 if (current.streets[best_heading] == STATUS.NONEXISTENT) or (current.streets[best_heading] == STATUS.UNKNOWN): 
-                    current.streets[best_heading] = STATUS.UNEXPLORED
-                self.heading = best_heading
+                    self._write_street(current, best_heading, STATUS.UNEXPLORED)
+                self._move(self.x, self.y, best_heading)
                     
                     
         else:
             # If no correction needed and we're on an UNKNOWN street, mark it as UNEXPLORED
             if current.streets[new_heading] == STATUS.UNKNOWN:
-                current.streets[new_heading] = STATUS.UNEXPLORED
-            self.heading = new_heading
+                self._write_street(current, new_heading, STATUS.UNEXPLORED)
+            self._move(self.x, self.y, new_heading)
 
             
 
@@ -200,9 +700,15 @@ class Map:
                 if skipped_heading != prev_heading and skipped_heading != self.heading:  # Don't include the heading we started from or ended at
                     skipped.append(skipped_heading)
 
-        for d in skipped:
-            if current.streets[d] in (STATUS.UNKNOWN, STATUS.UNEXPLORED):
-                current.streets[d] = STATUS.NONEXISTENT
+        if self.beliefs is not None:
+            # stopped on a line at the new heading, swept past the others
+            self.observe_street(self.x, self.y, self.heading, True)
+            for d in skipped:
+                self.observe_street(self.x, self.y, d, False)
+        else:
+            for d in skipped:
+                if current.streets[d] in (STATUS.UNKNOWN, STATUS.UNEXPLORED):
+                    self._write_street(current, d, STATUS.NONEXISTENT)
 
         for delta in [-1, 1]:
             diag = (self.heading + delta) % 8
@@ -219,7 +725,17 @@ class Map:
                 possible_angles.append(angle)
         return possible_angles
 
-    def update_connection(self):
+    def update_connection(self, elapsed=None):
+        """
+        Record that the robot drove the street ahead to the next
+        intersection. elapsed is how long follow_line took, if it was timed.
+        """
+        if elapsed is not None:
+            self.record_traversal(self.x, self.y, self.heading, elapsed)
+        if self.beliefs is not None:
+            key = self._street_key(self.x, self.y, self.heading)
+            self._write_evidence(key, self.beliefs.driven(key))
+
         dx, dy = self.heading_to_delta[self.heading]
         next_x = self.x + dx
         next_y = self.y + dy
@@ -228,24 +744,23 @@ class Map:
         # Mark the forward direction as CONNECTED (from current to next)
         current = self.getintersection(self.x, self.y)
         if current.streets[heading] != STATUS.DEADEND:
-            current.streets[heading] = STATUS.CONNECTED
+            self._write_street(current, heading, STATUS.CONNECTED)
             
         # Mark the reverse direction as CONNECTED (from next back to current)
         reverse_heading = (heading + 4) % 8
         next_inter = self.getintersection(next_x, next_y)
         if next_inter.streets[reverse_heading] != STATUS.DEADEND:
-            next_inter.streets[reverse_heading] = STATUS.CONNECTED
+            self._write_street(next_inter, reverse_heading, STATUS.CONNECTED)
 
         # Update robot's position
-        self.x = next_x
-        self.y = next_y
+        self._move(next_x, next_y, self.heading)
 
     def markdeadend(self):
         print("Reached end of the street.")
         current_intersection = self.getintersection(self.x, self.y)
         # Only mark as DEADEND if it wasn't already marked as NONEXISTENT
         if current_intersection.streets[self.heading] != STATUS.NONEXISTENT:
-            current_intersection.streets[self.heading] = STATUS.DEADEND
+            self._write_street(current_intersection, self.heading, STATUS.DEADEND)
 
         # Store the original position and heading before U-turn
         original_x, original_y = self.x, self.y
@@ -265,91 +780,419 @@ class Map:
 
         plt.pause(0.001)
 
+    # what show() draws: the (xmin, xmax, ymin, ymax) window and the
+    # intersections to draw in it. Storage backends that can't hand over
+    # the whole map cheaply draw just the part around the robot.
+    def _view(self):
+        return (-5, 5, -5, 5), self.intersections.items()
+
     def show(self):
+        (xmin, xmax, ymin, ymax), shown = self._view()
         plt.clf()
         plt.axes()
-        plt.gca().set_xlim(-5, 5)
-        plt.gca().set_ylim(-5, 5)
+        plt.gca().set_xlim(xmin, xmax)
+        plt.gca().set_ylim(ymin, ymax)
         plt.gca().set_aspect('equal')
 
-        for x in range(-4, 5):
-            for y in range(-4, 5):
+        for x in range(xmin + 1, xmax):
+            for y in range(ymin + 1, ymax):
                 plt.plot(x, y, color='lightgray', marker='o', markersize=8)
 
-        for (ix, iy), intersection in self.intersections.items():
+        for (ix, iy), intersection in shown:
             for idx in range(8):
                 dx, dy = self.heading_vectors[idx]
                 status = intersection.streets[idx]
                 color = self.color_map[status]
                 linewidth = 2
-                if hasattr(intersection, 'blocked') and intersection.blocked[idx]:
+                if intersection.blocked[idx]:
                     color = 'purple'
                     linewidth = 4
                 plt.plot([ix, ix + dx], [iy, iy + dy], color=color, linewidth=linewidth)
         
         # draw optimal path to goal if it exists
-        if self.goal is not None and (self.x, self.y) in self.intersections:
+        if self.goal is not None:
             cx, cy = self.x, self.y
-            current = self.intersections[(cx, cy)]
-            visited = set()
-
-            while current.direction is not None and (cx, cy) != self.goal:
-                visited.add((cx, cy))
-                heading = current.direction
-                dx, dy = self.heading_vectors[heading]
+            for heading in self.route():
+                dx, dy = self.heading_to_delta[heading]
                 nx, ny = cx + dx, cy + dy
 
                 # Draw the segment in a distinct color 
                 plt.plot([cx, nx], [cy, ny], color='orange', linewidth=3.5)
 
                 # Move to next
-                cx, cy = int(round(nx)), int(round(ny))
-                if (cx, cy) in visited or (cx, cy) not in self.intersections:
-                    break  # stop if we're looping or hit a node that doesn't exist
-                current = self.intersections[(cx, cy)]
-                
+                cx, cy = nx, ny
 
         plt.pause(0.001)
 
     def dijkstra(self, xgoal, ygoal):
+        self._point_goal = False
+        self._expire_due()
         # First check if the goal intersection exists
         if (xgoal, ygoal) not in self.intersections:
             print(f"Error: Goal intersection ({xgoal}, {ygoal}) does not exist in the map.")
             self.goal = None
+            self._rhs = None
+            self._field_key = None
             return
 
-        # Reset all previous cost/direction info
-        for inter in self.intersections.values():
-            inter.cost = float('inf')  # infinity
-            inter.direction = None
+        # Turn-aware mode always runs its own (full) search
+        if self.turn_costs is not None:
+            self.goal = (xgoal, ygoal)
+            self._rhs = None
+            self._search_with_turns(xgoal, ygoal)
+            self._field_key = (self.goal, self.version, self._blocked_hash)
+            return
+
+        # In incremental mode, replanning to the same goal only repairs the
+        # part of the field affected by the streets changed since last time
+        if self.incremental and self._rhs is not None and self.goal == (xgoal, ygoal):
+            self.repair()
+            self._field_key = (self.goal, self.version, self._blocked_hash)
+            return
+
+        self.goal = (xgoal, ygoal)
+        if self._routes is not None and (xgoal, ygoal) in self._routes:
+            # precomputed, just copy the goal's column into the field
+            self._set_field(self._routes.keys, *self._routes.column((xgoal, ygoal)))
+        else:
+            self._search_from_goal(xgoal, ygoal)
+
+        if self.incremental:
+            self._changed_edges.clear()
+            self._rhs = {}
+            for key, inter in self.intersections.items():
+                if inter.cost < float('inf'):
+                    self._rhs[key] = (inter.cost, inter.direction)
+        self._field_key = (self.goal, self.version, self._blocked_hash)
+
+    def route(self):
+        """
+        Headings to drive from the robot's position to the goal, [] when at
+        the goal or there is no route. The route is cached under
+        (goal, version, blocked hash), so while the map doesn't change it is
+        worked out once, and as the robot drives along it each call just
+        returns what's left of it. Replans with dijkstra only if the
+        cost/direction field is out of date.
+        """
+        if self.goal is None or (self.x, self.y) not in self.intersections:
+            return []
+        self._expire_due()
+        key = (self.goal, self.version, self._blocked_hash)
+        cache = self._route_cache
+        if cache is not None and cache[0] == key and (self.x, self.y) in cache[1]:
+            return cache[2][cache[1][(self.x, self.y)]:]
+
+        if self._point_goal and self.turn_costs is None:
+            return self.route_to(*self.goal)
+
+        # turn-aware fields depend on the heading the robot starts with, so
+        # off the cached route those always need a fresh search
+        if self._field_key != key or self.turn_costs is not None:
+            self.dijkstra(*self.goal)
+            if self.goal is None:
+                return []
+            key = self._field_key
+
+        # walk the direction pointers, remembering where along the route
+        # each intersection is
+        positions = {}
+        headings = []
+        cx, cy = self.x, self.y
+        while (cx, cy) != self.goal:
+            direction = self.intersections[(cx, cy)].direction
+            if direction is None or (cx, cy) in positions:
+                positions, headings = {}, []  # no route (or a broken field)
+                cx, cy = self.x, self.y
+                break
+            positions[(cx, cy)] = len(headings)
+            headings.append(direction)
+            dx, dy = self.heading_to_delta[direction]
+            cx, cy = cx + dx, cy + dy
+            if (cx, cy) not in self.intersections:
+                positions, headings = {}, []
+                cx, cy = self.x, self.y
+                break
+        positions[(cx, cy)] = len(headings)
+        self._route_cache = (key, positions, headings)
+        return headings[:]
+
+    def route_to(self, xgoal, ygoal):
+        """
+        Make (xgoal, ygoal) the goal and return the headings to drive there
+        from the robot, [] if there's no route (the cost is then
+        get_cost(x, y) as usual). Unlike dijkstra this doesn't
+        flood the whole map: it searches from both ends at once and stops
+        where the two searches meet, then fills in cost/direction only
+        along the route (the rest of the field is left as it was and not
+        trusted). With turn costs it falls back to dijkstra, and in
+        incremental mode it uses dijkstra too, so the whole field is kept
+        and every replan to the same goal after a change is a repair.
+        """
+        if (self.turn_costs is not None or self.incremental
+                or (xgoal, ygoal) not in self.intersections):
+            self.dijkstra(xgoal, ygoal)
+            return self.route()
+        self.goal = (xgoal, ygoal)
+        self._rhs = None
+        self._field_key = None
+        self._point_goal = True
+        self._expire_due()
+
+        found = self._search_between((self.x, self.y), self.goal)
+        nodes, headings = found[1:] if found is not None else ([(self.x, self.y)], [])
+        if found is None:
+            # the robot's cost/direction are from the old field
+            here = self.intersections.get((self.x, self.y))
+            if here is not None:
+                here.cost = float('inf')
+                here.direction = None
+        else:
+            cost = found[0]
+            for key, heading in zip(nodes, headings + [None]):
+                inter = self.intersections[key]
+                inter.cost = cost
+                inter.direction = heading
+                if heading is not None:
+                    cost -= self._step_cost(key[0], key[1], heading)
+        positions = {key: n for n, key in enumerate(nodes)}
+        self._route_cache = ((self.goal, self.version, self._blocked_hash), positions, headings)
+        return headings[:]
+
+    # Bidirectional search: one search forward from start (like reach_costs)
+    # and one backward from goal (like _search_from_goal), taking turns with
+    # whichever has the cheaper next entry. Every street seen joining the
+    # two is a candidate route, and once the two next entries together cost
+    # at least the best candidate nothing cheaper can turn up.
+    def _search_between(self, start, goal):
+        """(cost, nodes, headings) of a cheapest start -> goal route, or None."""
+        if start not in self.intersections:
+            return None
+        if start == goal:
+            return 0, [start], []
+        costs = ({start: 0}, {goal: 0})
+        via = ({}, {})   # forward: key -> (previous, heading); backward: key -> (next, heading)
+        order = itertools.count()
+        onDeck = ([(0, next(order), start)], [(0, next(order), goal)])
+        best, meet = float('inf'), None
+
+        while onDeck[0] and onDeck[1]:
+            if onDeck[0][0][0] + onDeck[1][0][0] >= best:
+                break
+            side = 0 if onDeck[0][0][0] <= onDeck[1][0][0] else 1
+            cost, _, key = heapq.heappop(onDeck[side])
+            if cost > costs[side][key]:
+                continue  # stale entry
+            x, y = key
+            current = self.intersections[key]
+            for heading in range(8):
+                dx, dy = self.heading_to_delta[heading]
+                nkey = (x + dx, y + dy)
+                neighbor = self.intersections.get(nkey)
+                if neighbor is None:
+                    continue
+                reverse = (heading + 4) % 8
+                if side == 0:
+                    # driving key -> nkey needs the end we drive into open
+                    if neighbor.streets[reverse] != STATUS.CONNECTED or neighbor.blocked[reverse]:
+                        continue
+                    step_cost = self._step_cost(x, y, heading)
+                    link = (key, heading)
+                else:
+                    # driving nkey -> key needs this end open
+                    if current.streets[heading] != STATUS.CONNECTED or current.blocked[heading]:
+                        continue
+                    step_cost = self._step_cost(nkey[0], nkey[1], reverse)
+                    link = (key, reverse)
+                if cost + step_cost < costs[side].get(nkey, float('inf')):
+                    costs[side][nkey] = cost + step_cost
+                    via[side][nkey] = link
+                    heapq.heappush(onDeck[side], (cost + step_cost, next(order), nkey))
+                    other = costs[1 - side].get(nkey)
+                    if other is not None and cost + step_cost + other < best:
+                        best, meet = cost + step_cost + other, nkey
+        if meet is None:
+            return None
+
+        # forward pointers back to start, backward pointers on to goal
+        nodes, headings = [meet], []
+        while nodes[0] != start:
+            previous, heading = via[0][nodes[0]]
+            nodes.insert(0, previous)
+            headings.insert(0, heading)
+        key = meet
+        while key != goal:
+            key, heading = via[1][key]
+            headings.append(heading)
+            nodes.append(key)
+        return best, nodes, headings
+
+    def merge(self, other, offset=None, anchor=None, directory=None):
+        """
+        A new map combining this map with other, e.g. from an earlier run
+        (see mapmerge.py for how conflicting streets are settled). Line
+        other up by shifting it offset = (dx, dy), or by anchor =
+        ((x, y) here, (x, y) in other), the same intersection in both.
+        Merging into a tiled map needs a new tile directory for the result.
+        Returns (map, conflicts), conflicts being how many street ends the
+        two maps disagreed on.
+        """
+        if anchor is not None:
+            (ax, ay), (bx, by) = anchor
+            if (ax, ay) not in self.intersections or (bx, by) not in other.intersections:
+                raise ValueError(f"anchor {anchor} is not an intersection in both maps")
+            offset = (ax - bx, ay - by)
+        from mapmerge import merge_maps
+        return merge_maps(self, other, offset or (0, 0), directory)
+
+    # Alternative routes. When a street on the route turns out to be blocked
+    # the robot needs another route right away, so the k shortest loop-free
+    # routes to the goal (see alternatives.py) are worked out ahead of time
+    # on a background thread, from a snapshot of the streets. On a blockage
+    # alternative_route() just checks each one is still open from where the
+    # robot stands, no search needed on the control thread.
+    def plan_alternatives(self, k=4, restart=False):
+        """
+        Start working out k alternative routes from the robot to the goal in
+        the background, unless that's already done or under way for this
+        goal (restart=True plans again from the robot's position).
+        """
+        if self.goal is None or (self.x, self.y) not in self.intersections:
+            return
+        thread = self._alternatives_thread
+        if thread is not None and thread.is_alive():
+            return
+        if not restart and self._alternatives is not None and self._alternatives[1] == self.goal:
+            return
+        from alternatives import k_shortest_routes
+
+        start, goal = (self.x, self.y), self.goal
+        edges = self._snapshot_edges()
 
-        self.goal = (xgoal, ygoal)  
+        def work():
+            self._alternatives = (start, goal, k_shortest_routes(edges, start, goal, k))
+
+        self._alternatives_thread = threading.Thread(target=work, name="alternatives", daemon=True)
+        self._alternatives_thread.start()
+
+    # the streets the alternatives search may use, see alternatives.py
+    def _snapshot_edges(self):
+        from alternatives import snapshot_edges
+        return snapshot_edges(self)
+
+    def _route_open(self, nodes, headings):
+        for (x, y), heading in zip(nodes, headings):
+            inter = self.intersections.get((x, y))
+            dx, dy = self.heading_to_delta[heading]
+            neighbor = self.intersections.get((x + dx, y + dy))
+            if inter is None or neighbor is None or inter.blocked[heading]:
+                return False
+            reverse = (heading + 4) % 8
+            if neighbor.streets[reverse] != STATUS.CONNECTED or neighbor.blocked[reverse]:
+                return False
+        return True
+
+    def alternative_route(self):
+        """
+        The cheapest of the precomputed alternatives that passes through the
+        robot's position and is still open from there to the goal, as a
+        list of headings (and made the cached route), or [] if none is.
+        """
+        if self._alternatives is None or self._alternatives[1] != self.goal:
+            return []
+        self._expire_due()
+        here = (self.x, self.y)
+        best = None
+        for cost, nodes, headings, costs in self._alternatives[2]:
+            if here not in nodes:
+                continue
+            i = nodes.index(here)
+            if best is not None and cost - costs[i] >= best[0]:
+                continue
+            if self._route_open(nodes[i:-1], headings[i:]):
+                best = (cost - costs[i], nodes[i:], headings[i:])
+        if best is None:
+            return []
+
+        # drive it as the cached route until the map changes again, and
+        # line up fresh alternatives from here in the meantime
+        _, nodes, headings = best
+        positions = {key: n for n, key in enumerate(nodes)}
+        self._route_cache = ((self.goal, self.version, self._blocked_hash), positions, headings)
+        self.plan_alternatives(restart=True)
+        return headings[:]
+
+    # All-pairs precompute. A map that is loaded and then only driven never
+    # changes, so every goal's field can be computed up front and dijkstra
+    # becomes a copy out of the table. Any street, blockage or intersection
+    # change (or a change of edge weights) throws the table away.
+    def precompute_routes(self, processes=1, max_intersections=1000):
+        """
+        Build the route table (see routetable.py), splitting the goals over
+        processes worker processes. Returns False, leaving the map as it was,
+        if NumPy isn't available or the map is too big for an N x N table.
+        """
+        if len(self.intersections) > max_intersections:
+            print(f"Map has {len(self.intersections)} intersections, too many to precompute routes.")
+            return False
+        try:
+            from routetable import RouteTable
+        except ImportError:
+            print("NumPy is not available, routes will be planned on demand.")
+            return False
+
+        goal = self.goal
+        routes = RouteTable.build(self, processes)
+        # building ran a search per goal over our own field, put it back
+        self.cleargoal()
+        self._routes = routes
+        if goal is not None:
+            self.dijkstra(*goal)
+        return True
+
+    def _field_for(self, keys):
+        costs = []
+        directions = []
+        for key in keys:
+            inter = self.intersections[key]
+            costs.append(inter.cost)
+            directions.append(-1 if inter.direction is None else inter.direction)
+        return costs, directions
+
+    def _set_field(self, keys, costs, directions):
+        for key, cost, direction in zip(keys, costs.tolist(), directions.tolist()):
+            inter = self.intersections[key]
+            inter.cost = cost
+            inter.direction = None if direction < 0 else direction
+
+    # the full search behind dijkstra, storage backends can swap this out
+    def _search_from_goal(self, xgoal, ygoal):
+        # Reset all previous cost/direction info
+        self._reset_field()
 
         # initialize goal node
         goal = self.getintersection(xgoal, ygoal)
         goal.cost = 0
         goal.direction = None
 
-        # initialize the onDeck queue with just the goal
-        onDeck = [goal]
-
-        # Helper func to insert in sorted order
-        def sortedInsert(queue, inter):
-            for i in range(len(queue)):
-                if queue[i].cost > inter.cost:
-                    queue.insert(i, inter)
-                    return
-            queue.append(inter)
+        # onDeck is a binary heap of (cost, order, intersection) entries.
+        # Rather than pulling a neighbor out of the queue when we find it a
+        # cheaper path, we push it again and skip the old entry when it gets
+        # popped (lazy deletion). The order counter keeps equal-cost entries
+        # in the order they were queued, same as the old sorted list did.
+        order = itertools.count()
+        onDeck = [(0, next(order), goal)]
 
         while onDeck:
-            current = onDeck.pop(0)  # pop lowest-cost leaf
+            cost, _, current = heapq.heappop(onDeck)  # pop lowest-cost leaf
+            if cost > current.cost:
+                continue  # stale entry, this intersection was already settled
             x, y = current.x, current.y
 
             for heading in range(8):
                 # Only consider connected streets that are not blocked
                 if current.streets[heading] != STATUS.CONNECTED:
                     continue
-                if hasattr(current, 'blocked') and current.blocked[heading]:
+                if current.blocked[heading]:
                     continue  # Skip blocked streets
 
                 dx, dy = self.heading_to_delta[heading]
@@ -360,7 +1203,9 @@ class Map:
 
                 # we change the cost based off the heading, which tells us 
                 # if we are moving straight or diagonally
-                if heading % 2 == 0:  
+                if self.time_weighted:
+                    step_cost = self.street_seconds(x, y, heading)
+                elif heading % 2 == 0:  
                     step_cost = 1
                 else:  
                     step_cost = 2**0.5
@@ -369,26 +1214,265 @@ class Map:
 
                 # found a better path to neighbor
                 if potential_cost < neighbor.cost:
-                    # remove neighbor from onDeck if it's already in there
-                    if neighbor.cost < float('inf'):
-                        try:
-                            onDeck.remove(neighbor)
-                        except ValueError:
-                            pass  
-
                     # save cost/direction
                     neighbor.cost = potential_cost
                     neighbor.direction = (heading + 4) % 8  # point back toward current
 
-                    # re-insert into onDeck in sorted order
-                    sortedInsert(onDeck, neighbor)
+                    # queue it (any older entry for it becomes stale)
+                    heapq.heappush(onDeck, (potential_cost, next(order), neighbor))
+
+    # Learned traversal times. Every timed drive down a street nudges a
+    # running (exponentially smoothed) estimate of how many seconds that
+    # street takes, so long or wobbly streets end up costing what they
+    # really cost. Streets are undirected, so both ends share one entry.
+    def _street_key(self, x, y, heading):
+        if heading < 4:
+            return (x, y, heading)
+        dx, dy = self.heading_to_delta[heading]
+        return (x + dx, y + dy, heading - 4)
+
+    def record_traversal(self, x, y, heading, seconds):
+        """Fold one timed drive from (x, y) along heading into the estimate."""
+        key = self._street_key(x, y, heading)
+        old = self.street_times.get(key)
+        if old is not None:
+            seconds = old + self.TRAVERSAL_SMOOTHING * (seconds - old)
+        self._write_time(key, seconds)
+
+    # learned times and the settings that go with them change through these
+    # two, so the journal sees them
+    def _write_time(self, key, seconds):
+        old = self.street_times.get(key)
+        if old == seconds:
+            return
+        if not self._replaying:
+            self.journal.append(("time", *key, old, seconds))
+        if seconds is None:
+            del self.street_times[key]
+        else:
+            self.street_times[key] = seconds
+        if self.time_weighted:
+            # the street as seen from whichever end exists
+            x, y, heading = key
+            if (x, y) not in self.intersections:
+                dx, dy = self.heading_to_delta[heading]
+                x, y, heading = x + dx, y + dy, heading + 4
+            if (x, y) in self.intersections:
+                self._street_changed(x, y, heading)
+
+    def _write_settings(self, time_weighted, street_time, blockage_ttl):
+        old = (self.time_weighted, self.street_time, self.blockage_ttl)
+        new = (time_weighted, street_time, blockage_ttl)
+        if old == new:
+            return
+        if not self._replaying:
+            self.journal.append(("settings", old, new))
+        self.time_weighted, self.street_time, self.blockage_ttl = new
+        self._changed_edges = set()
+        self._rhs = None
+        self._routes = None
+        self.version += 1
+
+    def street_seconds(self, x, y, heading):
+        """Expected seconds to drive the street, or a guess if never timed."""
+        seconds = self.street_times.get(self._street_key(x, y, heading))
+        if seconds is None:
+            seconds = self.street_time * (1 if heading % 2 == 0 else 2**0.5)
+        return seconds
+
+    def _step_cost(self, x, y, heading):
+        if self.time_weighted:
+            return self.street_seconds(x, y, heading)
+        return 1 if heading % 2 == 0 else 2**0.5
+
+    def set_time_weighting(self, enabled=True):
+        """Weight planner edges by learned seconds instead of distance."""
+        self._write_settings(enabled, self.street_time, self.blockage_ttl)
+
+    # Turn-aware planning. Every 45 degree turn at an intersection costs the
+    # robot real seconds, so instead of searching over intersections we search
+    # over (x, y, heading) states: "standing at (x, y) facing heading". Leaving
+    # by heading d costs the turn from the current heading to d plus the time
+    # to drive the street, and the robot arrives at the next intersection
+    # facing d. The search runs backward from the goal, where every heading
+    # costs 0.
+    def set_turn_costs(self, behaviors, street_time=None):
+        """
+        Plan by expected driving time instead of distance. Turning k * 45
+        degrees costs behaviors.predict_turn_time(k * 45) plus the 0.1 s pause
+        step_toward_goal makes after each turn step. Streets cost their
+        learned traversal time (see street_seconds); street_time, if given,
+        replaces the guess used for streets that were never timed.
+        """
+        self.turn_costs = [0.0] + [behaviors.predict_turn_time(45 * k) + 0.1 * k for k in range(1, 5)]
+        if street_time is not None:
+            self._write_settings(self.time_weighted, street_time, self.blockage_ttl)
+        self._rhs = None
+        self.version += 1
+
+    def clear_turn_costs(self):
+        """Go back to planning by distance."""
+        self.turn_costs = None
+        self._rhs = None
+        self.version += 1
+
+    def _search_with_turns(self, xgoal, ygoal):
+        inf = float('inf')
+        # best[(x, y, h)] = (seconds to the goal, heading to leave by)
+        best = {}
+        order = itertools.count()
+        onDeck = []
+        for heading in range(8):
+            best[(xgoal, ygoal, heading)] = (0, None)
+            heapq.heappush(onDeck, (0, next(order), (xgoal, ygoal, heading)))
+
+        while onDeck:
+            cost, _, state = heapq.heappop(onDeck)
+            if cost > best[state][0]:
+                continue  # stale entry
+            x, y, arrival = state
+            # a robot facing 'arrival' here could have driven in from behind
+            dx, dy = self.heading_to_delta[arrival]
+            px, py = x - dx, y - dy
+            if (px, py) not in self.intersections:
+                continue
+            inter = self.intersections[(x, y)]
+            back = (arrival + 4) % 8
+            # same street check as dijkstra: the end we drive into
+            if inter.streets[back] != STATUS.CONNECTED or inter.blocked[back]:
+                continue
+            drive_time = self.street_seconds(px, py, arrival)
+            for facing in range(8):
+                turn = (arrival - facing) % 8
+                turn = min(turn, 8 - turn)
+                potential_cost = cost + drive_time + self.turn_costs[turn]
+                if potential_cost < best.get((px, py, facing), (inf,))[0]:
+                    best[(px, py, facing)] = (potential_cost, arrival)
+                    heapq.heappush(onDeck, (potential_cost, next(order), (px, py, facing)))
+
+        # Fill the usual cost/direction field with the best heading at each
+        # intersection, whatever way the robot happens to be facing...
+        for inter in self.intersections.values():
+            inter.cost = inf
+            inter.direction = None
+        for (x, y, facing), (cost, heading) in best.items():
+            inter = self.intersections[(x, y)]
+            if cost < inter.cost:
+                inter.cost = cost
+                inter.direction = heading
+
+        # ...then follow the plan from the robot's actual pose, since the
+        # next turn depends on the heading it arrives with
+        x, y, facing = self.x, self.y, self.heading
+        visited = set()
+        while (x, y, facing) in best and (x, y) != (xgoal, ygoal) and (x, y) not in visited:
+            visited.add((x, y))
+            cost, heading = best[(x, y, facing)]
+            inter = self.intersections[(x, y)]
+            inter.cost = cost
+            inter.direction = heading
+            dx, dy = self.heading_to_delta[heading]
+            x, y, facing = x + dx, y + dy, heading
+
+    # Incremental replanning (LPA* with no heuristic, since we keep the whole
+    # cost field rather than a single start). _rhs holds, per intersection,
+    # the one-step lookahead (cost, direction) computed from its neighbors'
+    # current costs. An intersection whose cost differs from its rhs is
+    # inconsistent and gets queued; repair() settles just those, so a single
+    # blocked street only touches the intersections that routed through it.
+    def set_incremental(self, enabled=True):
+        self.incremental = enabled
+        self._changed_edges = set()
+        self._rhs = None
+
+    def _lookahead(self, inter):
+        # best (cost, direction) for inter given its neighbors' costs, using
+        # the same streets dijkstra would use to reach inter from a neighbor
+        best, best_heading = float('inf'), None
+        for heading in range(8):
+            dx, dy = self.heading_to_delta[heading]
+            neighbor = self.intersections.get((inter.x + dx, inter.y + dy))
+            if neighbor is None or neighbor.cost == float('inf'):
+                continue
+            reverse = (heading + 4) % 8
+            if neighbor.streets[reverse] != STATUS.CONNECTED or neighbor.blocked[reverse]:
+                continue
+            step_cost = self._step_cost(inter.x, inter.y, heading)
+            if neighbor.cost + step_cost < best:
+                best, best_heading = neighbor.cost + step_cost, heading
+        return best, best_heading
+
+    def repair(self):
+        """Bring the cost/direction field up to date after street changes."""
+        inf = float('inf')
+        rhs = self._rhs
+        order = itertools.count()
+        onDeck = []
+
+        def update(key):
+            inter = self.intersections.get(key)
+            if inter is None:
+                return
+            if key == self.goal:
+                value = (0, None)
+            else:
+                value = self._lookahead(inter)
+            if value[0] < inf:
+                rhs[key] = value
+            else:
+                rhs.pop(key, None)
+            if value[0] == inter.cost:
+                inter.direction = value[1]  # same cost, maybe a different street
+            else:
+                heapq.heappush(onDeck, (min(inter.cost, value[0]), next(order), key))
+
+        def update_dependents(inter):
+            # intersections that may route through inter
+            for heading in range(8):
+                if inter.streets[heading] != STATUS.CONNECTED or inter.blocked[heading]:
+                    continue
+                dx, dy = self.heading_to_delta[heading]
+                update((inter.x + dx, inter.y + dy))
+
+        for x, y, heading in self._changed_edges:
+            dx, dy = self.heading_to_delta[heading]
+            update((x, y))
+            update((x + dx, y + dy))
+        self._changed_edges.clear()
+
+        while onDeck:
+            key_cost, _, key = heapq.heappop(onDeck)
+            inter = self.intersections[key]
+            cost, direction = rhs.get(key, (inf, None))
+            if cost == inter.cost or key_cost != min(inter.cost, cost):
+                continue  # stale entry
+            if cost < inter.cost:
+                # found a cheaper route, settle it
+                inter.cost = cost
+                inter.direction = direction
+                update_dependents(inter)
+            else:
+                # the old route got worse, forget it and rebuild from neighbors
+                inter.cost = inf
+                inter.direction = None
+                update(key)
+                update_dependents(inter)
 
     # clear the goal and reset all intersections to unknown
     # this is called when the goal is reached or when the user wants to clear the goal
     def cleargoal(self):
         self.goal = None
+        self._rhs = None
+        self._field_key = None
+        self._route_cache = None
+        self._point_goal = False
+        self._alternatives = None
+        self._reset_field()
+
+    # forget the whole cost/direction field
+    def _reset_field(self):
         for inter in self.intersections.values():
-            inter.cost = float('inf')
+            inter.cost = float('inf')  # infinity
             inter.direction = None
 
 
@@ -397,22 +1481,23 @@ class Map:
     
 
     def set_pose(self, x, y, heading):
-        self.x = x
-        self.y = y
-        self.heading = heading
+        self._move(x, y, heading)
 
     def set_position(self, x, y):
-        self.x = x
-        self.y = y
+        self._move(x, y, self.heading)
 
     def set_heading(self, heading):
-        self.heading = heading
+        self._move(self.x, self.y, heading)
 
-    def set_blocked(self, x, y, heading, value: bool):
+    def set_blocked(self, x, y, heading, value: bool, ttl=None):
+        """
+        Block (or unblock) the street at both ends. A blockage lasts ttl
+        seconds, blockage_ttl if not given (inf = until cleared).
+        """
         inter = self.getintersection(x, y)
         # Never mark a DEADEND or NONEXISTENT street as blocked
         if inter.streets[heading] not in (STATUS.DEADEND, STATUS.NONEXISTENT):
-            inter.set_blocked(heading, value)
+            self._write_blocked(inter, heading, value, ttl)
             # Also block the reverse direction at the neighbor intersection
             dx, dy = self.heading_to_delta[heading]
             nx, ny = x + dx, y + dy
@@ -421,9 +1506,10 @@ class Map:
                 reverse_heading = (heading + 4) % 8
                 # Never mark a DEADEND or NONEXISTENT street as blocked
                 if neighbor.streets[reverse_heading] not in (STATUS.DEADEND, STATUS.NONEXISTENT):
-                    neighbor.set_blocked(reverse_heading, value)
+                    self._write_blocked(neighbor, reverse_heading, value, ttl)
 
     def is_blocked(self, x, y, heading) -> bool:
+        self._expire_due()
         inter = self.getintersection(x, y)
         return inter.is_blocked(heading)
 
@@ -431,7 +1517,9 @@ class Map:
         """Clear all blockages from all intersections in the map."""
         for intersection in self.intersections.values():
             for heading in range(8):
-                intersection.set_blocked(heading, False)
+                self._write_blocked(intersection, heading, False)
+        self.blockages = {}
+        self._expiry = []
         print("All blockages have been cleared from the map.")
 
     def get_cost(self, x, y):
@@ -445,6 +1533,93 @@ class Map:
         else:
             return float('inf')
 
+    def nearest_frontier(self, x, y):
+        """
+        Find the frontier intersection that is cheapest to drive to from
+        (x, y). All frontier intersections seed one search that runs back
+        toward the robot over CONNECTED, unblocked streets (the same streets
+        dijkstra uses) and stops as soon as it reaches (x, y).
+        Returns (goal, cost, route), where route is the list of headings to
+        drive from (x, y), or None if no frontier can be reached.
+        """
+        self._expire_due()
+        if (x, y) not in self.intersections or not self.frontier:
+            return None
+        costs = {}
+        via = {}  # key -> heading to drive from key toward its frontier
+        order = itertools.count()
+        onDeck = []
+        for key in sorted(self.frontier):
+            costs[key] = 0
+            heapq.heappush(onDeck, (0, next(order), key))
+
+        while onDeck:
+            cost, _, key = heapq.heappop(onDeck)
+            if cost > costs[key]:
+                continue  # stale entry
+            if key == (x, y):
+                break
+            current = self.intersections[key]
+            for heading in range(8):
+                if current.streets[heading] != STATUS.CONNECTED or current.blocked[heading]:
+                    continue
+                dx, dy = self.heading_to_delta[heading]
+                nkey = (key[0] + dx, key[1] + dy)
+                if nkey not in self.intersections:
+                    continue
+                step_cost = self._step_cost(key[0], key[1], heading)
+                if cost + step_cost < costs.get(nkey, float('inf')):
+                    costs[nkey] = cost + step_cost
+                    via[nkey] = (heading + 4) % 8  # point back toward current
+                    heapq.heappush(onDeck, (cost + step_cost, next(order), nkey))
+        else:
+            return None  # ran out of streets before reaching the robot
+
+        # walk the pointers from the robot out to the frontier it came from
+        route = []
+        key = (x, y)
+        while key in via:
+            heading = via[key]
+            route.append(heading)
+            dx, dy = self.heading_to_delta[heading]
+            key = (key[0] + dx, key[1] + dy)
+        return key, costs[(x, y)], route
+
+    def reach_costs(self, x, y):
+        """
+        Run one forward search from intersection (x, y) and return a dict
+        {(tx, ty): cost} for every intersection reachable from it. The cost
+        to each one is the same dijkstra(tx, ty) would give at (x, y), but
+        it takes a single search for all of them and leaves the goal
+        cost/direction field alone.
+        """
+        if (x, y) not in self.intersections:
+            return {}
+        self._expire_due()
+        costs = {(x, y): 0}
+        order = itertools.count()
+        onDeck = [(0, next(order), x, y)]
+
+        while onDeck:
+            cost, _, cx, cy = heapq.heappop(onDeck)
+            if cost > costs[(cx, cy)]:
+                continue  # stale entry
+            for heading in range(8):
+                dx, dy = self.heading_to_delta[heading]
+                nx, ny = cx + dx, cy + dy
+                neighbor = self.intersections.get((nx, ny))
+                if neighbor is None:
+                    continue
+                # dijkstra checks the street at the end we drive into
+                reverse = (heading + 4) % 8
+                if neighbor.streets[reverse] != STATUS.CONNECTED or neighbor.blocked[reverse]:
+                    continue
+                step_cost = self._step_cost(cx, cy, heading)
+                if cost + step_cost < costs.get((nx, ny), float('inf')):
+                    costs[(nx, ny)] = cost + step_cost
+                    heapq.heappush(onDeck, (cost + step_cost, next(order), nx, ny))
+        return costs
+
 
 
 
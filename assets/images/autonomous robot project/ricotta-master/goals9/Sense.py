@@ -1,5 +1,7 @@
 import pigpio
 
+from telemetry import LINE
+
 
 class IR:
     """
@@ -31,12 +33,13 @@ class LineSensor:
     It reads left, middle, and right IR sensors and returns a 3-value tuple.
     """
     
-    def __init__(self, io):
+    def __init__(self, io, recorder=None):
         """
         Initialize LineSensor with three IR sensors.
 
         Parameters:
         - io (pigpio.pi): pigpio interface object
+        - recorder (telemetry.Recorder): optional, records every reading
         - pin_left (int): GPIO pin for the left IR sensor
         - pin_middle (int): GPIO pin for the middle IR sensor
         - pin_right (int): GPIO pin for the right IR sensor
@@ -48,6 +51,7 @@ class LineSensor:
         self.left = IR(io, pin_left)
         self.middle = IR(io, pin_middle)
         self.right  = IR(io, pin_right)
+        self.recorder = recorder
 
     def read(self):
         """
@@ -56,4 +60,6 @@ class LineSensor:
         L = self.left.read()
         M = self.middle.read()
         R = self.right.read()
+        if self.recorder is not None:
+            self.recorder.record(LINE, L, M, R)
         return (L, M, R)
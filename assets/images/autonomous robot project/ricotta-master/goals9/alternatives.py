@@ -0,0 +1,120 @@
+#
+#   alternatives.py
+#
+#   k shortest loop-free routes between two intersections (Yen's
+#   algorithm), for Map.plan_alternatives. Take the shortest route, then
+#   for every intersection along it ("spur" node) look for the best detour
+#   that leaves the route there, keeping the part before it (the root) and
+#   banning the streets earlier routes with the same root left by. The
+#   cheapest detour found becomes the next route.
+#
+#   Everything runs on a snapshot of the open streets taken with
+#   snapshot_edges(), so the search can run on a background thread while
+#   the control thread goes on changing the map:
+#
+#       edges   {(x, y): [(heading, (nx, ny), cost), ...]}
+#
+#   A route comes back as (cost, nodes, headings, costs): nodes[i] is the
+#   i-th intersection along it, headings[i] the heading to leave nodes[i]
+#   by, and costs[i] the cost of the route up to nodes[i].
+#
+import heapq
+import itertools
+
+from MapBuilding import STATUS
+
+INF = float('inf')
+
+
+# the streets dijkstra may use, with their current step costs. Driving from
+# (x, y) along heading needs the far end CONNECTED and unblocked.
+def snapshot_edges(map):
+    edges = {}
+    for (x, y), inter in map.intersections.items():
+        out = []
+        for heading in range(8):
+            dx, dy = map.heading_to_delta[heading]
+            neighbor = map.intersections.get((x + dx, y + dy))
+            if neighbor is None:
+                continue
+            reverse = (heading + 4) % 8
+            if neighbor.streets[reverse] != STATUS.CONNECTED or neighbor.blocked[reverse]:
+                continue
+            out.append((heading, (x + dx, y + dy), map._step_cost(x, y, heading)))
+        edges[(x, y)] = out
+    return edges
+
+
+# cheapest start -> goal path avoiding banned nodes and (node, heading)
+# streets, or None. Returns (cost, nodes, headings).
+def shortest_path(edges, start, goal, banned_nodes=(), banned_edges=()):
+    costs = {start: 0}
+    via = {}
+    order = itertools.count()
+    onDeck = [(0, next(order), start)]
+    while onDeck:
+        cost, _, key = heapq.heappop(onDeck)
+        if cost > costs[key]:
+            continue  # stale entry
+        if key == goal:
+            break
+        for heading, nkey, step_cost in edges.get(key, ()):
+            if nkey in banned_nodes or (key, heading) in banned_edges:
+                continue
+            if cost + step_cost < costs.get(nkey, INF):
+                costs[nkey] = cost + step_cost
+                via[nkey] = (key, heading)
+                heapq.heappush(onDeck, (cost + step_cost, next(order), nkey))
+    else:
+        return None
+
+    nodes = [goal]
+    headings = []
+    while nodes[-1] != start:
+        key, heading = via[nodes[-1]]
+        nodes.append(key)
+        headings.append(heading)
+    return costs[goal], nodes[::-1], headings[::-1]
+
+
+def _with_costs(edges, nodes, headings):
+    step = {(key, heading): cost for key in nodes for heading, _, cost in edges[key]}
+    costs = [0]
+    for key, heading in zip(nodes, headings):
+        costs.append(costs[-1] + step[(key, heading)])
+    return costs[-1], nodes, headings, costs
+
+
+def k_shortest_routes(edges, start, goal, k):
+    """Up to k loop-free routes from start to goal, cheapest first."""
+    first = shortest_path(edges, start, goal)
+    if first is None:
+        return []
+    routes = [_with_costs(edges, first[1], first[2])]
+    candidates = []   # heap of (cost, order, nodes, headings)
+    seen = {tuple(first[1])}
+    order = itertools.count()
+
+    while len(routes) < k:
+        _, nodes, headings, costs = routes[-1]
+        for i in range(len(nodes) - 1):
+            spur = nodes[i]
+            root = nodes[:i + 1]
+            # leave the spur node by a street no route with this root took
+            banned_edges = {(spur, route[2][i]) for route in routes
+                            if route[1][:i + 1] == root}
+            banned_nodes = set(root[:-1])  # stay loop-free
+            detour = shortest_path(edges, spur, goal, banned_nodes, banned_edges)
+            if detour is None:
+                continue
+            new_nodes = root + detour[1][1:]
+            if tuple(new_nodes) in seen:
+                continue
+            seen.add(tuple(new_nodes))
+            new_headings = headings[:i] + detour[2]
+            heapq.heappush(candidates, (costs[i] + detour[0], next(order), new_nodes, new_headings))
+        if not candidates:
+            break
+        _, _, new_nodes, new_headings = heapq.heappop(candidates)
+        routes.append(_with_costs(edges, new_nodes, new_headings))
+    return routes
@@ -0,0 +1,182 @@
+#
+#   autosave.py
+#
+#   Background autosave. The control loop calls track(map) once per pass,
+#   between driving steps, which hands the map's new journal events (see
+#   Map.snapshot) to the autosave thread: a list slice and a queue put,
+#   nothing that waits on the thread or the disk. The thread replays the
+#   events onto its own shadow copy of the map, so the shadow is always
+#   the map as it was at the end of some pass, and every interval seconds
+#   or every `every` events it writes the shadow out with save_map
+#   (temp file + os.replace, so a crash mid-write keeps the last file).
+#
+#   The journal covers everything save_map writes (streets, blockages,
+#   pose, learned times, time settings, belief evidence), so the shadow is
+#   always the whole map. A rollback (undo) is passed on too: track()
+#   keeps the events it has sent since the start of the map's journal,
+#   finds where the journal parts from them, and sends the ones rolled
+#   back for the thread to undo on the shadow.
+#
+#   Only a different map (load, merge), or a journal trimmed past where it
+#   parted from the shadow, needs a fresh copy, made with map.copy(): for
+#   the GridMap the control loop runs on that is a copy of its arrays and
+#   a few flat dicts, a few milliseconds even for a big map, with nothing
+#   per intersection.
+#
+#   With a log_path the thread also keeps a write-ahead log of the events
+#   and undos (see maplog.py), restarted at every snapshot, so a crash
+#   loses at most the last commit_interval seconds rather than everything
+#   since the last snapshot. A new shadow is snapshotted straight away,
+#   with the log marked unusable until it is, so the log always goes with
+#   the snapshot on disk.
+#
+#   Tiled maps aren't autosaved: they write their own tiles out as they
+#   go, and save flushes the rest.
+#
+import queue
+import threading
+import time
+
+from mapfile import save_map
+from maplog import MapLog
+from tiledmap import TiledMap
+
+
+class Autosaver:
+    def __init__(self, path, interval=30.0, every=200, log_path=None, commit_interval=0.05):
+        self.path = path
+        self.interval = interval    # seconds between saves while the map changes
+        self.every = every          # or after this many map events, whichever comes first
+        self.log = MapLog(log_path, commit_interval) if log_path else None
+        self.saves = 0
+        self.map = None             # map being tracked, and how far along its journal
+        self.seq = 0
+        self.sent = []              # events sent since seq sent_base, to notice a rollback
+        self.sent_base = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write out anything unsaved and end the thread."""
+        self._queue.put(("stop", None))
+        self._thread.join()
+
+    def save_as(self, map, path):
+        """Write map as it is now to path as well, in the background."""
+        if isinstance(map, TiledMap):
+            raise ValueError("a tiled map is saved into its tile directory with flush()")
+        # brings the shadow up to date first, or makes it if there's none
+        # yet (right after startup or a load)
+        self.track(map)
+        self._queue.put(("save", path))
+
+    def track(self, map):
+        """Pass the map's changes since last time to the autosave thread."""
+        if isinstance(map, TiledMap):
+            self.map = None
+            return
+        kept = self._kept(map) if map is self.map else None
+        if kept is None:
+            self.map = map
+            self.seq = self.sent_base = map.seq
+            self.sent = []
+            self._queue.put(("copy", map.copy()))
+            return
+        if kept < self.seq:
+            undone = self.sent[kept - self.sent_base:]
+            del self.sent[kept - self.sent_base:]
+            self.seq = kept
+            self._queue.put(("undo", undone))
+        if map.seq != self.seq:
+            events = map.events_since(self.seq)
+            self.sent.extend(events)
+            self.seq = map.seq
+            self._queue.put(("events", events))
+        # what's trimmed from the journal can't be rolled back any more
+        trimmed = min(map.journal_base, self.seq) - self.sent_base
+        if trimmed > 0:
+            del self.sent[:trimmed]
+            self.sent_base += trimmed
+
+    # how far the map's journal still agrees with the events sent (up to
+    # where it was rolled back to, if it was), None if that's been trimmed
+    def _kept(self, map):
+        seq = min(self.seq, map.seq)
+        if seq < self.sent_base:
+            return None
+        while seq > self.sent_base:
+            if seq <= map.journal_base:
+                return None
+            if map.journal[seq - 1 - map.journal_base] is self.sent[seq - 1 - self.sent_base]:
+                break
+            seq -= 1
+        return seq
+
+    def _run(self):
+        shadow = None
+        unsaved = 0
+        last_save = time.time()
+        while True:
+            waits = []
+            if unsaved:
+                waits.append(max(0.0, last_save + self.interval - time.time()))
+            if self.log is not None and self.log.pending:
+                waits.append(self.log.commit_due())
+            try:
+                kind, payload = self._queue.get(timeout=min(waits) if waits else None)
+            except queue.Empty:
+                kind, payload = "tick", None
+
+            if kind == "copy":
+                shadow = payload
+                if self.log is not None:
+                    self.log.start(-1)  # the old log is for the old map
+                unsaved = 1
+                last_save = 0.0         # snapshot it now
+            elif kind == "undo":
+                shadow.undo(payload)
+                shadow.journal_base -= len(payload)
+                if self.log is not None and self.log.file is not None:
+                    self.log.append(payload, undo=True)
+                unsaved += len(payload)
+            elif kind == "events":
+                # replayed events aren't journaled again, just counted
+                shadow.replay(payload)
+                shadow.journal_base += len(payload)
+                if self.log is not None and self.log.file is not None:
+                    self.log.append(payload)
+                unsaved += len(payload)
+            elif kind == "save":
+                if shadow is None:
+                    print(f"Saving to {payload} failed: there's no map to save.")
+                else:
+                    self._write(shadow, payload)
+
+            if shadow is not None and unsaved and (
+                    kind == "stop" or unsaved >= self.every or time.time() - last_save >= self.interval):
+                crc = self._write(shadow, self.path)
+                if crc is not None and self.log is not None:
+                    self.log.start(shadow.seq, crc)
+                unsaved = 0
+                last_save = time.time()
+            # group commit: one fsync for everything logged since the last
+            if self.log is not None and self.log.pending and (kind == "stop" or self.log.commit_due() == 0.0):
+                self.log.sync()
+            if kind == "stop":
+                if self.log is not None:
+                    self.log.close()
+                return
+
+    # the file's CRC, None if it couldn't be written
+    def _write(self, shadow, path):
+        try:
+            crc = save_map(shadow, path)
+            self.saves += 1
+            return crc
+        except OSError as e:
+            print(f"Autosave to {path} failed: {e}")
+            return None
@@ -0,0 +1,88 @@
+#
+#   beliefs.py
+#
+#   Optional belief layer for Map (see Map.set_beliefs). Instead of every
+#   sensor reading writing a street's status outright, each street keeps
+#   counts of the evidence seen for it:
+#
+#       line        a reading found a line there (pull_forward, or a turn
+#                   that stopped on it)
+#       no_line     a reading found nothing (pull_forward, or a turn that
+#                   swept past it)
+#       driven      the robot drove it, which settles the question
+#
+#   The chance the street exists is the share of readings that saw a line,
+#   starting from an even prior, and the confidence is how far that is
+#   from a coin toss. A street that leans toward a line is UNEXPLORED
+#   (driving it settles it), one that confidently has no line is
+#   NONEXISTENT, and one that leans toward no line without enough evidence
+#   is left UNKNOWN so exploration comes back for another look.
+#
+#   A street's evidence is the tuple (line, no_line, driven). The map
+#   writes it (see Map._write_evidence) from what observed() and driven()
+#   say it becomes, so every change goes through the map's journal.
+#
+from MapBuilding import STATUS
+
+NO_EVIDENCE = (0, 0, 0)
+
+
+class Beliefs:
+    def __init__(self, confidence=0.65, prior=1.0):
+        self.confidence_needed = confidence
+        self.prior = prior      # pseudo-readings each way before any evidence
+        self.evidence = {}      # street key -> (line, no_line, driven)
+
+    def settings(self):
+        return (self.confidence_needed, self.prior)
+
+    def copy(self):
+        beliefs = Beliefs(*self.settings())
+        beliefs.evidence = dict(self.evidence)
+        return beliefs
+
+    def state(self, key):
+        """The street's evidence, None if there's none."""
+        return self.evidence.get(key)
+
+    def set_state(self, key, state):
+        if state is None:
+            self.evidence.pop(key, None)
+        else:
+            self.evidence[key] = state
+
+    def observed(self, key, seen):
+        """The street's evidence with one more reading added."""
+        line, no_line, driven = self.evidence.get(key, NO_EVIDENCE)
+        return (line + 1, no_line, driven) if seen else (line, no_line + 1, driven)
+
+    def driven(self, key):
+        """The street's evidence with one more drive down it added."""
+        line, no_line, driven = self.evidence.get(key, NO_EVIDENCE)
+        return (line, no_line, driven + 1)
+
+    def probability(self, key):
+        """Chance the street exists, from the evidence so far."""
+        evidence = self.evidence.get(key)
+        if evidence is None:
+            return 0.5
+        line, no_line, driven = evidence
+        if driven:
+            return 1.0
+        return (line + self.prior) / (line + no_line + 2 * self.prior)
+
+    def confidence(self, key):
+        p = self.probability(key)
+        return max(p, 1 - p)
+
+    def status(self, key):
+        """The status the evidence supports, None once the street is driven."""
+        evidence = self.evidence.get(key)
+        if evidence is not None and evidence[2]:
+            return None  # update_connection has it CONNECTED (or DEADEND)
+        p = self.probability(key)
+        if p >= 0.5:
+            return STATUS.UNEXPLORED
+        if 1 - p >= self.confidence_needed:
+            return STATUS.NONEXISTENT
+        return STATUS.UNKNOWN
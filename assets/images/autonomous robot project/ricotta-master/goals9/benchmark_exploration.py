@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+#
+#   benchmark_exploration.py
+#
+#   Explore random street layouts with the real autonomous_step, once
+#   driving off down the first unknown street it turns to (the old greedy
+#   behavior) and once sweeping every unknown street at an intersection
+#   before driving off, and compare how many streets the robot drove (and
+#   how many turns it made) before the map was fully explored.
+#
+#   The robot is simulated: SimulatedRobot stands in for Behaviors (line
+#   sensor, turning, line following, blockage check) on a known layout, so
+#   this runs headless and in well under a minute.
+#
+#   Run:   python3 benchmark_exploration.py [--size 6] [--maps 20]
+#
+import argparse
+import contextlib
+import io
+import random
+import time
+
+from MapBuilding import Map
+from navigation import autonomous_step
+
+
+# a width x height block of intersections joined by a random set of
+# north/south/east/west streets (always connected), plus dead-end stubs
+# poking out of the edge of the block
+def make_layout(width, height, extra=0.35, stubs=0.3, rng=random):
+    streets = set()
+
+    def add(x, y, heading):
+        dx, dy = Map.heading_to_delta[heading]
+        streets.add((x, y, heading))
+        streets.add((x + dx, y + dy, (heading + 4) % 8))
+
+    # random spanning tree first so everything is reachable
+    seen = {(0, 0)}
+    stack = [(0, 0)]
+    while stack:
+        x, y = stack[-1]
+        options = [h for h in (0, 2, 4, 6)
+                   if 0 <= x + Map.heading_to_delta[h][0] < width
+                   and 0 <= y + Map.heading_to_delta[h][1] < height
+                   and (x + Map.heading_to_delta[h][0], y + Map.heading_to_delta[h][1]) not in seen]
+        if not options:
+            stack.pop()
+            continue
+        heading = rng.choice(options)
+        add(x, y, heading)
+        dx, dy = Map.heading_to_delta[heading]
+        seen.add((x + dx, y + dy))
+        stack.append((x + dx, y + dy))
+
+    for x in range(width):
+        for y in range(height):
+            for heading in (0, 2, 4, 6):
+                dx, dy = Map.heading_to_delta[heading]
+                inside = 0 <= x + dx < width and 0 <= y + dy < height
+                if inside and rng.random() < extra:
+                    add(x, y, heading)
+                elif not inside and rng.random() < stubs:
+                    streets.add((x, y, heading))  # leads nowhere: a dead end
+    return streets
+
+
+# raised when the robot spins in place without ever driving off, so one
+# bad layout can't hang the whole benchmark
+class Stuck(Exception):
+    pass
+
+
+class SimulatedDrive:
+    def stop(self):
+        pass
+
+    def drive(self, action):
+        pass
+
+
+class SimulatedSensor:
+    def __init__(self, robot):
+        self.robot = robot
+
+    def read(self):
+        robot = self.robot
+        return (0, 1, 0) if (robot.x, robot.y, robot.heading) in robot.streets else (0, 0, 0)
+
+
+# just enough of Behaviors for the exploration and navigation code
+class SimulatedRobot:
+    def __init__(self, streets, x=0, y=0, heading=0):
+        self.streets = streets
+        self.intersections = {(sx, sy) for sx, sy, _ in streets}
+        self.x, self.y, self.heading = x, y, heading
+        self.at_deadend = False
+        self.streets_driven = 0
+        self.turns_made = 0
+        self.drive = SimulatedDrive()
+        self.sensor = SimulatedSensor(self)
+        self.last_traversal_time = None
+        self.turns = 0  # turns since last driving a street
+
+    def turning_behavior(self, choice):
+        self.turns += 1
+        self.turns_made += 1
+        if self.turns > 32:
+            raise Stuck(f"spinning at ({self.x}, {self.y})")
+        if self.at_deadend:
+            # spinning around at the end of a dead end finds the way back
+            self.heading = (self.heading + 4) % 8
+            return 4, 180.0
+        step = 1 if choice == "left" else -1
+        for k in range(1, 9):
+            if (self.x, self.y, (self.heading + step * k) % 8) in self.streets:
+                break
+        self.heading = (self.heading + step * k) % 8
+        return step * k, step * k * 45.0
+
+    def follow_line(self):
+        self.streets_driven += 1
+        self.turns = 0
+        if self.at_deadend:
+            self.at_deadend = False
+            return "intersection"  # back where the dead end started
+        dx, dy = Map.heading_to_delta[self.heading]
+        if (self.x + dx, self.y + dy) not in self.intersections:
+            self.at_deadend = True
+            return "end"
+        self.x += dx
+        self.y += dy
+        return "intersection"
+
+    def pull_forward(self):
+        return (self.x, self.y, self.heading) in self.streets
+
+    def check_blockage(self, heading):
+        return False
+
+
+class HeadlessMap(Map):
+    def show(self):
+        pass
+
+    def showwithrobot(self):
+        pass
+
+
+@contextlib.contextmanager
+def no_sleeping():
+    # the navigation code pauses between turns for the real robot's sake
+    sleep = time.sleep
+    time.sleep = lambda seconds: None
+    try:
+        yield
+    finally:
+        time.sleep = sleep
+
+
+def explore(streets, sweep, max_steps=2000):
+    """Explore the layout from (0, 0), return (streets driven, turns, done)."""
+    start_heading = min(h for sx, sy, h in streets if (sx, sy) == (0, 0))
+    robot = SimulatedRobot(streets, heading=start_heading)
+    map = HeadlessMap()
+    map.getintersection(0, 0)
+    map.set_pose(0, 0, start_heading)
+    with contextlib.redirect_stdout(io.StringIO()), no_sleeping():
+        for step in range(max_steps):
+            if not map.frontier:
+                return robot.streets_driven, robot.turns_made, True
+            try:
+                autonomous_step(map, robot, sweep)
+            except Stuck:
+                return robot.streets_driven, robot.turns_made, False
+    return robot.streets_driven, robot.turns_made, not map.frontier
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Greedy vs sweeping exploration")
+    parser.add_argument("--size", type=int, default=6, help="layout is size x size intersections")
+    parser.add_argument("--maps", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    totals = {"greedy": [0, 0], "sweep": [0, 0]}
+    print(f"{'map':>4} {'streets':>8} {'greedy':>8} {'sweep':>8} {'turns':>13}")
+    for n in range(args.maps):
+        streets = make_layout(args.size, args.size, rng=rng)
+        greedy, greedy_turns, greedy_done = explore(streets, False)
+        swept, swept_turns, sweep_done = explore(streets, True)
+        totals["greedy"][0] += greedy
+        totals["greedy"][1] += greedy_turns
+        totals["sweep"][0] += swept
+        totals["sweep"][1] += swept_turns
+        flag = "" if greedy_done and sweep_done else "  (not finished)"
+        print(f"{n:>4} {len(streets) // 2:>8} {greedy:>8} {swept:>8} {greedy_turns:>6} {swept_turns:>6}{flag}")
+    (greedy, greedy_turns), (swept, swept_turns) = totals["greedy"], totals["sweep"]
+    print(f"total streets driven: greedy {greedy}, sweep {swept} ({1 - swept / greedy:.0%} fewer)")
+    print(f"total turns: greedy {greedy_turns}, sweep {swept_turns} ({swept_turns / greedy_turns - 1:+.0%})")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+#   benchmark_planner.py
+#
+#   Time Map.dijkstra on synthetic 8-connected street grids, from 100 up
+#   to 100k intersections, and compare it against the old sorted-list
+#   planner (which is checked to give the exact same cost/direction field).
+#
+#   Run headless:   python3 benchmark_planner.py [--legacy-max N] [--backend grid]
+#
+#   With --backend grid the same grids are copied into a NumPy-backed
+#   GridMap first (the old planner is then run on the dict map for the
+#   comparison, since it pokes Intersection objects directly).
+#
+import argparse
+import math
+import time
+
+from MapBuilding import Map, STATUS
+
+
+# build a width x height grid where every street (including diagonals)
+# is CONNECTED, like a fully explored city map
+def make_grid_map(width, height):
+    map = Map()
+    for x in range(width):
+        for y in range(height):
+            for heading in range(8):
+                dx, dy = Map.heading_to_delta[heading]
+                if 0 <= x + dx < width and 0 <= y + dy < height:
+                    map.overwrite_street(x, y, heading, STATUS.CONNECTED)
+                else:
+                    map.overwrite_street(x, y, heading, STATUS.NONEXISTENT)
+    return map
+
+
+# the original list-based planner, kept here only as a reference point
+def legacy_dijkstra(map, xgoal, ygoal):
+    for inter in map.intersections.values():
+        inter.cost = float('inf')
+        inter.direction = None
+    map.goal = (xgoal, ygoal)
+    goal = map.getintersection(xgoal, ygoal)
+    goal.cost = 0
+    onDeck = [goal]
+
+    def sortedInsert(queue, inter):
+        for i in range(len(queue)):
+            if queue[i].cost > inter.cost:
+                queue.insert(i, inter)
+                return
+        queue.append(inter)
+
+    while onDeck:
+        current = onDeck.pop(0)
+        for heading in range(8):
+            if current.streets[heading] != STATUS.CONNECTED or current.blocked[heading]:
+                continue
+            dx, dy = map.heading_to_delta[heading]
+            neighbor = map.intersections.get((current.x + dx, current.y + dy))
+            if neighbor is None:
+                continue
+            potential_cost = current.cost + (1 if heading % 2 == 0 else 2**0.5)
+            if potential_cost < neighbor.cost:
+                if neighbor.cost < float('inf'):
+                    try:
+                        onDeck.remove(neighbor)
+                    except ValueError:
+                        pass
+                neighbor.cost = potential_cost
+                neighbor.direction = (heading + 4) % 8
+                sortedInsert(onDeck, neighbor)
+
+
+def snapshot(map):
+    return {key: (inter.cost, inter.direction) for key, inter in map.intersections.items()}
+
+
+def best_of(repeats, func, *args):
+    best = float('inf')
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling benchmark for Map.dijkstra")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[100, 1000, 10000, 100000],
+                        help="approximate number of intersections per grid")
+    parser.add_argument("--legacy-max", type=int, default=10000,
+                        help="skip the old list planner above this many intersections")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--backend", choices=["dict", "grid"], default="dict")
+    args = parser.parse_args()
+    if args.backend == "grid":
+        from gridmap import GridMap
+
+    print(f"{'nodes':>8} {'heap (ms)':>11} {'list (ms)':>11} {'speedup':>8}  same field")
+    for size in args.sizes:
+        side = max(2, int(round(math.sqrt(size))))
+        map = make_grid_map(side, side)
+        goal = (side // 3, side // 2)
+        planner = GridMap.from_map(map) if args.backend == "grid" else map
+
+        t_heap = best_of(args.repeats, planner.dijkstra, *goal)
+        heap_field = snapshot(planner)
+
+        if len(map.intersections) <= args.legacy_max:
+            t_list = best_of(1, legacy_dijkstra, map, *goal)
+            same = snapshot(map) == heap_field
+            print(f"{len(map.intersections):>8} {t_heap * 1e3:>11.2f} {t_list * 1e3:>11.2f} "
+                  f"{t_list / t_heap:>7.1f}x  {same}")
+        else:
+            print(f"{len(map.intersections):>8} {t_heap * 1e3:>11.2f} {'-':>11} {'-':>8}  -")
@@ -1,7 +1,6 @@
 import time
 import traceback
 import pigpio
-import pickle
 import threading
 import queue
 from DriveSystem import DriveSystem
@@ -9,6 +8,7 @@ from Sense import LineSensor
 from street_behaviors import Behaviors
 from AngleSensor import AngleSensor
 from MapBuilding import Map, STATUS, prompt_and_load_map
+from mapfile import save_map
 from proximitysensor import ProximitySensor
 
 def align_to_road(behaviors, map):
@@ -165,9 +165,8 @@ if __name__ == "__main__":
                     print("Invalid goal input.")
 
             elif mode == "save":
-                filename = input("Enter filename to save (e.g. mymap.pkl): ").strip()
-                with open(filename, 'wb') as file:
-                    pickle.dump(map, file)
+                filename = input("Enter filename to save (e.g. mymap.map): ").strip()
+                save_map(map, filename)
                 print(f"Map saved to {filename}")
 
             elif mode == "load":
@@ -29,7 +29,7 @@ def fetch(NFCsensor, shared, map, behaviors, treasure=None):
     print(f"\nSearching for Treasure {treasure}")
     print("Initializing navigation...")
 
-    if map.getintersection(x, y).streets[h] == STATUS.NONEXISTENT:
+    if map.street_status(x, y, h) == STATUS.NONEXISTENT:
         turn_amt, actual_angle = behaviors.turning_behavior("left")
         map.markturn(turn_amt, actual_angle)
         
@@ -38,7 +38,7 @@ def fetch(NFCsensor, shared, map, behaviors, treasure=None):
     
     # Update position after initial follow_line
     if result == "intersection":
-        map.update_connection()
+        map.update_connection(behaviors.last_traversal_time)
         x,y,h = map.pose()
         print(f"After position update - Position: ({x}, {y}), Heading: {h}")
     
@@ -54,21 +54,21 @@ def fetch(NFCsensor, shared, map, behaviors, treasure=None):
         print(f"Pull forward result: {has_street}")
         if has_street:
             inter = map.getintersection(x, y)
-            map.setstreet(x, y, h, STATUS.UNEXPLORED)
+            map.observe_street(x, y, h, True)
             print(f"Marked street at heading {h} as UNEXPLORED")
             for delta in [-1, 1, 3, -3]:
                 side_heading = (h + delta) % 8
                 if inter.streets[side_heading] == STATUS.UNKNOWN:
-                    inter.streets[side_heading] = STATUS.NONEXISTENT
+                    map.overwrite_street(inter.x, inter.y, side_heading, STATUS.NONEXISTENT)
                     print(f"Marked diagonal street at heading {side_heading} as NONEXISTENT")
         else:
             inter = map.getintersection(x, y)
-            map.setstreet(x, y, h, STATUS.NONEXISTENT)
+            map.observe_street(x, y, h, False)
             print(f"Marked street at heading {h} as NONEXISTENT")
             for delta in [-3, 3]:
                 side_heading = (h + delta) % 8
                 if inter.streets[side_heading] == STATUS.UNKNOWN:
-                    inter.streets[side_heading] = STATUS.NONEXISTENT
+                    map.overwrite_street(inter.x, inter.y, side_heading, STATUS.NONEXISTENT)
                     print(f"Marked diagonal street at heading {side_heading} as NONEXISTENT")
             
     elif result == "end":
@@ -200,7 +200,7 @@ def fetch(NFCsensor, shared, map, behaviors, treasure=None):
         print(f"Next NFC ID: {next_id}")
         print(f"new distance is {inter_prize_distance_dict[next_id][treasure]['distance']}")
         
-        map.update_connection()
+        map.update_connection(behaviors.last_traversal_time)
         
         if result == "intersection":
             print("Intersection detected")
@@ -208,21 +208,21 @@ def fetch(NFCsensor, shared, map, behaviors, treasure=None):
             print(f"Pull forward result: {has_street}")
             if has_street:
                 inter = map.getintersection(x, y)
-                map.setstreet(x, y, h, STATUS.UNEXPLORED)
+                map.observe_street(x, y, h, True)
                 print(f"Marked street at heading {h} as UNEXPLORED")
                 for delta in [-1, 1, 3, -3]:
                     side_heading = (h + delta) % 8
                     if inter.streets[side_heading] == STATUS.UNKNOWN:
-                        inter.streets[side_heading] = STATUS.NONEXISTENT
+                        map.overwrite_street(inter.x, inter.y, side_heading, STATUS.NONEXISTENT)
                         print(f"Marked diagonal street at heading {side_heading} as NONEXISTENT")
             else:
                 inter = map.getintersection(x, y)
-                map.setstreet(x, y, h, STATUS.NONEXISTENT)
+                map.observe_street(x, y, h, False)
                 print(f"Marked street at heading {h} as NONEXISTENT")
                 for delta in [-3, 3]:
                     side_heading = (h + delta) % 8
                     if inter.streets[side_heading] == STATUS.UNKNOWN:
-                        inter.streets[side_heading] = STATUS.NONEXISTENT
+                        map.overwrite_street(inter.x, inter.y, side_heading, STATUS.NONEXISTENT)
                         print(f"Marked diagonal street at heading {side_heading} as NONEXISTENT")
         
             map.showwithrobot()  # Add map display after updating connection
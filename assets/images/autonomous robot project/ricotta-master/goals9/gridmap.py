@@ -0,0 +1,636 @@
+#
+#   gridmap.py
+#
+#   A NumPy-backed storage backend for Map. Instead of a dict of
+#   Intersection objects, GridMap keeps every intersection of a bounding
+#   box in a handful of dense arrays:
+#
+#       status          int8    [W, H, 8]   STATUS value of each street end
+#       blocked_bits    uint8   [W, H]      bit h set = street h is blocked
+#       exists          bool    [W, H]      intersection has been created
+#       cost_field      float64 [W, H]      planner cost to the goal
+#       direction_field int8    [W, H]      planner heading to the goal, -1 = None
+#
+#   The arrays grow automatically when the robot leaves the current box.
+#   getintersection(), map.intersections[...] and friends hand back small
+#   view objects, so the rest of the code (setstreet, markturn, navigation,
+#   show, ...) works on a GridMap unchanged. Whole-map operations (planning,
+#   clearing the goal or the blockages, rebuilding the frontier) work on the
+#   arrays directly.
+#
+#   What that buys is memory (a byte or two per street end instead of an
+#   object per intersection) and whole-map searches: planning, the nearest
+#   frontier and the alternatives snapshot run over flat array indices.
+#   The one-intersection calls navigation and fetch make all the time
+#   (getintersection, setstreet, street_status, is_blocked,
+#   frontier_headings, and the frontier and connectivity upkeep behind every
+#   write) go through flat memoryviews of the arrays, which read and write
+#   plain Python numbers instead of boxing a NumPy scalar each time, and an
+#   intersection's view object is made once and kept. getintersection and
+#   frontier_headings come out faster than on a dict Map, street and
+#   blockage writes take 1.2-1.5 times as long, and only reading a field
+#   off a view (streets[h], cost) is still a few times an attribute lookup.
+#   Exploring the benchmark_exploration.py layouts takes up to a third
+#   longer than on a dict Map at 8x8 and less time at 16x16.
+#
+#   Costs stay float64: the planners compare costs for exact equality, and
+#   float32 rounding would make a cost differ from the sum it came from.
+#
+import heapq
+import itertools
+
+import numpy as np
+
+from MapBuilding import Map, STATUS
+
+
+STATUSES = list(STATUS)         # index by value: STATUSES[2] is UNEXPLORED
+CONNECTED = STATUS.CONNECTED.value
+UNKNOWN = STATUS.UNKNOWN.value
+UNEXPLORED = STATUS.UNEXPLORED.value
+KEPT = (STATUS.DEADEND.value, CONNECTED)  # setstreet never overwrites these
+HEADINGS_FOR_BITS = [[h for h in range(8) if bits >> h & 1] for bits in range(256)]
+
+
+class StreetView:
+    """The 8 street statuses of one GridMap intersection, as a list-like."""
+    __slots__ = ('grid', 'x', 'y')
+
+    def __init__(self, grid, x, y):
+        self.grid = grid
+        self.x = x
+        self.y = y
+
+    def __len__(self):
+        return 8
+
+    def __getitem__(self, heading):
+        g = self.grid
+        return STATUSES[g._status_flat[((self.x - g.x0) * g._height + self.y - g.y0) * 8 + heading]]
+
+    def __setitem__(self, heading, status):
+        g = self.grid
+        g._status_flat[((self.x - g.x0) * g._height + self.y - g.y0) * 8 + heading] = status.value
+
+    def __iter__(self):
+        g = self.grid
+        i = ((self.x - g.x0) * g._height + self.y - g.y0) * 8
+        return (STATUSES[v] for v in g._status_flat[i:i + 8].tolist())
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class BlockedView:
+    """The 8 blocked flags of one GridMap intersection, as a list-like."""
+    __slots__ = ('grid', 'x', 'y')
+
+    def __init__(self, grid, x, y):
+        self.grid = grid
+        self.x = x
+        self.y = y
+
+    def __len__(self):
+        return 8
+
+    def __getitem__(self, heading):
+        g = self.grid
+        return bool(g._blocked_bits_flat[(self.x - g.x0) * g._height + self.y - g.y0] >> heading & 1)
+
+    def __setitem__(self, heading, value):
+        g = self.grid
+        i = (self.x - g.x0) * g._height + self.y - g.y0
+        if value:
+            g._blocked_bits_flat[i] |= 1 << heading
+        else:
+            g._blocked_bits_flat[i] &= ~(1 << heading) & 0xFF
+
+    def __iter__(self):
+        return (self[h] for h in range(8))
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class GridIntersection:
+    """Stand-in for Intersection that reads and writes the GridMap arrays."""
+    __slots__ = ('grid', 'x', 'y', 'streets', 'blocked')
+
+    def __init__(self, grid, x, y):
+        self.grid = grid
+        self.x = x
+        self.y = y
+        self.streets = StreetView(grid, x, y)
+        self.blocked = BlockedView(grid, x, y)
+
+    @property
+    def cost(self):
+        g = self.grid
+        return g._cost_field_flat[(self.x - g.x0) * g._height + self.y - g.y0]
+
+    @cost.setter
+    def cost(self, value):
+        g = self.grid
+        g._cost_field_flat[(self.x - g.x0) * g._height + self.y - g.y0] = value
+
+    @property
+    def direction(self):
+        g = self.grid
+        d = g._direction_field_flat[(self.x - g.x0) * g._height + self.y - g.y0]
+        return None if d < 0 else d
+
+    @direction.setter
+    def direction(self, value):
+        g = self.grid
+        g._direction_field_flat[(self.x - g.x0) * g._height + self.y - g.y0] = -1 if value is None else value
+
+    def set_blocked(self, heading, value: bool):
+        self.blocked[heading] = value
+
+    def is_blocked(self, heading) -> bool:
+        g = self.grid
+        return bool(g._blocked_bits_flat[(self.x - g.x0) * g._height + self.y - g.y0] >> heading & 1)
+
+
+class GridTable(dict):
+    """Read-only dict look-alike for GridMap.intersections.
+
+    The dict itself only holds the intersection views made so far (see
+    GridMap._view), so looking one up again is a plain dict hit; any other
+    key is checked against the arrays.
+    """
+
+    def __init__(self, grid):
+        super().__init__()
+        self.grid = grid
+
+    def __missing__(self, key):
+        inter = self.grid._view(key[0], key[1])
+        if inter is None:
+            raise KeyError(key)
+        return inter
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or self.grid._cell(key[0], key[1]) is not None
+
+    def get(self, key, default=None):
+        inter = dict.get(self, key)
+        if inter is None:
+            inter = self.grid._view(key[0], key[1])
+            if inter is None:
+                return default
+        return inter
+
+    def __len__(self):
+        return int(np.count_nonzero(self.grid.exists))
+
+    def keys(self):
+        g = self.grid
+        xs, ys = np.nonzero(g.exists)
+        return [(x + g.x0, y + g.y0) for x, y in zip(xs.tolist(), ys.tolist())]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    # whole-map walks get views that aren't kept, so drawing or saving the
+    # map doesn't leave an object behind for every intersection
+    def values(self):
+        return [GridIntersection(self.grid, x, y) for x, y in self.keys()]
+
+    def items(self):
+        return [((x, y), GridIntersection(self.grid, x, y)) for x, y in self.keys()]
+
+
+def _array(name):
+    # One of the GridMap arrays, kept together with a flat memoryview of it
+    # (_<name>_flat). Indexing the memoryview reads and writes plain Python
+    # ints and floats, without the NumPy scalar an element of the array
+    # itself costs, so the one-intersection operations go through it. The
+    # arrays are always C-contiguous, so the flat view shares their memory.
+    attr, flat = '_' + name, '_' + name + '_flat'
+
+    def get(self):
+        return getattr(self, attr)
+
+    def set(self, array):
+        setattr(self, attr, array)
+        setattr(self, flat, memoryview(array).cast('B').cast(array.dtype.char))
+
+    return property(get, set)
+
+
+class GridMap(Map):
+    # heading h moves (dx, dy); as flat index offsets these depend on the height
+    deltas = [Map.heading_to_delta[h] for h in range(8)]
+
+    status = _array('status')
+    blocked_bits = _array('blocked_bits')
+    cost_field = _array('cost_field')
+    direction_field = _array('direction_field')
+
+    def __init__(self, width=16, height=16):
+        super().__init__()
+        self.intersections = GridTable(self)
+        self._moves = None
+        self._allocate(width, height, -(width // 2), -(height // 2))
+
+    # exists also sets the shape the flat views are indexed by, and a new
+    # one drops the intersection views made so far (see _view)
+    @property
+    def exists(self):
+        return self._exists
+
+    @exists.setter
+    def exists(self, array):
+        self._exists = array
+        self._exists_flat = memoryview(array).cast('B').cast('?')
+        self._width, self._height = array.shape
+        self.intersections.clear()
+
+    # the flat views can't be pickled, they're made again from the arrays
+    def __getstate__(self):
+        state = super().__getstate__()
+        for name in ('status', 'blocked_bits', 'exists', 'cost_field', 'direction_field'):
+            del state['_' + name + '_flat']
+        state['intersections'] = None
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.intersections = GridTable(self)
+        for name in ('status', 'blocked_bits', 'exists', 'cost_field', 'direction_field'):
+            setattr(self, name, state['_' + name])
+
+    def _allocate(self, width, height, x0, y0):
+        self.x0 = x0
+        self.y0 = y0
+        self.status = np.zeros((width, height, 8), dtype=np.int8)
+        self.blocked_bits = np.zeros((width, height), dtype=np.uint8)
+        self.exists = np.zeros((width, height), dtype=bool)
+        self.cost_field = np.full((width, height), np.inf)
+        self.direction_field = np.full((width, height), -1, dtype=np.int8)
+
+    # make room for (x, y), always keeping a one-cell empty border so every
+    # existing intersection has all 8 neighbors inside the arrays
+    def _ensure(self, x, y):
+        w, h = self.exists.shape
+        ix, iy = x - self.x0, y - self.y0
+        if 1 <= ix < w - 1 and 1 <= iy < h - 1:
+            return
+        lo_x = min(self.x0, x - 1)
+        lo_y = min(self.y0, y - 1)
+        hi_x = max(self.x0 + w, x + 2)
+        hi_y = max(self.y0 + h, y + 2)
+        # grow a side by at least half again so repeated growth stays cheap
+        new_w = hi_x - lo_x if hi_x - lo_x == w else max(hi_x - lo_x, w + w // 2)
+        new_h = hi_y - lo_y if hi_y - lo_y == h else max(hi_y - lo_y, h + h // 2)
+        if lo_x < self.x0:
+            lo_x = hi_x - new_w
+        if lo_y < self.y0:
+            lo_y = hi_y - new_h
+        old = (self.status, self.blocked_bits, self.exists, self.cost_field, self.direction_field)
+        ox, oy = self.x0 - lo_x, self.y0 - lo_y
+        self._allocate(new_w, new_h, lo_x, lo_y)
+        for new, prev in zip((self.status, self.blocked_bits, self.exists, self.cost_field, self.direction_field), old):
+            new[ox:ox + w, oy:oy + h] = prev
+
+    # ---- one-intersection operations, done on the flat views ----
+
+    def _cell(self, x, y):
+        # flat index of the intersection at (x, y), None if there is none
+        ix, iy = x - self.x0, y - self.y0
+        if 0 <= ix < self._width and 0 <= iy < self._height and self._exists_flat[ix * self._height + iy]:
+            return ix * self._height + iy
+        return None
+
+    # The intersection views are kept in self.intersections once made: they
+    # only hold (x, y), so they stay good when the arrays grow, and looking
+    # one up again is a dict hit. Removing an intersection drops its view.
+    def _view(self, x, y):
+        if self._cell(x, y) is None:
+            return None
+        inter = self.intersections[(x, y)] = GridIntersection(self, x, y)
+        return inter
+
+    def getintersection(self, x, y):
+        try:
+            return self.intersections[(x, y)]
+        except KeyError:
+            pass
+        self._ensure(x, y)
+        ix, iy = x - self.x0, y - self.y0
+        self.exists[ix, iy] = True
+        self.status[ix, iy] = UNKNOWN
+        self.blocked_bits[ix, iy] = 0
+        self.cost_field[ix, iy] = np.inf
+        self.direction_field[ix, iy] = -1
+        self._intersection_added(x, y)
+        return self._view(x, y)
+
+    def has_intersection(self, x, y):
+        return (x, y) in self.intersections
+
+    def street_status(self, x, y, heading):
+        ix, iy = x - self.x0, y - self.y0
+        i = ix * self._height + iy
+        if not (0 <= ix < self._width and 0 <= iy < self._height and self._exists_flat[i]):
+            raise KeyError((x, y))
+        return STATUSES[self._status_flat[i * 8 + heading]]
+
+    def get_cost(self, x, y):
+        i = self._cell(x, y)
+        return float('inf') if i is None else self._cost_field_flat[i]
+
+    def setstreet(self, x, y, heading, status):
+        # Map.setstreet's rules, reading the statuses off the arrays so an
+        # end that doesn't change costs no view lookup
+        inter = self.getintersection(x, y)
+        if self._status_flat[self._cell(x, y) * 8 + heading] not in KEPT:
+            self._write_street(inter, heading, status)
+        dx, dy = self.heading_to_delta[heading]
+        i = self._cell(x + dx, y + dy)
+        reverse = (heading + 4) % 8
+        if i is not None and self._status_flat[i * 8 + reverse] not in KEPT:
+            self._write_street(self.intersections[(x + dx, y + dy)], reverse, status)
+
+    def is_blocked(self, x, y, heading) -> bool:
+        self._expire_due()
+        i = self._cell(x, y)
+        if i is None:
+            self.getintersection(x, y)  # like Map.is_blocked, asking creates it
+            return False
+        return bool(self._blocked_bits_flat[i] >> heading & 1)
+
+    def frontier_headings(self, x, y):
+        i = self._cell(x, y)
+        if i is None:
+            raise KeyError((x, y))
+        bits = self._blocked_bits_flat[i]
+        return [h for h, v in enumerate(self._status_flat[i * 8:i * 8 + 8].tolist())
+                if (v == UNKNOWN or v == UNEXPLORED) and not bits >> h & 1]
+
+    # the upkeep after every street or blockage write (see Map)
+    def _end_open(self, inter, heading):
+        i = (inter.x - self.x0) * self._height + inter.y - self.y0
+        return self._status_flat[i * 8 + heading] == CONNECTED and not self._blocked_bits_flat[i] >> heading & 1
+
+    def _refresh_frontier(self, inter):
+        # frontier_headings, stopping at the first open heading
+        i = (inter.x - self.x0) * self._height + inter.y - self.y0
+        bits = self._blocked_bits_flat[i]
+        for h, v in enumerate(self._status_flat[i * 8:i * 8 + 8].tolist()):
+            if (v == UNKNOWN or v == UNEXPLORED) and not bits >> h & 1:
+                self.frontier.add((inter.x, inter.y))
+                return
+        self.frontier.discard((inter.x, inter.y))
+
+    def _remove_intersection(self, x, y):
+        self.intersections.pop((x, y), None)
+        ix, iy = x - self.x0, y - self.y0
+        self.exists[ix, iy] = False
+        self.status[ix, iy] = UNKNOWN
+        self.blocked_bits[ix, iy] = 0
+        self.cost_field[ix, iy] = np.inf
+        self.direction_field[ix, iy] = -1
+
+    @classmethod
+    def from_map(cls, map):
+        """Copy a dict-backed Map (pose, goal, streets, blocks, timings) into a GridMap."""
+        keys = list(map.intersections.keys())
+        if keys:
+            xs = [k[0] for k in keys]
+            ys = [k[1] for k in keys]
+            grid = cls(max(xs) - min(xs) + 3, max(ys) - min(ys) + 3)
+            grid.x0, grid.y0 = min(xs) - 1, min(ys) - 1
+            ix = np.array(xs) - grid.x0
+            iy = np.array(ys) - grid.y0
+            inters = [map.intersections[k] for k in keys]
+            grid.exists[ix, iy] = True
+            grid.status[ix, iy] = [[s.value for s in inter.streets] for inter in inters]
+            grid.blocked_bits[ix, iy] = [sum(1 << h for h in range(8) if inter.blocked[h]) for inter in inters]
+            grid.cost_field[ix, iy] = [inter.cost for inter in inters]
+            grid.direction_field[ix, iy] = [-1 if inter.direction is None else inter.direction for inter in inters]
+        else:
+            grid = cls()
+        grid.x, grid.y, grid.heading = map.pose()
+        grid.goal = map.goal
+        grid.street_times = dict(map.street_times)
+        grid.street_time = map.street_time
+        grid.time_weighted = map.time_weighted
+        grid.blockages = dict(map.blockages)
+        grid._expiry = list(map._expiry)
+        grid.blockage_ttl = map.blockage_ttl
+        grid.beliefs = None if map.beliefs is None else map.beliefs.copy()
+        grid.journal_base = map.seq
+        grid.rebuild_frontier()
+        return grid
+
+    def copy(self):
+        """A copy of the map's contents, without the journal or planner state."""
+        # the arrays, the frontier and a few flat dicts: a handful of
+        # memcpys and no per-intersection objects, so this is quick enough
+        # to do between two driving steps
+        grid = type(self)(1, 1)
+        grid.x0, grid.y0 = self.x0, self.y0
+        grid.status = self.status.copy()
+        grid.blocked_bits = self.blocked_bits.copy()
+        grid.exists = self.exists.copy()
+        grid.cost_field = np.full(self.exists.shape, np.inf)
+        grid.direction_field = np.full(self.exists.shape, -1, dtype=np.int8)
+        grid.x, grid.y, grid.heading = self.pose()
+        grid.goal = self.goal
+        grid.street_times = dict(self.street_times)
+        grid.street_time = self.street_time
+        grid.time_weighted = self.time_weighted
+        grid.blockages = dict(self.blockages)
+        grid._expiry = list(self._expiry)
+        grid.blockage_ttl = self.blockage_ttl
+        grid.beliefs = None if self.beliefs is None else self.beliefs.copy()
+        grid._blocked_hash = self._blocked_hash
+        grid.frontier = set(self.frontier)
+        grid.status_counts = dict(self.status_counts)
+        grid.journal_base = self.seq
+        return grid
+
+    def memory_bytes(self):
+        return sum(a.nbytes for a in (self.status, self.blocked_bits, self.exists, self.cost_field, self.direction_field))
+
+    # ---- whole-map operations, done on the arrays ----
+
+    def rebuild_frontier(self):
+        counts = np.bincount(self.status[self.exists].ravel(), minlength=len(STATUSES))
+        self.status_counts = {status: int(counts[status.value]) for status in STATUS}
+        open_status = (self.status == UNKNOWN) | (self.status == UNEXPLORED)
+        unblocked = (self.blocked_bits[..., None] >> np.arange(8, dtype=np.uint8)) & 1 == 0
+        xs, ys = np.nonzero((open_status & unblocked).any(axis=2) & self.exists)
+        self.frontier = {(x + self.x0, y + self.y0) for x, y in zip(xs.tolist(), ys.tolist())}
+
+    def cleargoal(self):
+        self.goal = None
+        self._rhs = None
+        self._field_key = None
+        self._route_cache = None
+        self._point_goal = False
+        self._alternatives = None
+        self.cost_field.fill(np.inf)
+        self.direction_field.fill(-1)
+
+    def _field_for(self, keys):
+        ix, iy = self._indices(keys)
+        return self.cost_field[ix, iy], self.direction_field[ix, iy]
+
+    def _set_field(self, keys, costs, directions):
+        ix, iy = self._indices(keys)
+        self.cost_field[ix, iy] = costs
+        self.direction_field[ix, iy] = directions
+
+    def _indices(self, keys):
+        xy = np.array(keys).reshape(-1, 2)
+        return xy[:, 0] - self.x0, xy[:, 1] - self.y0
+
+    def clear_blockages(self):
+        """Clear all blockages from all intersections in the map."""
+        # only visit the intersections that actually have something blocked
+        xs, ys = np.nonzero(self.blocked_bits)
+        for x, y in zip((xs + self.x0).tolist(), (ys + self.y0).tolist()):
+            inter = GridIntersection(self, x, y)
+            for heading in range(8):
+                self._write_blocked(inter, heading, False)
+        self.blockages = {}
+        self._expiry = []
+        print("All blockages have been cleared from the map.")
+
+    # for each possible bit pattern, the (offset, step cost, direction back)
+    # of the streets it opens, in heading order like Map uses. Only depends
+    # on the array height, so it's kept until the arrays grow.
+    def _moves_for_bits(self, h):
+        if self._moves is None or self._moves[0] != h:
+            offsets = [dx * h + dy for dx, dy in self.deltas]
+            moves = [(offsets[heading], 1 if heading % 2 == 0 else 2**0.5, (heading + 4) % 8)
+                     for heading in range(8)]
+            self._moves = (h, [[moves[heading] for heading in range(8) if bits >> heading & 1]
+                               for bits in range(256)])
+        return self._moves[1]
+
+    # bit h of open_bits[i] = street h at flat index i is CONNECTED,
+    # unblocked and leads to an intersection that exists
+    def _open_bits(self):
+        # the one-cell border is always empty, so only the inside can have
+        # open streets, and all 8 neighbors of an inside cell are in the arrays
+        w, h = self.exists.shape
+        usable = np.zeros((w, h, 8), dtype=bool)
+        inside = usable[1:-1, 1:-1]
+        np.equal(self.status[1:-1, 1:-1], CONNECTED, out=inside)
+        inside &= np.unpackbits(self.blocked_bits[1:-1, 1:-1, None], axis=2, bitorder='little') == 0
+        for heading, (dx, dy) in enumerate(self.deltas):
+            inside[..., heading] &= self.exists[1 + dx:w - 1 + dx, 1 + dy:h - 1 + dy]
+        return np.packbits(usable, axis=2, bitorder='little').ravel().tolist()
+
+    def nearest_frontier(self, x, y):
+        # Map's search (same seeds, tie order and stopping point) over flat
+        # array indices, like _search_from_goal
+        if self.time_weighted:
+            return super().nearest_frontier(x, y)
+        self._expire_due()
+        target = self._cell(x, y)
+        if target is None or not self.frontier:
+            return None
+        h = self._height
+        offsets = [dx * h + dy for dx, dy in self.deltas]
+        open_bits = self._open_bits()
+        moves_for_bits = self._moves_for_bits(h)
+
+        inf = float('inf')
+        costs = {}
+        via = {}  # flat index -> heading to drive from it toward its frontier
+        order = itertools.count()
+        onDeck = []
+        heappop, heappush = heapq.heappop, heapq.heappush
+        for fx, fy in sorted(self.frontier):
+            i = (fx - self.x0) * h + fy - self.y0
+            costs[i] = 0
+            heappush(onDeck, (0, next(order), i))
+
+        while onDeck:
+            c, _, i = heappop(onDeck)
+            if c > costs[i]:
+                continue  # stale entry
+            if i == target:
+                break
+            for offset, step_cost, back in moves_for_bits[open_bits[i]]:
+                n = i + offset
+                if c + step_cost < costs.get(n, inf):
+                    costs[n] = c + step_cost
+                    via[n] = back  # point back toward i
+                    heappush(onDeck, (c + step_cost, next(order), n))
+        else:
+            return None  # ran out of streets before reaching the robot
+
+        # walk the pointers from the robot out to the frontier it came from
+        route = []
+        i = target
+        while i in via:
+            route.append(via[i])
+            i += offsets[via[i]]
+        return (i // h + self.x0, i % h + self.y0), costs[target], route
+
+    def _snapshot_edges(self):
+        # alternatives.snapshot_edges off the arrays: a street can be driven
+        # if the intersection at its far end exists and that end is
+        # CONNECTED and unblocked
+        w, h = self.exists.shape
+        end_open = self.status == CONNECTED
+        end_open &= np.unpackbits(self.blocked_bits[..., None], axis=2, bitorder='little') == 0
+        end_open &= self.exists[..., None]
+        drivable = np.zeros((w, h, 8), dtype=bool)
+        for heading, (dx, dy) in enumerate(self.deltas):
+            drivable[1:-1, 1:-1, heading] = end_open[1 + dx:w - 1 + dx, 1 + dy:h - 1 + dy, (heading + 4) % 8]
+        xs, ys = np.nonzero(self.exists)
+        bits = np.packbits(drivable[xs, ys], axis=1, bitorder='little').ravel().tolist()
+        edges = {}
+        for x, y, b in zip((xs + self.x0).tolist(), (ys + self.y0).tolist(), bits):
+            edges[(x, y)] = [(heading, (x + self.deltas[heading][0], y + self.deltas[heading][1]),
+                              self._step_cost(x, y, heading))
+                             for heading in HEADINGS_FOR_BITS[b]]
+        return edges
+
+    def _search_from_goal(self, xgoal, ygoal):
+        # Same search as Map (heap, lazy deletion, same tie order), but over
+        # flat array indices so there is no per-intersection object to touch.
+        # Learned per-street times don't fit the per-heading move tables, so
+        # time-weighted planning uses the plain search.
+        if self.time_weighted:
+            return super()._search_from_goal(xgoal, ygoal)
+        w, h = self.exists.shape
+        open_bits = self._open_bits()
+        moves_for_bits = self._moves_for_bits(h)
+
+        inf = float('inf')
+        cost = [inf] * (w * h)
+        direction = [-1] * (w * h)
+
+        start = (xgoal - self.x0) * h + (ygoal - self.y0)
+        cost[start] = 0
+        order = itertools.count()
+        onDeck = [(0, next(order), start)]
+        heappop, heappush = heapq.heappop, heapq.heappush
+        while onDeck:
+            c, _, i = heappop(onDeck)
+            if c > cost[i]:
+                continue  # stale entry
+            for offset, step_cost, back in moves_for_bits[open_bits[i]]:
+                n = i + offset
+                potential_cost = c + step_cost
+                if potential_cost < cost[n]:
+                    cost[n] = potential_cost
+                    direction[n] = back
+                    heappush(onDeck, (potential_cost, next(order), n))
+
+        self.cost_field[...] = np.array(cost).reshape(w, h)
+        self.direction_field[...] = np.array(direction, dtype=np.int8).reshape(w, h)
@@ -2,34 +2,67 @@
 import pigpio
 import threading
 import time
-import pickle
 import ctypes
+import os
 from DriveSystem import DriveSystem
 from Sense import LineSensor
 from AngleSensor import AngleSensor
 from street_behaviors import Behaviors
-from MapBuilding import Map, STATUS
+from MapBuilding import STATUS
+from gridmap import GridMap
 from uithread import Shared, ui
 from proximitysensor import ProximitySensor
 from navigation import align_to_road, step_toward_goal, autonomous_step, handle_deadend, directed_exploration
+from routes import plan_tour
 from MapBuilding import prompt_and_load_map
+from tiledmap import TiledMap
+from autosave import Autosaver
+from maplog import recover
+from telemetry import Recorder
 from nfc import NFCSensor
 from fetch import fetch
 
 from ros import runros
 
+# how many steps back "undo" can go (older map journal entries are dropped)
+UNDO_STEPS = 50
+# the map is written here in the background every AUTOSAVE_SECONDS while it
+# changes, or sooner after AUTOSAVE_EVENTS changes, and every change in
+# between goes to the log (fsynced at least every AUTOSAVE_COMMIT seconds)
+AUTOSAVE_FILE = "autosave.map"
+AUTOSAVE_LOG = "autosave.log"
+AUTOSAVE_SECONDS = 30.0
+AUTOSAVE_EVENTS = 200
+AUTOSAVE_COMMIT = 0.05
+# every sensor reading and motor command of a run is recorded here
+TELEMETRY_FILE = "telemetry-%Y%m%d-%H%M%S.bin"
+
 def brain_main(io):
-    drive = DriveSystem(io)
-    sensor = LineSensor(io)
-    angle = AngleSensor(io)
-    proximity_sensor = ProximitySensor(io)
+    recorder = Recorder(time.strftime(TELEMETRY_FILE))
+    recorder.start()
+    drive = DriveSystem(io, recorder)
+    sensor = LineSensor(io, recorder)
+    angle = AngleSensor(io, recorder)
+    proximity_sensor = ProximitySensor(io, recorder)
     nfc_sensor = NFCSensor()  # Instantiate a single NFCSensor
-    behaviors = Behaviors(io, drive, sensor, angle, proximity_sensor)
+    behaviors = Behaviors(io, drive, sensor, angle, proximity_sensor, recorder)
 
     shared = Shared()
-    map = prompt_and_load_map()
+    map = None
+    if os.path.exists(AUTOSAVE_FILE):
+        # the last run didn't necessarily end well
+        if input("Recover the map from the last run (y/n)? ").strip().lower() == "y":
+            map, replayed = recover(AUTOSAVE_FILE, AUTOSAVE_LOG)
+            print(f"Map recovered ({replayed} changes replayed from the log).")
+    if map is None:
+        map = prompt_and_load_map()
     if map is None:
-            map = Map()
+            # the same kind of map a load gives, which the autosaver copies quickly
+            map = GridMap()
+    # repair the planner field instead of re-searching after every change:
+    # goals (route_to) keep a whole-map field that blockages and new streets
+    # only patch, rather than a fresh point-to-point search each time
+    map.set_incremental(True)
 
     # Ensure the starting intersection is initialized before any map display
     align_to_road(behaviors, map, shared)
@@ -41,19 +74,34 @@ def brain_main(io):
     rosthread = threading.Thread(name="ROSThread", target=runros, args=(shared,))
     rosthread.start()
 
+    autosaver = Autosaver(AUTOSAVE_FILE, AUTOSAVE_SECONDS, AUTOSAVE_EVENTS, AUTOSAVE_LOG, AUTOSAVE_COMMIT)
+    autosaver.start()
+
     exploring = False
     paused = False
     navigating_to_goal = False
     invalid_goal_reported = False
     fetching = False
+    turn_planning = False
+    tour = []  # stops still to visit after the current goal
+    time_weighting = False
+    sweeping = False  # look down every unknown street before driving off
+    checkpoints = []  # map snapshots from before each step that changed it
 
     try:
         while True:
             with shared.lock:
                 cmd = shared.command
                 goal = shared.goal
+                filename = shared.filename
                 pose = shared.pose
+                stops = shared.tour
                 shared.command = None
+            checkpoint = map.snapshot()
+
+            # any other driving command ends a tour
+            if cmd in ("explore", "step", "fetch", "goal"):
+                tour = []
 
             if cmd == "quit":
                 break
@@ -67,6 +115,17 @@ def brain_main(io):
                 paused = True
             elif cmd == "resume":
                 paused = False
+            elif cmd == "undo":
+                # take back the last step's changes to the map (e.g. a
+                # wrong heading correction) without reloading anything
+                if checkpoints:
+                    map.rollback(checkpoints.pop())
+                    x, y, h = map.pose()
+                    print(f"Undone, back at ({x}, {y}) heading {h}. {len(checkpoints)} more steps to undo.")
+                else:
+                    print("Nothing to undo.")
+                paused = True
+                checkpoint = map.snapshot()
             elif cmd == "step":
                 paused = False
                 exploring = True
@@ -79,12 +138,38 @@ def brain_main(io):
                 navigating_to_goal = False
                 invalid_goal_reported = False
                 fetching = True
+            elif cmd == "tour" and stops:
+                start = (map.x, map.y)
+                ordered, cost, received_cost, unreachable = plan_tour(map, start, stops)
+                for stop in unreachable:
+                    print(f"Skipping ({stop[0]}, {stop[1]}): no known route to it, or on from it.")
+                if ordered:
+                    print("Tour order: " + " -> ".join(f"({x}, {y})" for x, y in ordered))
+                    print(f"Tour cost {cost:.2f} (in the order received: {received_cost:.2f})")
+                    goal = ordered[0]
+                    tour = ordered[1:]
+                    with shared.lock:
+                        shared.goal = goal
+                    map.route_to(goal[0], goal[1])
+                    exploring = False
+                    paused = False
+                    navigating_to_goal = True
+                    invalid_goal_reported = False
+                    fetching = False
+                else:
+                    print("No stops left to visit.")
             elif cmd == "goal" and goal:
                 # Check if the goal intersection exists in the map
-                if goal in map.intersections:
+                if goal in map.intersections and not map.reachable(map.x, map.y, goal[0], goal[1]):
+                    # nothing to search for: no known open street leads there
+                    print(f"Goal ({goal[0]}, {goal[1]}) is not connected to the robot's position.")
+                    print("Try 'clear' if blockages are cutting it off, or explore more.")
+                    navigating_to_goal = False
+                elif goal in map.intersections:
                     print(f"Setting goal to ({goal[0]}, {goal[1]})")
-                    map.dijkstra(goal[0], goal[1])
-                    if map.goal is not None:  # Only set navigating if dijkstra found a path
+                    # point to point: a nearby goal shouldn't flood the map
+                    map.route_to(goal[0], goal[1])
+                    if map.goal is not None:  # Only set navigating if the goal was accepted
                         exploring = False
                         paused = False
                         navigating_to_goal = True
@@ -117,18 +202,18 @@ def brain_main(io):
                 result = behaviors.follow_line()
                 if result == "intersection":
                     has_street = behaviors.pull_forward()
-                    map.update_connection()
+                    map.update_connection(behaviors.last_traversal_time)
                     x, y, h = map.pose()
                     inter = map.getintersection(x, y)
                     if has_street:
                         if inter.streets[h] == STATUS.UNKNOWN:
-                            map.setstreet(x, y, h, STATUS.UNEXPLORED)
+                            map.observe_street(x, y, h, True)
                         for delta in [-1, 1, -3, 3]:
                             diag_heading = (h + delta) % 8
                             if inter.streets[diag_heading] == STATUS.UNKNOWN:
                                 map.setstreet(x, y, diag_heading, STATUS.NONEXISTENT)
                     else:
-                        map.setstreet(x, y, h, STATUS.NONEXISTENT)
+                        map.observe_street(x, y, h, False)
                         for delta in [-3, 3]:
                             diag_heading = (h + delta) % 8
                             if inter.streets[diag_heading] == STATUS.UNKNOWN:
@@ -144,15 +229,48 @@ def brain_main(io):
                     handle_deadend(map, behaviors, original_x, original_y, original_heading)
 
             elif cmd == "save":
-                name = input("Filename to save: ")
-                with open(name, 'wb') as f:
-                    pickle.dump(map, f)
-                print("Map saved.")
+                if isinstance(map, TiledMap):
+                    # a tiled map is saved into its own tile directory
+                    map.flush()
+                    print(f"Map saved in {map.intersections.directory}.")
+                else:
+                    # written by the autosave thread from its copy, brought
+                    # up to date with the map first
+                    autosaver.save_as(map, filename)
+                    print(f"Saving map to {filename}.")
 
-            elif cmd == "load":
+            elif cmd in ("load", "merge"):
                 loaded_map = prompt_and_load_map()
+                if loaded_map is not None and cmd == "merge":
+                    # add an earlier run's map to what we know now
+                    try:
+                        text = input("Offset of that map as dx,dy (blank for 0,0): ").strip()
+                        offset = tuple(int(v) for v in text.split(",")) if text else (0, 0)
+                        if len(offset) != 2:
+                            raise ValueError
+                    except ValueError:
+                        print("Invalid offset.")
+                        loaded_map = None
+                if loaded_map is not None and cmd == "merge":
+                    directory = None
+                    if isinstance(map, TiledMap):
+                        # the merged map gets tiles of its own
+                        directory = input("Tile directory for the merged map: ").strip() or None
+                    try:
+                        loaded_map, conflicts = map.merge(loaded_map, offset, directory=directory)
+                        print(f"Maps merged, {len(loaded_map.intersections)} intersections "
+                              f"({conflicts} street ends disagreed).")
+                    except ValueError as e:
+                        print(e)
+                        loaded_map = None
                 if loaded_map is not None:
                     map = loaded_map
+                    checkpoints = []
+                    checkpoint = map.snapshot()
+                    map.set_incremental(True)
+                    if turn_planning:
+                        map.set_turn_costs(behaviors)
+                    map.set_time_weighting(time_weighting)
                     x, y, h = map.pose()
                     with shared.lock:
                         shared.robotx = x
@@ -172,36 +290,89 @@ def brain_main(io):
                     print("Robot position remains unchanged.")
             elif cmd == "show":
                 map.showwithrobot()
+            elif cmd == "turns":
+                # toggle between shortest-distance and fastest (turn-aware) routes
+                turn_planning = not turn_planning
+                if turn_planning:
+                    map.set_turn_costs(behaviors)
+                    print("Planning fastest routes (turns cost time).")
+                else:
+                    map.clear_turn_costs()
+                    print("Planning shortest routes.")
+                if map.goal is not None:
+                    map.dijkstra(*map.goal)
+            elif cmd == "timed":
+                # toggle weighting streets by their measured traversal times
+                time_weighting = not time_weighting
+                map.set_time_weighting(time_weighting)
+                print(f"Street costs: {'learned seconds' if time_weighting else 'distance'} "
+                      f"({len(map.street_times)} streets timed).")
+                if map.goal is not None:
+                    map.dijkstra(*map.goal)
+            elif cmd == "sweep":
+                # toggle looking at every unknown street at an intersection
+                # before driving down any of them while exploring
+                sweeping = not sweeping
+                print(f"Exploring: {'sweep each intersection first' if sweeping else 'drive the first unknown street'}.")
+            elif cmd == "beliefs":
+                # toggle keeping evidence per street instead of trusting each reading
+                map.set_beliefs(map.beliefs is None)
+                print(f"Street beliefs: {'on' if map.beliefs is not None else 'off'}.")
+            elif cmd == "tiles":
+                # move the map into tiles on disk, only the part around the
+                # robot stays in memory from here on (save/load as usual)
+                directory = input("Tile directory: ").strip()
+                if directory:
+                    map = TiledMap.from_map(map, directory)
+                    map.flush()
+                    checkpoints = []
+                    checkpoint = map.snapshot()
+                    if turn_planning:
+                        map.set_turn_costs(behaviors)
+                    print(f"Map split into {len(map.intersections.counts)} tiles in {directory}.")
+            elif cmd == "routes":
+                # a map that will only be driven from here on: plan every
+                # goal up front (thrown away again on the first change)
+                if map.precompute_routes(processes=os.cpu_count() or 1):
+                    print("Routes precomputed for all goals.")
             elif cmd == "clear":
                 map.clear_blockages()
                 map.showwithrobot()  # Show the updated map after clearing blockages
 
             if not paused:
                 if exploring:
-                    autonomous_step(map, behaviors)
+                    autonomous_step(map, behaviors, sweeping)
                 elif navigating_to_goal and goal is not None:
                     map.showwithrobot()
                     x, y, current_heading = map.pose()
-                    current_inter = map.getintersection(x, y)
                     
                     # Check if we've reached the goal
-                    if (x, y) == goal:
+                    if (x, y) == goal and tour:
+                        # straight on to the next leg, no stopping
+                        goal = tour.pop(0)
+                        print(f"Reached tour stop, on to ({goal[0]}, {goal[1]}) ({len(tour)} more after it)")
+                        with shared.lock:
+                            shared.goal = goal
+                        map.route_to(goal[0], goal[1])
+                    elif (x, y) == goal:
                         print("Reached goal!")
                         navigating_to_goal = False
                         map.goal = None
                         invalid_goal_reported = False
                     # If goal exists in map, use normal navigation
                     elif goal in map.intersections:
-                        # Check if we have a valid path to the goal
-                        if current_inter.direction is None:
+                        # The map caches the route to its goal and only
+                        # replans after changes, so only plan here if the
+                        # map lost the goal
+                        if map.goal != goal:
                             print("Lost path to goal, replanning...")
-                            map.dijkstra(goal[0], goal[1])
-                        if map.goal is None:
+                            map.route_to(goal[0], goal[1])
+                        print(f"Moving to goal - Position: ({x}, {y}), Heading: {current_heading}")
+                        step_toward_goal(map, behaviors)
+                        # step_toward_goal drops the goal if it can't be reached
+                        if map.goal is None and map.pose()[:2] != goal:
                             print("No valid path found to goal.")
                             navigating_to_goal = False
-                        else:
-                            print(f"Moving to goal - Position: ({x}, {y}), Heading: {current_heading}")
-                            step_toward_goal(map, behaviors)
                     # If goal doesn't exist in map, use directed exploration
                     else:
                         print(f"Exploring toward goal ({goal[0]}, {goal[1]})")
@@ -213,17 +384,31 @@ def brain_main(io):
             if cmd == "step":
                 paused = True
 
+            if map.seq != checkpoint:
+                checkpoints.append(checkpoint)
+                if len(checkpoints) > UNDO_STEPS:
+                    checkpoints.pop(0)
+                    map.trim_journal(checkpoints[0])
+            autosaver.track(map)
+
             x, y, heading = map.pose()
+            route = map.route()  # cached, only replans after map changes
             with shared.lock:
                 shared.robotx = x
                 shared.roboty = y
                 shared.robotheading = heading
+                shared.route = route
 
             map.showwithrobot()
             time.sleep(0.01)
 
     finally:
         drive.stop()
+        autosaver.stop()
+        if isinstance(map, TiledMap):
+            map.intersections.drain()   # tiles dropped from memory are still being written
+        recorder.stop()
+        print(f"Telemetry saved to {recorder.path} ({recorder.dropped} records dropped).")
         io.stop()
         # Explicitly stop the ROS thread
         ctypes.pythonapi.PyThreadState_SetAsyncExc(
@@ -0,0 +1,235 @@
+#
+#   mapfile.py
+#
+#   The map file format used by the save and load commands: a fixed header
+#   followed by the GridMap arrays exactly as they sit in memory, so saving
+#   is a few writes and loading memory-maps the arrays instead of reading
+#   them (pages come in as the map is used).
+#
+#       header      HEADER below: magic b"RMAP", format version, header
+#                   size, bounds (x0, y0, width, height), journal sequence
+#                   number, pose, goal, street time settings, table sizes,
+#                   then (version 2) BELIEFS_HEADER: belief layer on or
+#                   off, its settings and evidence table size
+#       status      int8  [width, height, 8]    STATUS value of each street end
+#       blocked     uint8 [width, height]       bit h set = street h is blocked
+#       exists      bool  [width, height]       intersection has been created
+#       times       TIMES   [n_times]           learned street times
+#       blockages   BLOCKAGES [n_blockages]     when each blocked end was
+#                                               blocked and for how long
+#       evidence    EVIDENCE [n_evidence]       belief evidence per street
+#                                               (version 2)
+#
+#   All little-endian. A reader skips header_size bytes to the arrays, so a
+#   later version can add header fields at the end and still be read here
+#   (and a file from a newer version is refused rather than misread).
+#
+#   Files that don't start with the magic are taken to be maps pickled by
+#   the goals5-goals9 code, and are migrated by an unpickler that only
+#   builds plain records for Map and Intersection (and STATUS members), so
+#   loading an old file can't run anything. Whatever the file, load_map
+#   hands back a GridMap; a TiledMap lives in its tile directory instead,
+#   in files of the same kind that share the tables here (see tiledmap.py).
+#
+import os
+import pickle
+import struct
+import zlib
+
+import numpy as np
+
+from MapBuilding import Map, Intersection, STATUS
+from gridmap import GridMap
+
+MAGIC = b"RMAP"
+VERSION = 2
+HEADER = struct.Struct("<4sHHiiIIqiiiB3xiiddB3xII")
+BELIEFS_HEADER = struct.Struct("<B3xIdd")
+TIMES = np.dtype([('x', '<i4'), ('y', '<i4'), ('heading', '<i4'), ('seconds', '<f8')])
+BLOCKAGES = np.dtype([('x', '<i4'), ('y', '<i4'), ('heading', '<i4'), ('since', '<f8'), ('ttl', '<f8')])
+EVIDENCE = np.dtype([('x', '<i4'), ('y', '<i4'), ('heading', '<i4'),
+                     ('line', '<i4'), ('no_line', '<i4'), ('driven', '<i4')])
+
+
+def street_tables(map):
+    """map's learned times, blockages and belief evidence as TIMES, BLOCKAGES and EVIDENCE arrays."""
+    times = np.array([(x, y, h, seconds) for (x, y, h), seconds in map.street_times.items()], dtype=TIMES)
+    blockages = np.array([(x, y, h, since, ttl) for (x, y, h), (since, ttl) in map.blockages.items()],
+                         dtype=BLOCKAGES)
+    beliefs = map.beliefs
+    evidence = np.array([(x, y, h, *state) for (x, y, h), state in beliefs.evidence.items()]
+                        if beliefs is not None else [], dtype=EVIDENCE)
+    return times, blockages, evidence
+
+
+def restore_street_tables(map, times, blockages, evidence, beliefs):
+    """
+    Put the arrays from street_tables back into map, with a belief layer
+    of settings beliefs, (confidence, prior), or none if that's None.
+    """
+    map.street_times = {(x, y, h): seconds for x, y, h, seconds in times.tolist()}
+    for x, y, h, since, ttl in blockages.tolist():
+        map.blockages[(x, y, h)] = (since, ttl)
+        if ttl != float('inf'):
+            map._expiry.append((since + ttl, x, y, h))
+    map._expiry.sort()
+    if beliefs is not None:
+        from beliefs import Beliefs
+        map.beliefs = Beliefs(*beliefs)
+        map.beliefs.evidence = {(x, y, h): (line, no_line, driven)
+                                for x, y, h, line, no_line, driven in evidence.tolist()}
+
+
+def save_map(map, path):
+    """
+    Write map to path, atomically (a crash leaves the old file intact).
+    Returns the CRC-32 of the file, which pairs a write-ahead log with it
+    (see maplog.py).
+    """
+    grid = map if isinstance(map, GridMap) else GridMap.from_map(map)
+    width, height = grid.exists.shape
+    goal = grid.goal if grid.goal is not None else (0, 0)
+    times, blockages, evidence = street_tables(grid)
+    beliefs = grid.beliefs
+    confidence, prior = beliefs.settings() if beliefs is not None else (0.0, 0.0)
+    header = HEADER.pack(MAGIC, VERSION, HEADER.size + BELIEFS_HEADER.size, grid.x0, grid.y0,
+                         width, height, grid.seq,
+                         grid.x, grid.y, grid.heading, grid.goal is not None, goal[0], goal[1],
+                         grid.street_time, grid.blockage_ttl, grid.time_weighted,
+                         len(times), len(blockages))
+    header += BELIEFS_HEADER.pack(beliefs is not None, len(evidence), confidence, prior)
+    crc = zlib.crc32(header)
+    with open(path + ".tmp", 'wb') as f:
+        f.write(header)
+        for array in (grid.status, grid.blocked_bits, grid.exists, times, blockages, evidence):
+            data = np.ascontiguousarray(array).tobytes()
+            crc = zlib.crc32(data, crc)
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+    return crc
+
+
+def read_header(path):
+    """The header fields of a map file as a dict, None if it isn't one."""
+    with open(path, 'rb') as f:
+        data = f.read(HEADER.size + BELIEFS_HEADER.size)
+    if len(data) < HEADER.size or not data.startswith(MAGIC):
+        return None
+    (_, version, header_size, x0, y0, width, height, seq, x, y, heading, has_goal, gx, gy,
+     street_time, blockage_ttl, time_weighted, n_times, n_blockages) = HEADER.unpack_from(data)
+    if version > VERSION:
+        raise ValueError(f"{path} is map format version {version}, this code reads up to {VERSION}")
+    # version 1 files have no belief layer
+    has_beliefs, n_evidence, confidence, prior = (
+        BELIEFS_HEADER.unpack_from(data, HEADER.size) if version >= 2 else (False, 0, 0.0, 0.0))
+    return {'version': version, 'header_size': header_size, 'x0': x0, 'y0': y0,
+            'width': width, 'height': height, 'seq': seq, 'pose': (x, y, heading),
+            'goal': (gx, gy) if has_goal else None, 'street_time': street_time,
+            'blockage_ttl': blockage_ttl, 'time_weighted': bool(time_weighted),
+            'n_times': n_times, 'n_blockages': n_blockages,
+            'beliefs': (confidence, prior) if has_beliefs else None, 'n_evidence': n_evidence}
+
+
+def load_map(path):
+    """Load a map file (or migrate an old pickled map) into a GridMap."""
+    header = read_header(path)
+    if header is None:
+        return load_legacy(path)
+    width, height = header['width'], header['height']
+    grid = GridMap(width, height)
+    grid.x0, grid.y0 = header['x0'], header['y0']
+
+    # copy-on-write maps: the map can change in memory, the file doesn't
+    offset = header['header_size']
+    arrays = []
+    for dtype, shape in ((np.int8, (width, height, 8)), (np.uint8, (width, height)),
+                         (np.bool_, (width, height))):
+        arrays.append(np.memmap(path, dtype=dtype, mode='c', offset=offset, shape=shape).view(np.ndarray))
+        offset += arrays[-1].nbytes
+    grid.status, grid.blocked_bits, grid.exists = arrays
+
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        times = np.frombuffer(f.read(header['n_times'] * TIMES.itemsize), dtype=TIMES)
+        blockages = np.frombuffer(f.read(header['n_blockages'] * BLOCKAGES.itemsize), dtype=BLOCKAGES)
+        evidence = np.frombuffer(f.read(header['n_evidence'] * EVIDENCE.itemsize), dtype=EVIDENCE)
+    restore_street_tables(grid, times, blockages, evidence, header['beliefs'])
+
+    grid.x, grid.y, grid.heading = header['pose']
+    grid.goal = header['goal']
+    grid.street_time = header['street_time']
+    grid.blockage_ttl = header['blockage_ttl']
+    grid.time_weighted = header['time_weighted']
+    grid.journal_base = header['seq']
+    grid.rebuild_frontier()
+    return grid
+
+
+# Migration from pickled maps. Map and Intersection come back as records
+# holding their pickled state, STATUS members as themselves, and nothing
+# else is allowed: the only callable an old pickle refers to is getattr
+# (how enum members are pickled), which is swapped for a lookup that can
+# only return STATUS members.
+class _Record:
+    def __setstate__(self, state):
+        self.state = state
+
+
+class _MapRecord(_Record):
+    pass
+
+
+class _IntersectionRecord(_Record):
+    pass
+
+
+def _status_member(cls, name):
+    if cls is not STATUS or name not in STATUS.__members__:
+        raise pickle.UnpicklingError(f"not a map status: {name!r}")
+    return STATUS[name]
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    allowed = {
+        ("MapBuilding", "Map"): _MapRecord,
+        ("MapBuilding", "Intersection"): _IntersectionRecord,
+        ("MapBuilding", "STATUS"): STATUS,
+        ("builtins", "getattr"): _status_member,
+        # optional layers pickled along with newer maps, not carried over
+        ("beliefs", "Beliefs"): _Record,
+    }
+
+    def find_class(self, module, name):
+        try:
+            return self.allowed[(module, name)]
+        except KeyError:
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a map file") from None
+
+
+def load_legacy(path):
+    """Migrate a map pickled by the goals5-goals9 code into a GridMap."""
+    with open(path, 'rb') as f:
+        record = _LegacyUnpickler(f).load()
+    if not isinstance(record, _MapRecord) or not isinstance(record.state, dict):
+        raise pickle.UnpicklingError(f"{path} does not hold a map")
+    state = record.state
+
+    map = Map()
+    for (x, y), inter in state['intersections'].items():
+        copy = Intersection(x, y)
+        copy.streets = list(inter.state['streets'])
+        # intersections pickled before blocked flags existed
+        copy.blocked = list(inter.state.get('blocked', [False] * 8))
+        map.intersections[(x, y)] = copy
+    map.x, map.y, map.heading = state['x'], state['y'], state['heading']
+    map.goal = state.get('goal')
+    map.street_times = dict(state.get('street_times', {}))
+    map.street_time = state.get('street_time', map.street_time)
+    map.time_weighted = state.get('time_weighted', False)
+    map.blockage_ttl = state.get('blockage_ttl', map.blockage_ttl)
+    map.blockages = dict(state.get('blockages', {}))
+    map._expiry = list(state.get('_expiry', []))
+    map.journal_base = state.get('journal_base', 0)
+    return GridMap.from_map(map)
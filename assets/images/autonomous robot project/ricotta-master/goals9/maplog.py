@@ -0,0 +1,258 @@
+#
+#   maplog.py
+#
+#   Write-ahead log of map changes, for getting the map back after a power
+#   loss. The autosave thread (see autosave.py) appends every journal event
+#   it is handed to the log as it goes and fsyncs in groups, at most every
+#   commit_interval seconds, so a whole batch of events costs one fsync and
+#   the control loop never waits on one. A rollback (undo) is logged too,
+#   as the events it took back, newest first. Each time the thread writes
+#   a snapshot (the autosave file, seq S) it starts the log afresh at S,
+#   with the CRC-32 of the snapshot file in the header. After a crash the
+#   map is the snapshot with the log's records applied in order on top
+#   (recover()), provided the CRC says the log was started from that very
+#   file: a crash between writing a snapshot and starting its log leaves
+#   the previous log, which goes with the previous snapshot.
+#
+#   File layout, little-endian:
+#
+#       header      magic b"RLOG", format version, header size, base seq
+#                   (the seq of the snapshot, -1 = the log matches no
+#                   snapshot yet and must not be replayed), CRC-32 of the
+#                   snapshot file
+#       records     one per journal event, in order, each its kind's
+#                   struct followed by the CRC-32 of those bytes. The kind
+#                   has UNDO (0x80) added when the event was undone:
+#
+#       ADD         kind 1, x, y
+#       STREET      kind 2, x, y, heading, old status, new status
+#       BLOCKED     kind 3, x, y, heading, old flag, new flag, old stamp
+#                   (since, ttl), new stamp (since, ttl), NaN = no stamp
+#       POSE        kind 4, (x, y, heading) before, (x, y, heading) after
+#       TIME        kind 5, x, y, heading, old seconds, new seconds, NaN =
+#                   never timed
+#       SETTINGS    kind 6, old (time_weighted, street_time, blockage_ttl),
+#                   new (same)
+#       EVIDENCE    kind 7, x, y, heading, old (line, no_line, driven), new
+#                   (same), -1s = no evidence
+#       BELIEFS     kind 8, old (on, confidence, prior), new (same)
+#
+#   Reading stops at the first record that is cut short or fails its CRC:
+#   that is where the last write before the crash broke off.
+#
+import itertools
+import math
+import os
+import struct
+import time
+import zlib
+
+from MapBuilding import STATUS
+from gridmap import GridMap
+from mapfile import load_map
+
+MAGIC = b"RLOG"
+VERSION = 3
+HEADER = struct.Struct("<4sHHqI")
+CRC = struct.Struct("<I")
+ADD, STREET, BLOCKED, POSE, TIME, SETTINGS, EVIDENCE, BELIEFS = 1, 2, 3, 4, 5, 6, 7, 8
+RECORDS = {
+    ADD: struct.Struct("<Bii"),
+    STREET: struct.Struct("<BiiBBB"),
+    BLOCKED: struct.Struct("<BiiBBBdddd"),
+    POSE: struct.Struct("<Biiiiii"),
+    TIME: struct.Struct("<BiiBdd"),
+    SETTINGS: struct.Struct("<BBddBdd"),
+    EVIDENCE: struct.Struct("<BiiBiiiiii"),
+    BELIEFS: struct.Struct("<BBddBdd"),
+}
+STATUSES = list(STATUS)         # index by value: STATUSES[2] is UNEXPLORED
+NONE = (math.nan, math.nan)     # no blockage stamp
+UNDO = 0x80
+NO_EVIDENCE = (-1, -1, -1)
+NO_BELIEFS = (False, 0.0, 0.0)
+
+
+def encode(event, undo=False):
+    kind = event[0]
+    if kind == "add":
+        data = RECORDS[ADD].pack(ADD, event[1], event[2])
+    elif kind == "street":
+        _, x, y, heading, old, new = event
+        data = RECORDS[STREET].pack(STREET, x, y, heading, old.value, new.value)
+    elif kind == "blocked":
+        _, x, y, heading, old, new, old_stamp, new_stamp = event
+        data = RECORDS[BLOCKED].pack(BLOCKED, x, y, heading, old, new,
+                                     *(old_stamp or NONE), *(new_stamp or NONE))
+    elif kind == "pose":
+        data = RECORDS[POSE].pack(POSE, *event[1], *event[2])
+    elif kind == "time":
+        _, x, y, heading, old, new = event
+        data = RECORDS[TIME].pack(TIME, x, y, heading, _seconds(old), _seconds(new))
+    elif kind == "settings":
+        data = RECORDS[SETTINGS].pack(SETTINGS, *event[1], *event[2])
+    elif kind == "evidence":
+        _, x, y, heading, old, new = event
+        data = RECORDS[EVIDENCE].pack(EVIDENCE, x, y, heading, *(old or NO_EVIDENCE), *(new or NO_EVIDENCE))
+    elif kind == "beliefs":
+        data = RECORDS[BELIEFS].pack(BELIEFS, *_layer(event[1]), *_layer(event[2]))
+    else:
+        raise ValueError(f"no log record for {kind!r} events")
+    if undo:
+        data = bytes([data[0] | UNDO]) + data[1:]
+    return data + CRC.pack(zlib.crc32(data))
+
+
+def _seconds(seconds):
+    return math.nan if seconds is None else seconds
+
+
+def _layer(settings):
+    return NO_BELIEFS if settings is None else (True, *settings)
+
+
+def _stamp(since, ttl):
+    return None if math.isnan(since) else (since, ttl)
+
+
+def _evidence(line, no_line, driven):
+    return None if line < 0 else (line, no_line, driven)
+
+
+def decode(fields):
+    kind = fields[0] & ~UNDO
+    if kind == ADD:
+        return ("add", fields[1], fields[2])
+    if kind == STREET:
+        _, x, y, heading, old, new = fields
+        return ("street", x, y, heading, STATUSES[old], STATUSES[new])
+    if kind == BLOCKED:
+        _, x, y, heading, old, new, s0, t0, s1, t1 = fields
+        return ("blocked", x, y, heading, bool(old), bool(new), _stamp(s0, t0), _stamp(s1, t1))
+    if kind == TIME:
+        _, x, y, heading, old, new = fields
+        return ("time", x, y, heading, None if math.isnan(old) else old, None if math.isnan(new) else new)
+    if kind == SETTINGS:
+        _, w0, s0, t0, w1, s1, t1 = fields
+        return ("settings", (bool(w0), s0, t0), (bool(w1), s1, t1))
+    if kind == EVIDENCE:
+        return ("evidence", *fields[1:4], _evidence(*fields[4:7]), _evidence(*fields[7:10]))
+    if kind == BELIEFS:
+        _, on0, c0, p0, on1, c1, p1 = fields
+        return ("beliefs", (c0, p0) if on0 else None, (c1, p1) if on1 else None)
+    return ("pose", tuple(fields[1:4]), tuple(fields[4:7]))
+
+
+def read_log(path):
+    """
+    (base seq, snapshot CRC, records) of a log file, each record (undone,
+    event); (-1, 0, []) if there's no usable log. Logs from before undo
+    records and the snapshot CRC (versions 1 and 2) aren't usable.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return -1, 0, []
+    if len(data) < HEADER.size or not data.startswith(MAGIC):
+        return -1, 0, []
+    _, version, header_size, base, snapshot_crc = HEADER.unpack_from(data)
+    if version > VERSION:
+        raise ValueError(f"{path} is log format version {version}, this code reads up to {VERSION}")
+    if version < 3:
+        return -1, 0, []
+    records = []
+    offset = header_size
+    while offset < len(data):
+        record = RECORDS.get(data[offset] & ~UNDO)
+        end = offset + (record.size if record else 0)
+        if record is None or end + CRC.size > len(data):
+            break
+        if CRC.unpack_from(data, end)[0] != zlib.crc32(data[offset:end]):
+            break
+        records.append((bool(data[offset] & UNDO), decode(record.unpack_from(data, offset))))
+        offset = end + CRC.size
+    return base, snapshot_crc, records
+
+
+def file_crc(path):
+    """CRC-32 of a whole file, as save_map returns it."""
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+class MapLog:
+    """Append side of the log, used from the autosave thread only."""
+
+    def __init__(self, path, commit_interval=0.05):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.file = None
+        self.pending = False        # written but not yet fsynced
+        self.last_sync = time.time()
+        self.syncs = 0
+
+    def start(self, base, snapshot_crc=0):
+        """Begin a new, empty log on top of the snapshot at seq base (-1 = none)."""
+        self.close()
+        with open(self.path + ".tmp", 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, HEADER.size, base, snapshot_crc))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".tmp", self.path)
+        self.file = open(self.path, 'ab')
+
+    def append(self, events, undo=False):
+        """Log events in the order applied, or undone (events given oldest first)."""
+        if undo:
+            events = reversed(events)
+        self.file.write(b"".join(encode(event, undo) for event in events))
+        self.pending = True
+
+    def commit_due(self):
+        """Seconds until the pending records should be fsynced, None if none are."""
+        if not self.pending:
+            return None
+        return max(0.0, self.last_sync + self.commit_interval - time.time())
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = False
+        self.last_sync = time.time()
+        self.syncs += 1
+
+    def close(self):
+        if self.file is not None:
+            if self.pending:
+                self.sync()
+            self.file.close()
+            self.file = None
+
+
+def recover(snapshot_path, log_path):
+    """
+    The map as it was at the last logged change: the snapshot (a new
+    GridMap if there is none) with the logged records applied. Returns
+    (map, records applied).
+    """
+    if not os.path.exists(snapshot_path):
+        return GridMap(), 0
+    map = load_map(snapshot_path)
+    base, snapshot_crc, records = read_log(log_path)
+    if base != map.seq or snapshot_crc != file_crc(snapshot_path):
+        return map, 0   # the log doesn't start from this snapshot
+    # runs of events applied or undone alike; neither is journaled again,
+    # so the sequence number is moved along by hand
+    for undone, run in itertools.groupby(records, key=lambda record: record[0]):
+        events = [event for _, event in run]
+        if undone:
+            map.undo(events[::-1])
+            map.journal_base -= len(events)
+        else:
+            map.replay(events)
+            map.journal_base += len(events)
+    return map, len(records)
@@ -0,0 +1,115 @@
+#
+#   mapmerge.py
+#
+#   Merge two maps of the same area, e.g. from separate runs, into one
+#   (see Map.merge). The second map is shifted by an offset onto the
+#   first's coordinates, then every street end takes the most informative
+#   status either map has for it:
+#
+#       CONNECTED > DEADEND > UNEXPLORED > NONEXISTENT > UNKNOWN
+#
+#   which is exactly the order of the STATUS values, so the merge is an
+#   elementwise maximum over [intersections, 8] arrays of status values.
+#   Both maps are turned into arrays (a GridMap already is one), the
+#   intersections lined up with one np.unique, and the result written
+#   straight into a new map of the first map's type. A tiled first map
+#   gets a tiled result in a tile directory of its own, which has to be
+#   given: writing it into the first map's directory would overwrite the
+#   tiles that map still reads from.
+#
+#   Only the first map's blockages, pose and settings carry over: the
+#   other run's blockages are long gone. Learned street times are pooled,
+#   the first map's estimate winning where both timed a street.
+#
+import os
+
+import numpy as np
+
+from MapBuilding import Intersection, STATUS
+from gridmap import GridMap
+
+STATUSES = list(STATUS)         # index by value: STATUSES[2] is UNEXPLORED
+
+
+# (keys [N, 2], status values [N, 8], blocked bits [N]) of a map
+def _arrays(map):
+    if isinstance(map, GridMap):
+        xs, ys = np.nonzero(map.exists)
+        keys = np.stack([xs + map.x0, ys + map.y0], axis=1)
+        return keys, map.status[xs, ys], map.blocked_bits[xs, ys]
+    items = list(map.intersections.items())
+    keys = np.array([key for key, _ in items], dtype=np.int64).reshape(-1, 2)
+    status = np.array([[s.value for s in inter.streets] for _, inter in items], dtype=np.int8).reshape(-1, 8)
+    blocked = np.array([sum(1 << h for h in range(8) if inter.blocked[h]) for _, inter in items],
+                       dtype=np.uint8)
+    return keys, status, blocked
+
+
+def merge_maps(base, other, offset=(0, 0), directory=None):
+    """
+    A new map with everything base and other (shifted by offset) know,
+    in tile directory directory if base is a TiledMap. Returns (map,
+    conflicts), conflicts being how many street ends the two maps knew
+    differently.
+    """
+    from tiledmap import TiledMap
+    if isinstance(base, TiledMap):
+        if directory is None:
+            raise ValueError("merging into a tiled map needs a tile directory for the result")
+        if os.path.abspath(directory) == base.intersections.directory:
+            raise ValueError(f"{directory} holds the tiles being merged, the result needs another directory")
+    keys_a, status_a, blocked_a = _arrays(base)
+    keys_b, status_b, _ = _arrays(other)
+    keys_b = keys_b + np.array(offset, dtype=np.int64)
+
+    keys, inverse = np.unique(np.concatenate([keys_a, keys_b]), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    ia, ib = inverse[:len(keys_a)], inverse[len(keys_a):]
+
+    status = np.zeros((len(keys), 8), dtype=np.int8)
+    status[ia] = status_a
+    known = status[ib]
+    conflicts = int(np.count_nonzero((known != 0) & (status_b != 0) & (known != status_b)))
+    status[ib] = np.maximum(known, status_b)
+    blocked = np.zeros(len(keys), dtype=np.uint8)
+    blocked[ia] = blocked_a
+
+    if isinstance(base, GridMap):
+        merged = _grid_from_arrays(type(base), keys, status, blocked)
+    else:
+        if isinstance(base, TiledMap):
+            merged = TiledMap(directory, base.intersections.size, base.max_tiles)
+        else:
+            merged = type(base)()
+        for (x, y), row, bits in zip(keys.tolist(), status.tolist(), blocked.tolist()):
+            inter = Intersection(x, y)
+            inter.streets = [STATUSES[v] for v in row]
+            inter.blocked = [bool(bits >> h & 1) for h in range(8)]
+            merged.intersections[(x, y)] = inter
+
+    merged.x, merged.y, merged.heading = base.pose()
+    merged.street_time = base.street_time
+    merged.time_weighted = base.time_weighted
+    merged.blockage_ttl = base.blockage_ttl
+    merged.blockages = dict(base.blockages)
+    merged._expiry = list(base._expiry)
+    merged._blocked_hash = base._blocked_hash
+    dx, dy = offset
+    merged.street_times = {(x + dx, y + dy, h): seconds for (x, y, h), seconds in other.street_times.items()}
+    merged.street_times.update(base.street_times)
+    merged.rebuild_frontier()
+    return merged, conflicts
+
+
+def _grid_from_arrays(cls, keys, status, blocked):
+    if not len(keys):
+        return cls()
+    lo = keys.min(axis=0) - 1
+    width, height = keys.max(axis=0) - lo + 2
+    grid = cls(int(width), int(height))
+    grid.x0, grid.y0 = int(lo[0]), int(lo[1])
+    ix, iy = keys[:, 0] - lo[0], keys[:, 1] - lo[1]
+    grid.exists[ix, iy] = True
+    grid.status[ix, iy] = status
+    grid.blocked_bits[ix, iy] = blocked
+    return grid
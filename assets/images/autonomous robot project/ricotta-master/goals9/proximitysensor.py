@@ -3,6 +3,8 @@ import pigpio
 import math
 import threading
 
+from telemetry import PROXIMITY
+
 class Ultrasound:
     # Initialization
     def __init__(self, io, pintrig, pinecho):
@@ -51,7 +53,8 @@ class Ultrasound:
         return self.delta_t
 
 class ProximitySensor:
-    def __init__(self, io):
+    def __init__(self, io, recorder=None):
+        self.recorder = recorder  # optional telemetry.Recorder, records every read_all
         left_pingtrig = 13
         left_pingecho = 16
 
@@ -88,7 +91,10 @@ class ProximitySensor:
         self.right.trigger()
 
     def read_all(self):
-        return (self.left.read(), self.middle.read(), self.right.read())
+        distances = (self.left.read(), self.middle.read(), self.right.read())
+        if self.recorder is not None:
+            self.recorder.record(PROXIMITY, *(math.nan if d is None else d for d in distances))
+        return distances
     
     def read_all_delta_t(self):
         return (self.left.read_delta_t(), self.middle.read_delta_t(), self.right.read_delta_t())
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+#
+#   replay.py
+#
+#   Run the real Behaviors code (follow_line, pull_forward, turning_behavior
+#   and the detectors under them) again over a recorded telemetry file (see
+#   telemetry.py), with different thresholds if you like, and see what it
+#   would have detected. No robot, no waiting: the clock is virtual, so a
+#   ten minute run replays in a second or so.
+#
+#   Behaviors marks where each behavior started and ended in the recording.
+#   Each one is replayed from its start mark with the same Behaviors object
+#   throughout, so detector state carries over from one to the next the
+#   way it did on the robot. The sensors hand back the recorded readings
+#   in order, one per read, each read moving the clock up to the time that
+#   reading was taken; sleep() just moves the clock on (skipping readings
+#   the robot took while the code was asleep). Replayed with the recorded
+#   settings, the code makes the same reads at the same times as on the
+#   robot, so it comes to the same outcomes. With other settings it may
+#   stop sooner, or want readings past the end mark, in which case the
+#   behavior is reported as running past the end of what was recorded.
+#
+#   Run:   python3 replay.py telemetry-20250101-120000.bin
+#          python3 replay.py run.bin --set t_intersection=0.25 --set TIME_WEIGHT=0.5
+#
+import argparse
+import bisect
+import contextlib
+import io
+import math
+import time
+
+from street_behaviors import Behaviors
+from telemetry import TelemetryReader, LINE, ANGLE, PROXIMITY, MARK, FOLLOW, PULL, BEHAVIORS
+
+FOLLOW_OUTCOMES = {1: "intersection", 2: "end"}
+
+
+# raised by a sensor asked for a reading past the end of the behavior
+class EndOfSegment(Exception):
+    pass
+
+
+class VirtualClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+# the recorded readings of one channel, handed out in order
+class Playback:
+    def __init__(self, clock, times, values):
+        self.clock = clock
+        self.times = times
+        self.values = values
+        self.next = 0
+        self.stop = 0
+
+    def seek(self, start, end):
+        """Hand out the readings with start <= t <= end from now on."""
+        self.next = bisect.bisect_left(self.times, start)
+        self.stop = bisect.bisect_right(self.times, end)
+
+    def read(self):
+        # the first reading taken at or after the clock's time
+        i = bisect.bisect_left(self.times, self.clock.now, self.next, max(self.next, self.stop))
+        if i >= self.stop:
+            raise EndOfSegment()
+        self.next = i + 1
+        self.clock.now = max(self.clock.now, self.times[i])
+        return self.values[i]
+
+
+class ReplayLineSensor:
+    def __init__(self, playback):
+        self.playback = playback
+
+    def read(self):
+        L, M, R, _ = self.playback.read()
+        return int(L), int(M), int(R)
+
+
+class ReplayAngleSensor:
+    def __init__(self, playback):
+        self.playback = playback
+
+    def read_angle(self):
+        return self.playback.read()[0]
+
+
+class ReplayProximitySensor:
+    def __init__(self, playback):
+        self.playback = playback
+
+    def read_all(self):
+        return tuple(None if math.isnan(d) else d for d in self.playback.read()[:3])
+
+
+# the replayed code's motor commands go nowhere
+class ReplayDrive:
+    def stop(self):
+        pass
+
+    def drive(self, mode, reverse=False):
+        pass
+
+    def pwm(self, PWM_L, PWM_R):
+        pass
+
+
+def segments(reader):
+    """(behavior, start t, end t, outcome, direction) of each recorded behavior."""
+    found = []
+    started = None
+    for record in reader.read(channel=MARK).tolist():
+        t, (behavior, ended, outcome, direction) = record[1], record[4]
+        if not ended:
+            started = (int(behavior), t)
+        elif started is not None and started[0] == behavior:
+            found.append((int(behavior), started[1], t, int(outcome), int(direction)))
+            started = None
+    return found
+
+
+def describe(behavior, outcome):
+    if outcome is None:
+        return "(past end)"
+    if behavior == FOLLOW:
+        return FOLLOW_OUTCOMES.get(outcome, str(outcome))
+    if behavior == PULL:
+        return "street" if outcome else "no street"
+    return f"{outcome:+d} x 45"
+
+
+def replay(path, settings=None, verbose=False):
+    """
+    Replay every behavior recorded in the telemetry file at path, with the
+    Behaviors attributes in settings changed. Returns one (behavior, start
+    t, recorded outcome, replayed outcome, replay duration, last_turn) per
+    behavior, replayed outcome None if it ran past the end of the recording.
+    """
+    reader = TelemetryReader(path)
+    clock = VirtualClock()
+    channels = {}
+    for channel in (LINE, ANGLE, PROXIMITY):
+        records = reader.read(channel=channel)
+        channels[channel] = Playback(clock, records['t'].tolist(), records['values'].tolist())
+
+    behaviors = Behaviors(None, ReplayDrive(), ReplayLineSensor(channels[LINE]),
+                          ReplayAngleSensor(channels[ANGLE]), ReplayProximitySensor(channels[PROXIMITY]),
+                          clock=clock.time, sleep=clock.sleep)
+    for name, value in (settings or {}).items():
+        if not hasattr(behaviors, name):
+            raise AttributeError(f"Behaviors has no setting {name!r}")
+        setattr(behaviors, name, value)
+
+    results = []
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        for behavior, start, end, recorded, direction in segments(reader):
+            clock.now = start
+            for playback in channels.values():
+                playback.seek(start, end)
+            behaviors.last_turn = None
+            try:
+                if behavior == FOLLOW:
+                    outcome = {"intersection": 1, "end": 2}[behaviors.follow_line()]
+                elif behavior == PULL:
+                    outcome = int(behaviors.pull_forward())
+                else:
+                    outcome = behaviors.turning_behavior("left" if direction > 0 else "right")[0]
+            except EndOfSegment:
+                outcome = None
+            results.append((behavior, start, recorded, outcome, clock.now - start, behaviors.last_turn))
+    return results
+
+
+def parse_setting(text):
+    name, _, value = text.partition("=")
+    if not value:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text!r}")
+    return name, float(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded behaviors through the detector code")
+    parser.add_argument("path", help="telemetry file recorded by mainthread")
+    parser.add_argument("--set", dest="settings", type=parse_setting, action="append", default=[],
+                        metavar="NAME=VALUE",
+                        help="change a Behaviors setting, e.g. t_intersection=0.25 or TIME_WEIGHT=0.5")
+    parser.add_argument("--all", action="store_true", help="list every behavior, not just the changed ones")
+    parser.add_argument("--verbose", action="store_true", help="show what the behaviors print")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    try:
+        results = replay(args.path, dict(args.settings), args.verbose)
+    except AttributeError as e:
+        parser.error(str(e))
+    seconds = time.perf_counter() - t0
+
+    if not results:
+        print("No behaviors recorded in this file.")
+        raise SystemExit
+    first = results[0][1]
+    changed = 0
+    print(f"{'#':>4} {'t':>8} {'behavior':<8} {'recorded':<13} {'replayed':<13} {'turn (time / mag / weighted)'}")
+    for n, (behavior, start, recorded, outcome, duration, turn) in enumerate(results):
+        differs = outcome != recorded
+        changed += differs
+        if not (differs or args.all):
+            continue
+        detail = "" if turn is None else f"{turn[1]:7.1f} {turn[2]:7.1f} {turn[3]:7.1f}"
+        print(f"{n:>4} {start - first:8.2f} {BEHAVIORS[behavior]:<8} {describe(behavior, recorded):<13} "
+              f"{describe(behavior, outcome):<13} {detail}{'  *' if differs else ''}")
+    driven = results[-1][1] + results[-1][4] - first
+    print(f"{len(results)} behaviors, {changed} came out differently; "
+          f"{driven:.1f} s of driving replayed in {seconds:.2f} s")
@@ -8,8 +8,10 @@
 #   Node:       /PINAME         (this will use your Pi's name)
 #
 #   Publish:    ~/pose                  geometry_msgs/Pose
+#   Publish:    ~/route                 std_msgs/String (JSON list of headings)
 #   Subscribe:  ~/goal                  geometry_msgs/Point
 #   Subscribe:  ~/explore               std_msgs/Empty
+#   Subscribe:  ~/tour                  std_msgs/String (JSON list of [x, y])
 #
 import ctypes
 import os
@@ -45,12 +47,14 @@ class ROSNode(Node):
 
         # Create the publisher for the pose information.
         self.pub = self.create_publisher(Pose, '~/pose', 10)
+        self.pub_route = self.create_publisher(String, '~/route', 10)
 
         # Then create subscribers for goal and explore commands.
         self.create_subscription(Point, '~/goal',    self.cb_goal,    10)
         self.create_subscription(Empty, '~/explore', self.cb_explore, 10)
         self.create_subscription(String, '~/dicts' , self.cb_dicts, 10)
         self.create_subscription(UInt32, '~/fetch' , self.cb_fetch, 10)
+        self.create_subscription(String, '~/tour'  , self.cb_tour, 10)
 
 
         # Finally create a timer to drive the node.
@@ -73,6 +77,7 @@ class ROSNode(Node):
             posx  = self.shared.robotx
             posy  = self.shared.roboty
             head  = self.shared.robotheading
+            route = self.shared.route
             self.shared.release()
 
         # Convert the heading into an angle (in radians).
@@ -88,6 +93,9 @@ class ROSNode(Node):
         #z is the angle of 
         self.pub.publish(msg)
 
+        # And the planned route, straight from the map's route cache.
+        self.pub_route.publish(String(data=json.dumps(route)))
+
 
     # Goal command callback.
     def cb_goal(self, msg):
@@ -104,6 +112,23 @@ class ROSNode(Node):
             self.shared.command = "goal"
             self.shared.goal = (int(xgoal), int(ygoal))
 
+    # Tour command callback.  Visit a list of goals in the best order.
+    def cb_tour(self, msg):
+        # Expect a JSON list of [x, y] pairs, ignore anything else.
+        try:
+            stops = [(int(x), int(y)) for x, y in json.loads(msg.data)]
+        except (ValueError, TypeError) as e:
+            self.get_logger().error("Ignoring tour command %r: %s" % (msg.data, e))
+            return
+
+        # Report.
+        self.get_logger().info("Received tour command (%d stops)" % len(stops))
+
+        # Inject the tour command just like the UI thread would.
+        with self.shared.lock:
+            self.shared.command = "tour"
+            self.shared.tour = stops
+
     # Explore command callback.
     def cb_explore(self, msg):
         # Report.
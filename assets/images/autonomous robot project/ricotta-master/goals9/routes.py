@@ -0,0 +1,103 @@
+#
+#   routes.py
+#
+#   Planning over several goals at once.
+#
+#   plan_tour() orders a list of stops so the robot visits them all in as
+#   little driving as it can: nearest neighbour to get a tour, then 2-opt
+#   (reverse a stretch of the tour whenever that makes it cheaper) until no
+#   reversal helps. Costs are real Map path costs, one forward search
+#   (Map.reach_costs) per stop, so blockages, dead ends and time weighting
+#   all count. The tour starts at the robot and doesn't come back.
+#
+INF = float('inf')
+
+
+# cost[i][j] = path cost from points[i] to points[j], one search per point
+def cost_matrix(map, points):
+    matrix = []
+    for x, y in points:
+        reach = map.reach_costs(x, y)
+        matrix.append([reach.get(point, INF) for point in points])
+    return matrix
+
+
+# total cost of visiting points in the given order (order[0] is the start)
+def tour_cost(matrix, order):
+    return sum(matrix[a][b] for a, b in zip(order, order[1:]))
+
+
+def nearest_neighbour(matrix):
+    order = [0]
+    left = set(range(1, len(matrix)))
+    while left:
+        here = order[-1]
+        nxt = min(left, key=lambda j: (matrix[here][j], j))
+        order.append(nxt)
+        left.remove(nxt)
+    return order
+
+
+def two_opt(matrix, order):
+    # Costs can differ by direction (a street open at one end only), so a
+    # reversed stretch is re-costed as a whole rather than by its two ends.
+    best = tour_cost(matrix, order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(order) - 1):
+            for j in range(i + 1, len(order)):
+                candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                cost = tour_cost(matrix, candidate)
+                if cost < best - 1e-9:
+                    order, best = candidate, cost
+                    improved = True
+    return order
+
+
+def plan_tour(map, start, stops):
+    """
+    Order stops for a tour starting at start. Returns (tour, cost,
+    received_cost, unreachable): the stops in driving order, the tour's
+    cost, the cost of visiting the toured stops in the order given, and
+    the stops left off the tour, because they can't be reached from start
+    at all or there's no way on from them to the rest of the tour.
+    """
+    # drop repeats (and the start itself) but keep the order received
+    seen = {start}
+    unique = []
+    for stop in stops:
+        if stop not in seen:
+            seen.add(stop)
+            unique.append(stop)
+
+    points = [start] + unique
+    matrix = cost_matrix(map, points)
+
+    # a stop the robot can't get to can't be on the tour
+    unreachable = [points[i] for i in range(1, len(points)) if matrix[0][i] == INF]
+    keep = [0] + [i for i in range(1, len(points)) if points[i] not in unreachable]
+    matrix = [[matrix[a][b] for b in keep] for a in keep]
+    points = [points[i] for i in keep]
+
+    # Streets open at one end only can make a stop reachable from start but
+    # not from the stops around it. Plan with a leg that can't be driven
+    # costing more than all the others together, so the tour has as few of
+    # them as it can, then leave out the stop the first one leaves from
+    # (never start: every stop left can be reached from there) and plan
+    # again, until the tour can be driven.
+    while True:
+        worst = 1 + sum(cost for row in matrix for cost in row if cost != INF)
+        capped = [[worst if cost == INF else cost for cost in row] for row in matrix]
+        order = two_opt(capped, nearest_neighbour(capped))
+        stuck = next((a for a, b in zip(order, order[1:]) if matrix[a][b] == INF), None)
+        if stuck is None:
+            break
+        unreachable.append(points[stuck])
+        keep = [i for i in range(len(points)) if i != stuck]
+        matrix = [[matrix[a][b] for b in keep] for a in keep]
+        points = [points[i] for i in keep]
+
+    received = list(range(len(points)))
+    return ([points[i] for i in order[1:]], tour_cost(matrix, order),
+            tour_cost(matrix, received), unreachable)
@@ -0,0 +1,98 @@
+#
+#   routetable.py
+#
+#   All-pairs route table for a map that is only being driven, not explored.
+#   For every goal g the table holds the exact cost/direction field that
+#   Map.dijkstra(g) would compute, one column per goal:
+#
+#       dist        float64 [N, N]  dist[i, g] = cost from intersection i to g
+#       next_hop    int8    [N, N]  heading to leave i by toward g, -1 = None
+#
+#   The columns come from running the map's own search once per goal, so a
+#   lookup gives the very same field (ties included) as a fresh search would.
+#   With several processes the goals are split across a multiprocessing
+#   pool, each worker holding its own copy of the map. The workers are
+#   spawned, not forked: the robot has threads running by the time anyone
+#   asks for a table (UI, ROS, telemetry), and a forked child inherits
+#   whatever locks those held at that moment.
+#
+#   Building costs N full searches and the table holds N^2 entries (9 bytes
+#   each), so Map.precompute_routes() refuses maps above a size limit.
+#
+import multiprocessing
+
+import numpy as np
+
+POOL_MIN_INTERSECTIONS = 200
+
+
+class RouteTable:
+    def __init__(self, keys, dist, next_hop):
+        self.keys = keys
+        self.index = {key: i for i, key in enumerate(keys)}
+        self.dist = dist
+        self.next_hop = next_hop
+
+    def __contains__(self, goal):
+        return goal in self.index
+
+    def column(self, goal):
+        """(costs, directions) toward goal, in the order of self.keys."""
+        g = self.index[goal]
+        return self.dist[:, g], self.next_hop[:, g]
+
+    def cost(self, start, goal):
+        return float(self.dist[self.index[start], self.index[goal]])
+
+    def nbytes(self):
+        return self.dist.nbytes + self.next_hop.nbytes
+
+    @classmethod
+    def build(cls, map, processes=1):
+        keys = sorted(map.intersections.keys())
+        n = len(keys)
+        dist = np.empty((n, n))
+        next_hop = np.empty((n, n), dtype=np.int8)
+
+        # small maps solve faster than a pool starts up
+        if processes > 1 and n >= POOL_MIN_INTERSECTIONS:
+            # hand each worker every processes-th goal
+            chunks = [keys[i::processes] for i in range(processes)]
+            context = multiprocessing.get_context("spawn")
+            with context.Pool(processes, initializer=_init_worker, initargs=(map, keys)) as pool:
+                results = pool.map(_solve_goals, chunks)
+            index = {key: i for i, key in enumerate(keys)}
+            for goals, (costs, directions) in zip(chunks, results):
+                cols = [index[goal] for goal in goals]
+                dist[:, cols] = costs
+                next_hop[:, cols] = directions
+        else:
+            costs, directions = _solve(map, keys, keys)
+            dist[...] = costs
+            next_hop[...] = directions
+        return cls(keys, dist, next_hop)
+
+
+# run the map's search toward each goal and collect the fields as columns.
+# The map's own goal/field are trashed in the process, callers restore them.
+def _solve(map, keys, goals):
+    costs = np.empty((len(keys), len(goals)))
+    directions = np.empty((len(keys), len(goals)), dtype=np.int8)
+    for j, goal in enumerate(goals):
+        map._search_from_goal(*goal)
+        costs[:, j], directions[:, j] = map._field_for(keys)
+    return costs, directions
+
+
+_worker_map = None
+_worker_keys = None
+
+
+def _init_worker(map, keys):
+    global _worker_map, _worker_keys
+    _worker_map = map
+    _worker_keys = keys
+
+
+def _solve_goals(goals):
+    return _solve(_worker_map, _worker_keys, goals)
@@ -1,10 +1,6 @@
 import time
 import traceback
-import pigpio
-from DriveSystem import DriveSystem
-from Sense import LineSensor
-from AngleSensor import AngleSensor
-from proximitysensor import ProximitySensor
+from telemetry import MARK, FOLLOW, PULL, TURN
 import math
 
 class Behaviors:
@@ -24,11 +20,17 @@ class Behaviors:
     TIME_WEIGHT = 0.3     # Weight for time-based prediction
     ANGLE_WEIGHT = 0.7     # Weight for magnetometer reading
     
-    def __init__(self, io, drive, sensor, AngleSensor, proximity_sensor=None):
+    def __init__(self, io, drive, sensor, AngleSensor, proximity_sensor=None, recorder=None,
+                 clock=time.time, sleep=time.sleep):
         self.drive = drive
         self.sensor = sensor
         self.AngleSensor = AngleSensor
         self.proximity_sensor = proximity_sensor  # Add proximity sensor
+        # optional telemetry.Recorder, marks where each behavior starts and ends
+        self.recorder = recorder
+        # where the time comes from: replay.py swaps in a virtual clock
+        self.clock = clock
+        self.sleep = sleep
     
         # Deadend detection parameters
         self.lost_line_time = 0
@@ -40,7 +42,7 @@ class Behaviors:
         side_threshold = 0.30  # Increased from 0.05 to be more tolerant of wobbling
 
         # Timers and states for detectors
-        self.tlast = time.time()
+        self.tlast = self.clock()
 
         self.intersection_level = 0.0
         self.intersection_state = False
@@ -55,10 +57,20 @@ class Behaviors:
         self.t_side = t_side
         self.side_threshold = side_threshold
 
+        # How long the last complete street took in follow_line (seconds,
+        # not counting obstacle waits), or None if it ended at a dead end
+        self.last_traversal_time = None
+
         # Turning Behavior
         self.turn_level = 0.0
         self.t_spin = 0.1
         self.on_path = False
+        # (elapsed, time-based, magnetometer, weighted angle) of the last turn
+        self.last_turn = None
+
+    def mark(self, behavior, ended, outcome=0, direction=0):
+        if self.recorder is not None:
+            self.recorder.record(MARK, behavior, ended, outcome, direction)
 
     def reset_filters(self):
         self.intersection_level = 0.0
@@ -84,7 +96,7 @@ class Behaviors:
             return 0.0
         
     def update_detectors(self, L, M, R):
-        tnow = time.time()
+        tnow = self.clock()
         dt = tnow - self.tlast
         self.tlast = tnow
 
@@ -132,8 +144,13 @@ class Behaviors:
         Follow the line, but stop if the forward proximity sensor detects an obstacle closer than block_threshold_cm.
         Wait until the path is clear (distance > clear_threshold_cm) before resuming.
         """
+        self.mark(FOLLOW, 0)
         self.lost_line_time = 0  # Reset timer when starting to follow line
         waiting_for_clear = False
+        self.last_traversal_time = None
+        t_start = self.clock()
+        t_waiting = 0.0  # time spent stopped for obstacles
+        wait_start = None
 
         while True:
             # --- Scan ahead for obstacles ---
@@ -146,13 +163,15 @@ class Behaviors:
                         print(f"Obstacle detected ahead at {middle:.1f} cm! Stopping robot before collision.")
                         self.drive.stop()
                         waiting_for_clear = True
+                        wait_start = self.clock()
                         # Do not update detectors while stopped
-                        time.sleep(0.05)
+                        self.sleep(0.05)
                         continue
                     elif waiting_for_clear:
                         if middle > clear_threshold_cm:
                             print(f"Path ahead is now clear at {middle:.1f} cm. Resuming line following.")
                             waiting_for_clear = False
+                            t_waiting += self.clock() - wait_start
                         else:
                             # Still blocked, keep waiting
                             continue
@@ -160,7 +179,7 @@ class Behaviors:
             if waiting_for_clear:
                 # If for some reason we get here, just wait
                 self.drive.stop()
-                time.sleep(0.05)
+                self.sleep(0.05)
                 continue
 
             # --- Normal line following logic ---
@@ -173,7 +192,9 @@ class Behaviors:
                 self.reset_filters()
                 self.lost_line_time = 0
                 print(self.intersection_level)
-                time.sleep(0.05)  # Add back a small delay to ensure stable state transition
+                self.last_traversal_time = self.clock() - t_start - t_waiting
+                self.sleep(0.05)  # Add back a small delay to ensure stable state transition
+                self.mark(FOLLOW, 1, 1)
                 return "intersection"
 
             elif self.end_state:
@@ -181,6 +202,7 @@ class Behaviors:
                 print("End of street detected!")
                 self.reset_filters()
                 self.lost_line_time = 0
+                self.mark(FOLLOW, 1, 2)
                 return "end"
 
             elif (L, M, R) == (0, 0, 0):
@@ -192,6 +214,7 @@ class Behaviors:
                     print(f"Line lost for {self.lost_line_time:.1f} seconds - treating as deadend!")
                     self.reset_filters()
                     self.lost_line_time = 0
+                    self.mark(FOLLOW, 1, 2)
                     return "end"
                 # Attempt to find the line based on side state
                 if self.side_state == "left":
@@ -214,18 +237,19 @@ class Behaviors:
                 action = feedback.get((L, M, R), "straight")
                 self.drive.drive(action)
 
-            time.sleep(0.01)
+            self.sleep(0.01)
 
     def pull_forward(self):
-        t0 = time.time()
+        self.mark(PULL, 0)
+        t0 = self.clock()
         self.reset_filters()  # Reset any previous detector values
-        self.tlast = time.time()
+        self.tlast = self.clock()
         self.end_level = 0.0
         self.end_state = False
 
         while True:
 
-            tnow = time.time()
+            tnow = self.clock()
             dt = tnow - self.tlast
             self.tlast = tnow
             
@@ -241,17 +265,18 @@ class Behaviors:
             elif self.end_level < self.THRESHOLD_LOW:
                 self.end_state = False
 
-            tnow = time.time()
+            tnow = self.clock()
             self.drive.drive("straight")
             if tnow >= t0 + self.PULL_FORWARD_DURATION:
                 break
-            time.sleep(0.01)
+            self.sleep(0.01)
         self.drive.stop()
         print(self.end_level)
         
         result = self.end_level > self.PULL_FORWARD_THRESHOLD
         
         self.reset_filters()
+        self.mark(PULL, 1, int(result))
 
         return result
 
@@ -265,13 +290,14 @@ class Behaviors:
         c = self.TURN_COEFF_C - target_angle
         
         # Quadratic formula: (-b ± sqrt(b² - 4ac)) / (2a)
-        # Since a is negative and we want positive time, use the smaller root
+        # Since a is negative, the smaller (physical) root is the + one; the
+        # - one is on the far side of the parabola's peak (~5.5 s)
         discriminant = b*b - 4*a*c
         if discriminant < 0:
             print(f"Warning: No real solution for angle {target_angle}°")
             return 1.0  # Default fallback time
             
-        time = (-b - math.sqrt(discriminant)) / (2*a)
+        time = (-b + math.sqrt(discriminant)) / (2*a)
         return max(0.0, time)
 
     def predict_angle_from_time(self, time):
@@ -296,15 +322,38 @@ class Behaviors:
             
         return base_angle * scale
 
+    def estimate_turn(self, choice, elapsed, cumulative_angle):
+        """
+        How far a turn went, from how long the spin took and how far the
+        magnetometer says it went: the weighted average of the two, rounded
+        to 45° steps. Returns (steps, time-based, magnetometer and weighted
+        angle), signed, left positive.
+        """
+        time_based_angle = self.predict_angle_from_time(elapsed)
+        if choice == "right":
+            time_based_angle = -time_based_angle
+            magnetometer_angle = -abs(cumulative_angle)
+        else:
+            magnetometer_angle = abs(cumulative_angle)
+
+        # Calculate weighted average of the two measurements
+        weighted_angle = (self.TIME_WEIGHT * time_based_angle +
+                        self.ANGLE_WEIGHT * magnetometer_angle)
+
+        # Round the average to nearest 45° increment
+        num_increments = round(weighted_angle / 45.0)
+        return num_increments, time_based_angle, magnetometer_angle, weighted_angle
+
     def turning_behavior(self, choice):
         print(f"Starting turning behavior: {choice}")
+        self.mark(TURN, 0, 0, 1 if choice == "left" else -1)
         
         # Reset turn detector
         self.turn_level = 0.0
-        self.tlast = time.time()
+        self.tlast = self.clock()
         
         # Track angle using magnetometer
-        t_start = time.time()
+        t_start = self.clock()
         prev_angle = self.AngleSensor.read_angle()
         cumulative_angle = 0.0
         
@@ -345,7 +394,7 @@ class Behaviors:
                 raw = 1.0 if M == 1 else 0.0
                 
             # Update turn detector
-            tnow = time.time()
+            tnow = self.clock()
             dt = tnow - self.tlast
             self.tlast = tnow
             self.turn_level += dt / self.t_spin * (raw - self.turn_level)
@@ -363,29 +412,17 @@ class Behaviors:
         # Done turning
         self.drive.stop()
         
-        # Calculate time and time-based prediction before realignment
-        t_end = time.time()
+        # Calculate time before realignment
+        t_end = self.clock()
         elapsed = t_end - t_start
-        time_based_angle = self.predict_angle_from_time(elapsed)
-        if choice == "right":
-            time_based_angle = -time_based_angle
             
         # Realign to center of line
         self.realign(choice)
         
-        # Get final magnetometer reading after realignment
-        if choice == "right":
-            magnetometer_angle = -abs(cumulative_angle)
-        else:
-            magnetometer_angle = abs(cumulative_angle)
-            
-        # Calculate weighted average of the two measurements
-        weighted_angle = (self.TIME_WEIGHT * time_based_angle + 
-                        self.ANGLE_WEIGHT * magnetometer_angle)
-        
-        # Round the average to nearest 45° increment
-        num_increments = round(weighted_angle / 45.0)
+        num_increments, time_based_angle, magnetometer_angle, weighted_angle = \
+            self.estimate_turn(choice, elapsed, cumulative_angle)
         final_angle = num_increments * 45.0
+        self.last_turn = (elapsed, time_based_angle, magnetometer_angle, weighted_angle)
         
         # Data collection mode - print all measurements
         print("\nTurn Analysis:")
@@ -394,6 +431,7 @@ class Behaviors:
         print(f"Magnetometer reading: {magnetometer_angle:.1f}°")
         print(f"Weighted average: {weighted_angle:.1f}°")
         print(f"Rounded to: {final_angle:.1f}° ({num_increments} × 45°)")
+        self.mark(TURN, 1, num_increments, 1 if choice == "left" else -1)
             
         # Return both the number of 45-degree steps and the weighted average angle
         return num_increments, magnetometer_angle
@@ -434,6 +472,14 @@ class Behaviors:
 
 
 if __name__ == "__main__":
+    # the hardware modules only when driving the robot, so Behaviors can be
+    # imported without pigpio (replay.py runs it on recorded readings)
+    import pigpio
+    from DriveSystem import DriveSystem
+    from Sense import LineSensor
+    from AngleSensor import AngleSensor
+    from proximitysensor import ProximitySensor
+
     io = pigpio.pi()
     if not io.connected:
         print("Could not connect to pigpio daemon.")
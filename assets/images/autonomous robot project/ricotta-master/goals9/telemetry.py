@@ -0,0 +1,197 @@
+#
+#   telemetry.py
+#
+#   Full-rate recording of what the sensors read and what the motors were
+#   told, for looking at a run afterwards instead of scrolling prints.
+#
+#   The sensors and the drive system take an optional recorder and call
+#   record() on every read or command, and Behaviors marks where each
+#   behavior started and ended (so replay.py can run them again). A record
+#   is a fixed 32 bytes,
+#
+#       seq     uint32      running record number
+#       t       float64     time.time() of the read or command
+#       channel uint8       LINE, ANGLE, PROXIMITY, DRIVE or MARK
+#       values  float32 x4  LINE: L, M, R    ANGLE: degrees
+#                           PROXIMITY: left, middle, right cm (NaN = no echo yet)
+#                           DRIVE: left level, right level, mode number
+#                                  (index into DriveSystem.modes, -1 = pwm/stop)
+#                           MARK: behavior (FOLLOW, PULL, TURN), 0 = started
+#                                 or 1 = ended, outcome, turn direction
+#                                 (1 = left, -1 = right)
+#
+#   The outcome of a behavior is FOLLOW: 1 = intersection, 2 = end; PULL:
+#   1 = street ahead, 0 = none; TURN: the 45 degree steps it counted.
+#
+#   packed straight into a preallocated ring buffer: no allocation, no
+#   lock, no waiting, about a microsecond. A background thread copies the
+#   new records out every flush_interval and appends them to the file as
+#   one chunk. Each record carries its seq, so the flush thread can tell a
+#   slot that has been claimed but not written yet (it stops there and
+#   picks it up next time) from one the writers have lapped because the
+#   flush thread fell a whole buffer behind (those records are counted as
+#   dropped rather than ever making a writer wait).
+#
+#   File layout, little-endian:
+#
+#       header      magic b"RTEL", format version, record size
+#       chunks      b"CHNK", record count, first and last t, the records
+#       index       one (offset, count, first t, last t) per chunk, then
+#                   the index offset and b"RIDX" (written on stop)
+#
+#   TelemetryReader seeks by time with the index, or rebuilds it by
+#   walking the chunk headers if the run ended without one.
+#
+import bisect
+import itertools
+import struct
+import threading
+import time
+
+import numpy as np
+
+LINE, ANGLE, PROXIMITY, DRIVE, MARK = 1, 2, 3, 4, 5
+CHANNELS = {LINE: "line", ANGLE: "angle", PROXIMITY: "proximity", DRIVE: "drive", MARK: "mark"}
+FOLLOW, PULL, TURN = 1, 2, 3
+BEHAVIORS = {FOLLOW: "follow", PULL: "pull", TURN: "turn"}
+
+MAGIC = b"RTEL"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+RECORD = struct.Struct("<IdB3x4f")
+CHUNK = struct.Struct("<4sIdd")
+INDEX_ENTRY = struct.Struct("<qIdd")
+FOOTER = struct.Struct("<q4s")
+RECORDS = np.dtype([('seq', '<u4'), ('t', '<f8'), ('channel', 'u1'), ('pad', 'V3'), ('values', '<f4', (4,))])
+
+
+class Recorder:
+    def __init__(self, path, capacity=1 << 16, flush_interval=0.25, clock=time.time):
+        self.path = path
+        self.clock = clock          # stamps the records
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.buffer = bytearray(capacity * RECORD.size)
+        # every slot starts out holding "the record a whole buffer before",
+        # so none of them looks written yet
+        for slot in range(capacity):
+            struct.pack_into("<I", self.buffer, slot * RECORD.size, (slot - capacity) & 0xFFFFFFFF)
+        self._claim = itertools.count()     # next() is atomic, so writers never share a slot
+        self.flushed = 0                    # seq of the next record to write out
+        self.dropped = 0
+        self.chunks = []                    # index entries
+        self._file = None
+        self._thread = None
+        self._running = False
+
+    def record(self, channel, a=0.0, b=0.0, c=0.0, d=0.0):
+        seq = next(self._claim)
+        RECORD.pack_into(self.buffer, (seq % self.capacity) * RECORD.size,
+                         seq & 0xFFFFFFFF, self.clock(), channel, a, b, c, d)
+
+    def start(self):
+        self._file = open(self.path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write out what's left, then the index."""
+        self._running = False
+        self._thread.join()
+        self._flush()
+        offset = self._file.tell()
+        for entry in self.chunks:
+            self._file.write(INDEX_ENTRY.pack(*entry))
+        self._file.write(FOOTER.pack(offset, b"RIDX"))
+        self._file.close()
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.flush_interval)
+            self._flush()
+
+    # the records written since the last flush, as one chunk
+    def _flush(self):
+        out = bytearray()
+        times = []
+        expected = self.flushed
+        size = RECORD.size
+        while True:
+            offset = (expected % self.capacity) * size
+            record = bytes(self.buffer[offset:offset + size])  # one copy, a writer can't tear it
+            seq = struct.unpack_from("<I", record)[0]
+            if seq != expected & 0xFFFFFFFF:
+                lapped = (seq - expected) & 0xFFFFFFFF
+                if lapped % self.capacity or lapped >= 1 << 31:
+                    break  # not written yet (or never): done for now
+                # overwritten by a record a whole buffer (or more) later
+                self.dropped += lapped
+                expected += lapped
+                continue
+            out += record
+            times.append(struct.unpack_from("<d", record, 4)[0])
+            expected += 1
+            if len(times) == self.capacity:
+                break
+        self.flushed = expected
+        if not times:
+            return
+        self.chunks.append((self._file.tell(), len(times), times[0], times[-1]))
+        self._file.write(CHUNK.pack(b"CHNK", len(times), times[0], times[-1]))
+        self._file.write(out)
+        self._file.flush()
+
+
+class TelemetryReader:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        magic, version, record_size = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a telemetry file")
+        if version > VERSION or record_size != RECORD.size:
+            raise ValueError(f"{path} is telemetry format version {version}, this code reads up to {VERSION}")
+        self.index = self._read_index()
+        self.starts = [entry[2] for entry in self.index]
+
+    def _read_index(self):
+        if len(self.data) >= HEADER.size + FOOTER.size:
+            offset, magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+            if magic == b"RIDX":
+                return list(INDEX_ENTRY.iter_unpack(self.data[offset:len(self.data) - FOOTER.size]))
+        # no index (the run didn't stop cleanly): walk the chunks
+        index = []
+        offset = HEADER.size
+        while offset + CHUNK.size <= len(self.data):
+            magic, count, first, last = CHUNK.unpack_from(self.data, offset)
+            if magic != b"CHNK" or offset + CHUNK.size + count * RECORD.size > len(self.data):
+                break
+            index.append((offset, count, first, last))
+            offset += CHUNK.size + count * RECORD.size
+        return index
+
+    def _chunk(self, entry):
+        offset, count = entry[0] + CHUNK.size, entry[1]
+        return np.frombuffer(self.data, dtype=RECORDS, count=count, offset=offset)
+
+    def read(self, start=None, end=None, channel=None):
+        """Records with start <= t <= end (on the given channel), oldest first."""
+        first = 0 if start is None else max(0, bisect.bisect_right(self.starts, start) - 1)
+        parts = []
+        for entry in self.index[first:]:
+            if end is not None and entry[2] > end:
+                break
+            if start is not None and entry[3] < start:
+                continue
+            parts.append(self._chunk(entry))
+        records = np.concatenate(parts) if parts else np.zeros(0, dtype=RECORDS)
+        keep = np.ones(len(records), dtype=bool)
+        if start is not None:
+            keep &= records['t'] >= start
+        if end is not None:
+            keep &= records['t'] <= end
+        if channel is not None:
+            keep &= records['channel'] == channel
+        return records[keep]
@@ -0,0 +1,58 @@
+#
+#   test_route_to.py
+#
+#   Map.route_to when the goal can't be reached: no route, and the robot's
+#   cost says so rather than holding what the last field left there.
+#
+#   Run:   python3 -m pytest test_route_to.py
+#
+import os
+import tempfile
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from MapBuilding import Map, STATUS
+from gridmap import GridMap
+from tiledmap import TiledMap
+
+
+# (0, 0) - (1, 0) - (2, 0), and (5, 5) on its own
+def make_map(map):
+    for x in range(2):
+        map.getintersection(x, 0)
+        map.getintersection(x + 1, 0)
+        map.setstreet(x, 0, 6, STATUS.CONNECTED)
+        map.setstreet(x + 1, 0, 2, STATUS.CONNECTED)
+    map.getintersection(5, 5)
+    map.set_pose(0, 0, 6)
+    return map
+
+
+def check_no_route(map):
+    assert map.route_to(2, 0) == [6, 6]
+    assert map.get_cost(0, 0) == 2
+    assert map.route_to(5, 5) == []
+    assert map.goal == (5, 5)
+    assert map.get_cost(0, 0) == float('inf')
+    assert map.intersections[(0, 0)].direction is None
+
+
+def test_no_route_map():
+    check_no_route(make_map(Map()))
+
+
+def test_no_route_gridmap():
+    check_no_route(make_map(GridMap()))
+
+
+def test_no_route_tiledmap():
+    with tempfile.TemporaryDirectory() as directory:
+        check_no_route(TiledMap.from_map(make_map(Map()), directory))
+
+
+def test_blocked_after_routing():
+    map = make_map(Map())
+    assert map.route_to(2, 0) == [6, 6]
+    map.set_blocked(1, 0, 6, True)
+    assert map.route_to(2, 0) == []
+    assert map.get_cost(0, 0) == float('inf')
@@ -0,0 +1,501 @@
+#
+#   tiledmap.py
+#
+#   A tiled, lazily loaded storage backend for Map, for street grids too
+#   big to hold in memory at once. The intersections are split into square
+#   tiles of tile_size x tile_size, each tile in its own file, and the rest
+#   of the map goes in a header file next to them:
+#
+#       <directory>/tile_<tx>_<ty>.tile     intersections with
+#                                           x // tile_size == tx and
+#                                           y // tile_size == ty
+#       <directory>/map.tiles               everything else, see flush()
+#
+#   Like the map files of mapfile.py these are fixed headers followed by
+#   little-endian arrays, so opening a tile directory, whoever wrote it,
+#   runs no code. A tile file is TILE_HEADER (magic b"RTIL", format
+#   version, header size, row count) followed by ROWS: each intersection's
+#   x, y, the STATUS value of its 8 street ends and its blocked flags as
+#   bits (bit h = street h is blocked).
+#
+#   map.intersections is a TileTable, a dict look-alike that loads a tile
+#   the first time anything in it is looked up, so every planner (dijkstra,
+#   route_to, nearest_frontier, reach_costs, ...) just pages in the tiles
+#   its search crosses. Loaded tiles are kept in least recently used order,
+#   and whenever loading one takes the count past max_tiles the least
+#   recently used are dropped, in the middle of a search too, so a search
+#   across the whole map still only holds max_tiles tiles. Never dropped
+#   are the tiles around the robot (pinned as it moves) and the few used
+#   last, whose intersections a write may be holding.
+#
+#   A search may also be holding intersections of a tile that gets
+#   dropped, and read the tile back in as new objects later. That's safe
+#   because the cost/direction field isn't kept on the intersections: each
+#   tile has a TileField, two flat arrays (9 bytes an intersection) that
+#   stay in memory when the tile goes, and an intersection's cost and
+#   direction read and write its tile's field. The streets don't change
+#   during a search, so an old object reads the same ones as a new one.
+#   Writes go through the map (see TiledMap._live), which always writes to
+#   the intersection the table holds.
+#
+#   A changed tile that's dropped is written back by a background thread:
+#   the control thread only copies the statuses and flags into ROWS, and
+#   until the write lands a lookup reads the tile from that copy instead
+#   of the file. A tile is only marked changed when a street status or a
+#   blocked flag in it actually changes.
+#
+#   The rest of the map (pose, goal, frontier, status counts, blockages,
+#   street times, journal) is small and stays in memory. flush() writes the
+#   changed tiles out and saves that part, less the journal, in map.tiles:
+#   as with a map file only the journal's sequence number is kept (the
+#   write-ahead log of maplog.py is where the events go). Opening the
+#   directory reads map.tiles and no tiles at all.
+#
+#   Whole-map operations (rebuild_frontier, reachable's connectivity
+#   index, merging, GridMap.from_map) still work but page every tile
+#   through, as do incremental repair and the background alternatives,
+#   which is why those are off on a tiled map.
+#
+import itertools
+import os
+import queue
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from MapBuilding import Map, Intersection, STATUS
+from mapfile import BELIEFS_HEADER, TIMES, BLOCKAGES, EVIDENCE, street_tables, restore_street_tables
+
+STATUSES = list(STATUS)         # index by value: STATUSES[2] is UNEXPLORED
+
+TILE_MAGIC = b"RTIL"
+TILE_VERSION = 1
+TILE_HEADER = struct.Struct("<4sHHI")
+ROWS = np.dtype([('x', '<i4'), ('y', '<i4'), ('status', 'i1', (8,)), ('blocked', 'u1')])
+
+# map.tiles: HEADER (magic b"RTMP", format version, header size, tile size,
+# tiles kept in memory, journal sequence number, pose, goal, street time
+# settings, table sizes) then mapfile.BELIEFS_HEADER, followed by the
+# tables: TILES (intersections per tile), the STATUS_COUNTS, the learned
+# times, blockages and evidence of mapfile.py, and the FRONTIER
+MAGIC = b"RTMP"
+VERSION = 1
+HEADER_FILE = "map.tiles"
+HEADER = struct.Struct("<4sHHIIqiiiB3xiiddB3xIIII")
+TILES = np.dtype([('tx', '<i4'), ('ty', '<i4'), ('count', '<i4')])
+STATUS_COUNTS = np.dtype('<i8')
+FRONTIER = np.dtype([('x', '<i4'), ('y', '<i4')])
+
+
+def write_tile(path, rows):
+    """Write a ROWS array to the tile file at path, atomically."""
+    with open(path + ".tmp", 'wb') as f:
+        f.write(TILE_HEADER.pack(TILE_MAGIC, TILE_VERSION, TILE_HEADER.size, len(rows)))
+        f.write(rows.tobytes())
+    os.replace(path + ".tmp", path)
+
+
+def read_tile(path):
+    """The ROWS array in the tile file at path."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < TILE_HEADER.size or not data.startswith(TILE_MAGIC):
+        raise ValueError(f"{path} is not a tile file")
+    _, version, header_size, count = TILE_HEADER.unpack_from(data)
+    if version > TILE_VERSION:
+        raise ValueError(f"{path} is tile format version {version}, this code reads up to {TILE_VERSION}")
+    rows = np.frombuffer(data, dtype=ROWS, count=count, offset=header_size)
+    if count and (rows['status'].min() < 0 or rows['status'].max() >= len(STATUSES)):
+        raise ValueError(f"{path} has street statuses that aren't STATUS values")
+    return rows
+
+
+class TileField:
+    """The cost/direction field of one tile, tile_size x tile_size entries."""
+    __slots__ = ('size', 'costs', 'directions')
+
+    def __init__(self, size):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.costs = array('d', [float('inf')]) * (self.size * self.size)
+        self.directions = array('b', [-1]) * (self.size * self.size)
+
+
+class TileIntersection(Intersection):
+    """An Intersection of a tile, its cost and direction kept in the tile's field."""
+
+    def __init__(self, x, y, field, streets, blocked):
+        self.x = x
+        self.y = y
+        self.streets = streets
+        self.blocked = blocked
+        self.field = field
+        self.index = (x % field.size) * field.size + y % field.size
+
+    @property
+    def cost(self):
+        return self.field.costs[self.index]
+
+    @cost.setter
+    def cost(self, value):
+        self.field.costs[self.index] = value
+
+    @property
+    def direction(self):
+        direction = self.field.directions[self.index]
+        return None if direction < 0 else direction
+
+    @direction.setter
+    def direction(self, value):
+        self.field.directions[self.index] = -1 if value is None else value
+
+
+class TileTable:
+    """Dict look-alike for TiledMap.intersections, loading tiles on demand."""
+    RECENT = 4              # tiles used last, never dropped
+
+    def __init__(self, directory, size, max_tiles=64):
+        self.directory = os.path.abspath(directory)
+        self.size = size
+        self.max_tiles = max_tiles
+        self.pinned = set()             # tiles around the robot, never dropped
+        self.counts = {}                # tile -> intersections in it, loaded or not
+        self.resident = OrderedDict()   # tile -> {key: TileIntersection}, least recently used first
+        self.fields = {}                # tile -> TileField, loaded or not
+        self.dirty = set()              # loaded tiles changed since they were last written
+        self.loads = 0
+        self.evictions = 0
+        # tiles waiting to be written by the writer thread, as written
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._writes = None
+
+    # only where the tiles are and what's in them, the tiles themselves are
+    # written out first
+    def __getstate__(self):
+        self.flush()
+        return {'directory': self.directory, 'size': self.size, 'counts': self.counts}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'], state['size'])
+        self.counts = state['counts']
+
+    def tile_of(self, key):
+        return (key[0] // self.size, key[1] // self.size)
+
+    def path(self, tile):
+        return os.path.join(self.directory, f"tile_{tile[0]}_{tile[1]}.tile")
+
+    def _field(self, tile):
+        field = self.fields.get(tile)
+        if field is None:
+            field = self.fields[tile] = TileField(self.size)
+        return field
+
+    # the tile's dict of intersections, loading it if need be, or None if
+    # the tile has nothing in it
+    def _tile(self, tile):
+        inters = self.resident.get(tile)
+        if inters is not None:
+            self.resident.move_to_end(tile)
+            return inters
+        if tile not in self.counts:
+            return None
+        with self._lock:
+            rows = self._pending.get(tile)
+        if rows is None:
+            rows = read_tile(self.path(tile))
+        field = self._field(tile)
+        inters = {(x, y): TileIntersection(x, y, field, [STATUSES[v] for v in streets],
+                                           [bool(bits >> h & 1) for h in range(8)])
+                  for x, y, streets, bits in rows.tolist()}
+        self.resident[tile] = inters
+        self.loads += 1
+        self._make_room()
+        return inters
+
+    def _make_room(self):
+        excess = len(self.resident) - self.max_tiles
+        if excess <= 0:
+            return
+        for tile in list(itertools.islice(self.resident, len(self.resident) - self.RECENT)):
+            if tile in self.pinned:
+                continue
+            inters = self.resident.pop(tile)
+            if tile in self.dirty:
+                self._write_behind(tile, inters)
+            self.evictions += 1
+            excess -= 1
+            if excess == 0:
+                break
+
+    # hand a copy of the tile to the writer thread
+    def _write_behind(self, tile, inters):
+        rows = np.array([(x, y, [status.value for status in inter.streets],
+                          sum(1 << h for h, blocked in enumerate(inter.blocked) if blocked))
+                         for (x, y), inter in inters.items()], dtype=ROWS)
+        with self._lock:
+            self._pending[tile] = rows
+        self.dirty.discard(tile)
+        if self._writes is None:
+            self._writes = queue.Queue()
+            threading.Thread(target=self._writer, name="tile writer", daemon=True).start()
+        self._writes.put((tile, rows))
+
+    def _writer(self):
+        while True:
+            tile, rows = self._writes.get()
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                write_tile(self.path(tile), rows)
+                with self._lock:
+                    # unless it changed again and a newer copy is waiting
+                    if self._pending.get(tile) is rows:
+                        del self._pending[tile]
+            except OSError as e:
+                # the copy stays pending, so the tile is still read from it
+                print(f"Writing tile {tile} failed: {e}")
+            finally:
+                self._writes.task_done()
+
+    def drain(self):
+        """Wait for the tiles being written in the background."""
+        if self._writes is not None:
+            self._writes.join()
+
+    def flush(self):
+        """Write every changed tile to disk."""
+        for tile in list(self.dirty):
+            self._write_behind(tile, self.resident[tile])
+        self.drain()
+
+    def reset_field(self):
+        """Clear the cost/direction field of every tile."""
+        for tile in list(self.fields):
+            if tile in self.resident:
+                self.fields[tile].reset()
+            else:
+                del self.fields[tile]   # a fresh one comes with the tile
+
+    def __contains__(self, key):
+        inters = self._tile(self.tile_of(key))
+        return inters is not None and key in inters
+
+    def __getitem__(self, key):
+        inters = self._tile(self.tile_of(key))
+        if inters is None:
+            raise KeyError(key)
+        return inters[key]
+
+    def get(self, key, default=None):
+        inters = self._tile(self.tile_of(key))
+        if inters is None:
+            return default
+        return inters.get(key, default)
+
+    def __setitem__(self, key, inter):
+        tile = self.tile_of(key)
+        inters = self._tile(tile)
+        if inters is None:
+            inters = self.resident[tile] = {}
+            self.counts[tile] = 0
+        if key not in inters:
+            self.counts[tile] += 1
+        inters[key] = TileIntersection(key[0], key[1], self._field(tile), inter.streets, inter.blocked)
+        self.dirty.add(tile)
+        self._make_room()
+
+    def __delitem__(self, key):
+        tile = self.tile_of(key)
+        inters = self._tile(tile)
+        if inters is None:
+            raise KeyError(key)
+        del inters[key]
+        self.counts[tile] -= 1
+        self.dirty.add(tile)
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    # whole-map iteration pages every tile through, one at a time
+    def keys(self):
+        return [key for tile in sorted(self.counts) for key in self._tile(tile)]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def values(self):
+        for tile in sorted(self.counts):
+            yield from list(self._tile(tile).values())
+
+    def items(self):
+        for tile in sorted(self.counts):
+            yield from list(self._tile(tile).items())
+
+
+class TiledMap(Map):
+    TILE_SIZE = 16
+    MAX_TILES = 64          # tiles kept in memory, 16k intersections at the default size
+    VIEW_RADIUS = 6         # show() draws this far around the robot
+
+    def __init__(self, directory, tile_size=TILE_SIZE, max_tiles=MAX_TILES):
+        super().__init__()
+        self.intersections = TileTable(directory, tile_size, max_tiles)
+        self.max_tiles = max_tiles
+        self._pin()
+
+    # the frontier and status counts were saved along with everything else,
+    # rebuilding them would read every tile
+    def __setstate__(self, state):
+        Map.__init__(self)
+        self.__dict__.update(state)
+        self._parent = None
+        self._size = None
+        self.intersections.max_tiles = self.max_tiles
+        self._pin()
+
+    @classmethod
+    def open(cls, directory):
+        """Load the tiled map saved in directory by flush()."""
+        path = os.path.join(directory, HEADER_FILE)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < HEADER.size + BELIEFS_HEADER.size or not data.startswith(MAGIC):
+            raise ValueError(f"{directory} does not hold a tiled map")
+        (_, version, header_size, tile_size, max_tiles, seq, x, y, heading, has_goal, gx, gy,
+         street_time, blockage_ttl, time_weighted, n_tiles, n_times, n_blockages,
+         n_frontier) = HEADER.unpack_from(data)
+        if version > VERSION:
+            raise ValueError(f"{path} is tiled map format version {version}, this code reads up to {VERSION}")
+        has_beliefs, n_evidence, confidence, prior = BELIEFS_HEADER.unpack_from(data, HEADER.size)
+
+        tables = []
+        offset = header_size
+        for dtype, count in ((TILES, n_tiles), (STATUS_COUNTS, len(STATUSES)), (TIMES, n_times),
+                             (BLOCKAGES, n_blockages), (EVIDENCE, n_evidence), (FRONTIER, n_frontier)):
+            tables.append(np.frombuffer(data, dtype=dtype, count=count, offset=offset))
+            offset += tables[-1].nbytes
+        tiles, status_counts, times, blockages, evidence, frontier = tables
+
+        tiled = cls(directory, tile_size, max_tiles)
+        tiled.intersections.counts = {(tx, ty): count for tx, ty, count in tiles.tolist()}
+        tiled.status_counts = dict(zip(STATUSES, status_counts.tolist()))
+        restore_street_tables(tiled, times, blockages, evidence,
+                              (confidence, prior) if has_beliefs else None)
+        tiled.frontier = set(frontier.tolist())
+        tiled.x, tiled.y, tiled.heading = x, y, heading
+        tiled.goal = (gx, gy) if has_goal else None
+        tiled.street_time = street_time
+        tiled.blockage_ttl = blockage_ttl
+        tiled.time_weighted = bool(time_weighted)
+        tiled.journal_base = seq
+        tiled._pin()
+        return tiled
+
+    def flush(self):
+        """Write the changed tiles and the rest of the map to the tile directory."""
+        table = self.intersections
+        table.flush()
+        goal = self.goal if self.goal is not None else (0, 0)
+        tiles = np.array([(tx, ty, count) for (tx, ty), count in table.counts.items()], dtype=TILES)
+        status_counts = np.array([self.status_counts[status] for status in STATUSES], dtype=STATUS_COUNTS)
+        times, blockages, evidence = street_tables(self)
+        frontier = np.array(sorted(self.frontier), dtype=FRONTIER)
+        confidence, prior = self.beliefs.settings() if self.beliefs is not None else (0.0, 0.0)
+        header = HEADER.pack(MAGIC, VERSION, HEADER.size + BELIEFS_HEADER.size, table.size, self.max_tiles,
+                             self.seq, self.x, self.y, self.heading, self.goal is not None, goal[0], goal[1],
+                             self.street_time, self.blockage_ttl, self.time_weighted,
+                             len(tiles), len(times), len(blockages), len(frontier))
+        header += BELIEFS_HEADER.pack(self.beliefs is not None, len(evidence), confidence, prior)
+
+        path = os.path.join(table.directory, HEADER_FILE)
+        os.makedirs(table.directory, exist_ok=True)
+        with open(path + ".tmp", 'wb') as f:
+            f.write(header)
+            for array in (tiles, status_counts, times, blockages, evidence, frontier):
+                f.write(array.tobytes())
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def from_map(cls, map, directory, tile_size=TILE_SIZE, max_tiles=MAX_TILES):
+        """Copy a Map (pose, goal, streets, blocks, timings) into a TiledMap in directory."""
+        tiled = cls(directory, tile_size, max_tiles)
+        for (x, y), inter in map.intersections.items():
+            copy = Intersection(x, y)
+            copy.streets = list(inter.streets)
+            copy.blocked = list(inter.blocked)
+            tiled.intersections[(x, y)] = copy
+        tiled.x, tiled.y, tiled.heading = map.pose()
+        tiled.goal = map.goal
+        tiled.street_times = dict(map.street_times)
+        tiled.street_time = map.street_time
+        tiled.time_weighted = map.time_weighted
+        tiled.blockages = dict(map.blockages)
+        tiled._expiry = list(map._expiry)
+        tiled.blockage_ttl = map.blockage_ttl
+        tiled.journal_base = map.seq
+        tiled._pin()
+        tiled.rebuild_frontier()
+        return tiled
+
+    # the tiles around the robot stay in memory
+    def _pin(self):
+        tx, ty = self.intersections.tile_of((self.x, self.y))
+        self.intersections.pinned = {(tx + dx, ty + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)}
+
+    def _move(self, x, y, heading):
+        super()._move(x, y, heading)
+        self._pin()
+
+    # the intersection the table holds for inter: inter may be from before
+    # its tile was last dropped (a whole-map loop like clear_blockages), and
+    # a write to that would be lost
+    def _live(self, inter):
+        return self.intersections[(inter.x, inter.y)]
+
+    # the tile of inter needs writing out again
+    def _changed(self, inter):
+        table = self.intersections
+        table.dirty.add(table.tile_of((inter.x, inter.y)))
+
+    def _write_street(self, inter, heading, status):
+        inter = self._live(inter)
+        if inter.streets[heading] != status:
+            self._changed(inter)
+        super()._write_street(inter, heading, status)
+
+    # the tile holds the flag, the blockage times are in memory
+    def _write_blocked(self, inter, heading, value, ttl=None):
+        inter = self._live(inter)
+        if inter.blocked[heading] != value:
+            self._changed(inter)
+        super()._write_blocked(inter, heading, value, ttl)
+
+    def _reset_field(self):
+        self.intersections.reset_field()
+
+    def set_incremental(self, enabled=True):
+        # repair starts from the old field of the whole map
+        super().set_incremental(False)
+        if enabled:
+            print("Tiled map: incremental planning is off, every replan is a fresh search.")
+
+    def plan_alternatives(self, k=4, restart=False):
+        # the alternatives search runs on a snapshot of the whole map, so
+        # on a tiled map a blockage just means replanning
+        return
+
+    def _view(self):
+        r = self.VIEW_RADIUS
+        shown = []
+        for x in range(self.x - r, self.x + r + 1):
+            for y in range(self.y - r, self.y + r + 1):
+                inter = self.intersections.get((x, y))
+                if inter is not None:
+                    shown.append(((x, y), inter))
+        return (self.x - r - 1, self.x + r + 1, self.y - r - 1, self.y + r + 1), shown
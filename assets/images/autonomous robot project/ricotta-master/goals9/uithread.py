@@ -6,11 +6,17 @@ class Shared:
         self.command = None
         self.goal = None
         self.pose = None
+        self.tour = None
+        self.filename = None  # for save
         self.lock = threading.Lock()
 
         self.robotx = 0
         self.roboty = 0
         self.robotheading = 0
+
+        # headings from the robot to its goal (copied from the map's route
+        # cache each loop, for ROS)
+        self.route = []
         
         # For ROS callbacks (fetch and dicts)
         self.inter_prize_distance_dict = None
@@ -26,7 +32,7 @@ class Shared:
 
 
 def ui(shared):
-    print("UI thread started. Enter commands: explore, goal, pause, step, resume, left, right, straight, save, load, pose, show, clear, fetch, quit")
+    print("UI thread started. Enter commands: explore, goal, tour, pause, step, resume, undo, left, right, straight, save, load, merge, pose, show, clear, fetch, turns, timed, sweep, beliefs, tiles, routes, quit")
     while True:
         cmd = input("Command: ").strip().lower()
         with shared.lock:
@@ -38,6 +44,16 @@ def ui(shared):
                     shared.command = "goal"
                 except ValueError:
                     print("Invalid goal coordinates.")
+            elif cmd == "tour":
+                try:
+                    text = input("Enter stops as x,y separated by spaces: ")
+                    stops = [tuple(int(v) for v in stop.split(",")) for stop in text.split()]
+                    if not stops or any(len(stop) != 2 for stop in stops):
+                        raise ValueError
+                    shared.tour = stops
+                    shared.command = "tour"
+                except ValueError:
+                    print("Invalid stops.")
             elif cmd == "pose":
                 try:
                     x = int(input("x: "))
@@ -48,7 +64,14 @@ def ui(shared):
                     print("Pose set.")
                 except ValueError:
                     print("Invalid pose.")
-            elif cmd in ["explore", "pause", "step", "resume", "left", "right", "straight", "save", "load", "show", "clear", "fetch", "quit"]:
+            elif cmd == "save":
+                name = input("Filename to save: ").strip()
+                if name:
+                    shared.filename = name
+                    shared.command = "save"
+                else:
+                    print("No filename given.")
+            elif cmd in ["explore", "pause", "step", "resume", "undo", "left", "right", "straight", "load", "merge", "show", "clear", "fetch", "turns", "timed", "sweep", "beliefs", "tiles", "routes", "quit"]:
                 shared.command = cmd
                 if cmd == "quit":
                     break